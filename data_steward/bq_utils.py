@@ -5,11 +5,12 @@ import os
 import socket
 import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from io import open
 
 # Third party imports
-from googleapiclient.discovery import build
+import numpy
 from googleapiclient.errors import HttpError
 
 # Project imports
@@ -18,6 +19,8 @@ import common
 import gcs_utils
 import resources
 from constants import bq_utils as bq_consts
+from utils import api_client_pool
+from utils.job_watcher import JobWatcher
 
 socket.setdefaulttimeout(bq_consts.SOCKET_TIMEOUT)
 
@@ -130,7 +133,12 @@ def get_validation_results_dataset_id():
 
 
 def create_service():
-    return build('bigquery', 'v2', cache={})
+    """
+    Get the shared BigQuery service from the process-wide client pool
+
+    :return: BigQuery v2 discovery service
+    """
+    return api_client_pool.get_service('bigquery', 'v2')
 
 
 def get_table_id(hpo_id, table_name):
@@ -348,37 +356,132 @@ def job_status_errored(job_id):
     return is_errored, error_message
 
 
-def sleeper(poll_interval):
+def get_jobs_states(job_ids):
     """
-    Calls time.sleep, useful for testing purposes
-    :param poll_interval:
-    :return:
+    Get the states of many jobs using batched HTTP requests
+
+    :param job_ids: ids of the jobs to look up
+    :return: dict mapping each job id to its state (e.g. 'RUNNING', 'DONE')
+        or to the HttpError raised while getting it
+    :raises: the error raised while sending a batch, once retries are spent
     """
-    time.sleep(poll_interval)
-    return
+    bq_service = create_service()
+    app_id = app_identity.get_application_id()
+    states = {}
 
+    def callback(request_id, response, exception):
+        if exception is not None:
+            states[request_id] = exception
+        else:
+            states[request_id] = response['status']['state']
 
-def wait_on_jobs(job_ids, retry_count=bq_consts.BQ_DEFAULT_RETRY_COUNT):
+    job_ids = list(job_ids)
+    for start in range(0, len(job_ids), bq_consts.JOB_STATUS_BATCH_SIZE):
+        batch = bq_service.new_batch_http_request(callback=callback)
+        for job_id in job_ids[start:start + bq_consts.JOB_STATUS_BATCH_SIZE]:
+            batch.add(bq_service.jobs().get(projectId=app_id,
+                                            jobId=job_id,
+                                            fields='status/state'),
+                      request_id=job_id)
+        _execute_batch(batch)
+    return states
+
+
+def _execute_batch(batch, num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT):
     """
-    Implements exponential backoff to wait for jobs to complete
-    :param job_ids: list of job_id strings
+    Send a batch HTTP request, retrying it on transient errors
+
+    BatchHttpRequest.execute does not accept `num_retries` like single
+    requests do, so the whole batch is resent with exponential backoff.
+
+    :param batch: the BatchHttpRequest to send
+    :param num_retries: maximum number of times the batch is resent
+    """
+    for attempt in range(num_retries + 1):
+        try:
+            return batch.execute()
+        except Exception as exc:
+            if attempt == num_retries or not is_transient_error(exc):
+                raise
+            logging.warning(f'Retrying batch request after error: {exc}')
+            time.sleep(min(2**attempt, bq_consts.MAX_RETRY_SLEEP))
+
+
+def is_transient_error(exc):
+    """
+    Check if a request which raised an error may succeed when retried
+
+    :param exc: the exception raised by the request
+    :return: True for rate limit, server and connection errors
+    """
+    if isinstance(exc, HttpError):
+        return exc.resp.status in bq_consts.TRANSIENT_HTTP_STATUSES
+    return isinstance(exc, OSError)
+
+
+_job_watcher = None
+
+
+def get_job_watcher():
+    """
+    Get the process-wide watcher used to wait on BigQuery jobs
+
+    :return: a JobWatcher polling job states with `get_jobs_states`
+    """
+    global _job_watcher
+    if _job_watcher is None:
+        # resolve get_jobs_states on every poll rather than binding it once
+        _job_watcher = JobWatcher(
+            lambda job_ids: get_jobs_states(job_ids),
+            min_poll_interval=bq_consts.MIN_POLL_INTERVAL,
+            max_poll_interval=bq_consts.MAX_POLL_INTERVAL,
+            backoff_fraction=bq_consts.POLL_BACKOFF_FRACTION,
+            is_transient=is_transient_error,
+            max_failures=bq_consts.BQ_DEFAULT_RETRY_COUNT)
+    return _job_watcher
+
+
+def _max_wait_seconds(retry_count):
+    """
+    Total time spent waiting by `retry_count` polls with doubling intervals
+
     :param retry_count: max number of iterations for exponent
-    :return: list of jobs that failed to complete or empty list if all completed
+    :return: number of seconds
     """
-    job_ids = list(job_ids)
-    poll_interval = 1
+    total, poll_interval = 0, 1
     for _ in range(retry_count):
-        logging.info(
-            f'Waiting {poll_interval} seconds for completion of job(s): {job_ids}'
-        )
-        sleeper(poll_interval)
-        job_ids = [job_id for job_id in job_ids if not job_status_done(job_id)]
-        if not job_ids:
-            return job_ids
+        total += poll_interval
         if poll_interval < bq_consts.MAX_POLL_INTERVAL:
             poll_interval *= 2
-    logging.info(f'Job(s) {job_ids} failed to complete')
-    return job_ids
+    return total
+
+
+def wait_on_jobs(job_ids,
+                 retry_count=bq_consts.BQ_DEFAULT_RETRY_COUNT,
+                 timeout=None):
+    """
+    Wait for jobs to complete
+
+    Job states are polled together with the jobs awaited by other threads.
+    Each caller returns as soon as its own jobs are done.
+
+    :param job_ids: list of job_id strings
+    :param retry_count: bounds the wait to the time taken by this many polls
+        with an interval starting at 1 second and doubling each time
+    :param timeout: maximum number of seconds to wait (overrides retry_count)
+    :return: list of jobs that failed to complete or empty list if all completed
+    """
+    job_ids = list(job_ids)
+    if not job_ids:
+        return job_ids
+    if timeout is None:
+        timeout = _max_wait_seconds(retry_count)
+    logging.info(f'Waiting up to {timeout} seconds for completion of job(s): '
+                 f'{job_ids}')
+    incomplete_jobs = get_job_watcher().wait(job_ids, timeout)
+    if incomplete_jobs:
+        logging.info(f'Job(s) {incomplete_jobs} failed to complete')
+    return incomplete_jobs
 
 
 def get_job_details(job_id):
@@ -601,33 +704,110 @@ def get_dataset_id_from_obj(dataset_obj):
     return dataset_obj['id'].split(':')[-1]
 
 
-def large_response_to_rowlist(query_response):
+def iter_query_pages(query_response, prefetch=True):
     """
-    Convert a query response to a list of dictionary objects
+    Iterate over the pages of a query result
 
-    This automatically uses the pageToken feature to iterate through a
-    large result set.  Use cautiously.
+    While a page is being consumed the next one is requested in the background.
 
-    :param query_response: the query response object to iterate
-    :return: list of dictionaries
+    :param query_response: the query response object (first page)
+    :param prefetch: if True, fetch the next page while the current page is used
+    :return: generator of query result pages
     """
+    page_token = query_response.get(bq_consts.PAGE_TOKEN)
+    if not page_token:
+        yield query_response
+        return
+
     bq_service = create_service()
     app_id = app_identity.get_application_id()
-
-    page_token = query_response.get(bq_consts.PAGE_TOKEN)
     job_ref = query_response.get(bq_consts.JOB_REFERENCE)
     job_id = job_ref.get(bq_consts.JOB_ID)
 
-    result_list = response2rows(query_response)
-    while page_token:
-        next_grouping = bq_service.jobs() \
-            .getQueryResults(projectId=app_id, jobId=job_id, pageToken=page_token) \
+    def get_page(token):
+        return bq_service.jobs() \
+            .getQueryResults(projectId=app_id, jobId=job_id, pageToken=token) \
             .execute(num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
-        page_token = next_grouping.get(bq_consts.PAGE_TOKEN)
-        intermediate_rows = response2rows(next_grouping)
-        result_list.extend(intermediate_rows)
 
-    return result_list
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page = query_response
+        while page is not None:
+            page_token = page.get(bq_consts.PAGE_TOKEN)
+            next_page = None
+            if page_token and executor:
+                next_page = executor.submit(get_page, page_token)
+            yield page
+            if not page_token:
+                page = None
+            elif next_page:
+                page = next_page.result()
+            else:
+                page = get_page(page_token)
+    finally:
+        if executor:
+            executor.shutdown(wait=False)
+
+
+def iter_query_rows(query_response, prefetch=True):
+    """
+    Iterate over the rows of a query result as dictionary objects
+
+    Unlike `large_response_to_rowlist` only one or two pages are held in
+    memory at a time.
+
+    :param query_response: the query response object to iterate
+    :param prefetch: if True, fetch the next page while the current page is used
+    :return: generator of dict
+    """
+    decode = None
+    for page in iter_query_pages(query_response, prefetch):
+        rows = page.get(bq_consts.ROWS, [])
+        if rows and decode is None:
+            decode = compile_row_decoder(
+                page[bq_consts.SCHEMA][bq_consts.FIELDS])
+        for row in rows:
+            yield decode(row)
+
+
+def iter_query_batches(query_response,
+                       column_format=bq_consts.LIST_COLUMNS,
+                       prefetch=True):
+    """
+    Iterate over the pages of a query result as column-oriented batches
+
+    :param query_response: the query response object to iterate
+    :param column_format: `list` to get each column as a list or `numpy` to
+        get each column as a numpy array
+    :param prefetch: if True, fetch the next page while the current page is used
+    :return: generator of dict mapping column names to the column values
+    """
+    if column_format not in bq_consts.COLUMN_FORMATS:
+        raise ValueError(f'{column_format} is not a valid column format. '
+                         f'Choose one of {bq_consts.COLUMN_FORMATS}.')
+    decode = None
+    for page in iter_query_pages(query_response, prefetch):
+        rows = page.get(bq_consts.ROWS, [])
+        if not rows:
+            continue
+        if decode is None:
+            decode = compile_column_decoder(
+                page[bq_consts.SCHEMA][bq_consts.FIELDS], column_format)
+        yield decode(rows)
+
+
+def large_response_to_rowlist(query_response):
+    """
+    Convert a query response to a list of dictionary objects
+
+    This automatically uses the pageToken feature to iterate through a
+    large result set.  Use cautiously; `iter_query_rows` avoids holding the
+    whole result in memory.
+
+    :param query_response: the query response object to iterate
+    :return: list of dictionaries
+    """
+    return list(iter_query_rows(query_response))
 
 
 def response2rows(r):
@@ -638,76 +818,121 @@ def response2rows(r):
     :return: list of dict
     """
     rows = r.get(bq_consts.ROWS, [])
-    schema = r.get(bq_consts.SCHEMA, {bq_consts.FIELDS: None})[bq_consts.FIELDS]
-    return [_transform_row(row, schema) for row in rows]
+    if not rows:
+        return []
+    decode = compile_row_decoder(r[bq_consts.SCHEMA][bq_consts.FIELDS])
+    return [decode(row) for row in rows]
 
 
-def _recurse_on_row(col_dict, nested_value):
-    """
-    Apply the schema specified by the given dict to the nested value by recursing on it.
+def _to_bool(value):
+    return value in ('True', 'true', 'TRUE')
+
 
-        :param col_dict: the schema to apply to the nested value.
-        :param nested_value: A value nested in a BigQuery row.
-        :returns: Union[dict, list] objects from applied schema.
-        """
+_SCALAR_CONVERTERS = {
+    'INTEGER': int,
+    'FLOAT': float,
+    'BOOLEAN': _to_bool,
+    'TIMESTAMP': float
+}
+"""Casts applied to the string values of the API, keyed by column type.
+Values of other types are returned as is."""
 
-    row_value = None
+_NUMPY_DTYPES = {'INTEGER': 'int64', 'FLOAT': 'float64', 'TIMESTAMP': 'float64'}
 
-    # Multiple nested records
-    if col_dict['mode'] == 'REPEATED' and isinstance(nested_value, list):
-        row_value = [
-            _transform_row(record['v'], col_dict['fields'])
-            for record in nested_value
-        ]
 
-    # A single nested record
+def _compile_converter(field):
+    """
+    Build the callable which converts the API value of one column
+
+    :param field: schema field dict with keys name, type, mode (and fields)
+    :return: a callable accepting a non-null value, or None if the value is
+        used as is
+    """
+    if field['type'] == 'RECORD':
+        convert = compile_row_decoder(field['fields'])
     else:
-        row_value = _transform_row(nested_value, col_dict['fields'])
+        convert = _SCALAR_CONVERTERS.get(field['type'])
 
-    return row_value
+    if field.get('mode') != 'REPEATED':
+        return convert
+    if convert is None:
+        return lambda values: [item['v'] for item in values]
+    return lambda values: [convert(item['v']) for item in values]
 
 
-def _transform_row(row, schema):
+def _compile_columns(schema):
     """
-    Apply the given schema to the given BigQuery data row. Adapted from https://goo.gl/dWszQJ.
+    Pair each column of a schema with its position and converter
 
-    :param row: A single BigQuery row to transform
-    :param schema: The BigQuery table schema to apply to the row, specifically
-        the list of field dicts.
-    :returns: Row as a dict
+    :param schema: the list of field dicts of a query result or table
+    :return: tuple of (index, name, converter) tuples
     """
+    return tuple((index, field['name'], _compile_converter(field))
+                 for index, field in enumerate(schema))
 
-    log = {}
 
-    # Match each schema column with its associated row value
-    for index, col_dict in enumerate(schema):
-        col_name = col_dict['name']
-        row_value = row['f'][index]['v']
-
-        if row_value is None:
-            log[col_name] = None
-            continue
+def compile_row_decoder(schema):
+    """
+    Compile a schema into a function converting rows to dict
 
-        # Recurse on nested records
-        if col_dict['type'] == 'RECORD':
-            row_value = _recurse_on_row(col_dict, row_value)
+    The type of each column is resolved once here instead of for every row.
+    Nested RECORD and REPEATED columns are supported.
 
-        # Otherwise just cast the value
-        elif col_dict['type'] == 'INTEGER':
-            row_value = int(row_value)
+    :param schema: the list of field dicts of a query result or table
+    :return: a function accepting a BigQuery data row (`{'f': [...]}`) and
+        returning the row as a dict
+    """
+    columns = _compile_columns(schema)
 
-        elif col_dict['type'] == 'FLOAT':
-            row_value = float(row_value)
+    def decode(row):
+        cells = row['f']
+        result = {}
+        for index, name, convert in columns:
+            value = cells[index]['v']
+            if value is not None and convert is not None:
+                value = convert(value)
+            result[name] = value
+        return result
 
-        elif col_dict['type'] == 'BOOLEAN':
-            row_value = row_value in ('True', 'true', 'TRUE')
+    return decode
 
-        elif col_dict['type'] == 'TIMESTAMP':
-            row_value = float(row_value)
 
-        log[col_name] = row_value
+def compile_column_decoder(schema, column_format=bq_consts.LIST_COLUMNS):
+    """
+    Compile a schema into a function converting rows to columns
+
+    :param schema: the list of field dicts of a query result or table
+    :param column_format: `list` or `numpy`.  INTEGER, FLOAT and TIMESTAMP
+        columns without nulls become typed numpy arrays; other columns become
+        object arrays.
+    :return: a function accepting a list of BigQuery data rows and returning
+        a dict mapping column names to their values
+    """
+    columns = _compile_columns(schema)
+    dtypes = {
+        field['name']:
+            _NUMPY_DTYPES.get(field['type'])
+            if field.get('mode') != 'REPEATED' else None for field in schema
+    }
 
-    return log
+    def decode(rows):
+        batch = {}
+        for index, name, convert in columns:
+            values = [row['f'][index]['v'] for row in rows]
+            if convert is not None:
+                values = [
+                    None if value is None else convert(value)
+                    for value in values
+                ]
+            if column_format == bq_consts.NUMPY_COLUMNS:
+                dtype = dtypes[name]
+                if dtype is None or None in values:
+                    dtype = object
+                values = numpy.array(values, dtype=dtype)
+            batch[name] = values
+        return batch
+
+    return decode
 
 
 def list_all_table_ids(dataset_id=None):
@@ -9,6 +9,7 @@ import logging
 
 # Project imports
 import cdr_cleaner.clean_cdr_engine as clean_engine
+import cdr_cleaner.run_profiler as run_profiler
 import cdr_cleaner.cleaning_rules.backfill_pmi_skip_codes as back_fill_pmi_skip
 import cdr_cleaner.cleaning_rules.clean_years as clean_years
 import cdr_cleaner.cleaning_rules.domain_alignment as domain_alignment
@@ -62,10 +63,6 @@ from cdr_cleaner.cleaning_rules.ppi_branching import PpiBranching
 from cdr_cleaner.cleaning_rules.rdr_observation_source_concept_id_suppression import (
     ObservationSourceConceptIDRowSuppression)
 from cdr_cleaner.cleaning_rules.remove_multiple_race_ethnicity_answers import RemoveMultipleRaceEthnicityAnswersQueries
-from cdr_cleaner.cleaning_rules.deid.motor_vehicle_accident_suppression import \
-    MotorVehicleAccidentSuppression
-from cdr_cleaner.cleaning_rules.deid.birth_information_suppression import \
-    BirthInformationSuppression
 from cdr_cleaner.cleaning_rules.replace_standard_id_in_domain_tables import \
     ReplaceWithStandardConceptId
 from cdr_cleaner.cleaning_rules.repopulate_person_post_deid import RepopulatePersonPostDeid
@@ -76,17 +73,16 @@ from cdr_cleaner.cleaning_rules.temporal_consistency import TemporalConsistency
 from cdr_cleaner.cleaning_rules.valid_death_dates import ValidDeathDates
 from cdr_cleaner.cleaning_rules.negative_ages import NegativeAges
 from cdr_cleaner.cleaning_rules.deid.explicit_identifier_suppression import ExplicitIdentifierSuppression
-from cdr_cleaner.cleaning_rules.deid.geolocation_concept_suppression import GeoLocationConceptSuppression
+from cdr_cleaner.cleaning_rules.deid.unified_concept_suppression import UnifiedConceptSuppression
 from cdr_cleaner.cleaning_rules.null_person_birthdate import NullPersonBirthdate
 from cdr_cleaner.cleaning_rules.race_ethnicity_record_suppression import RaceEthnicityRecordSuppression
 from cdr_cleaner.cleaning_rules.table_suppression import TableSuppression
 from cdr_cleaner.cleaning_rules.deid.questionnaire_response_id_map import QRIDtoRID
 from cdr_cleaner.cleaning_rules.generalize_zip_codes import GeneralizeZipCodes
-from cdr_cleaner.cleaning_rules.free_text_survey_response_suppression import FreeTextSurveyResponseSuppression
-from cdr_cleaner.cleaning_rules.cancer_concept_suppression import CancerConceptSuppression
 from cdr_cleaner.cleaning_rules.identifying_field_suppression import IDFieldSuppression
 from cdr_cleaner.cleaning_rules.aggregate_zip_codes import AggregateZipCodes
 from cdr_cleaner.cleaning_rules.remove_extra_tables import RemoveExtraTables
+from utils import bq, sql_compiler
 from constants.cdr_cleaner import clean_cdr_engine as ce_consts
 from constants.cdr_cleaner.clean_cdr import DataStage
 
@@ -220,15 +216,10 @@ CONTROLLED_TIER_DEID_CLEANING_CLASSES = [
     (GeneralizeZipCodes,),  # Should run after any data remapping rules
     (RaceEthnicityRecordSuppression,
     ),  # Should run after any data remapping rules
-    (FreeTextSurveyResponseSuppression,
-    ),  # Should run after any data remapping rules
-    (MotorVehicleAccidentSuppression,),
+    (UnifiedConceptSuppression,),  # Should run after any data remapping rules
     (ExplicitIdentifierSuppression,),
-    (GeoLocationConceptSuppression,),
-    (BirthInformationSuppression,),
     (IDFieldSuppression,),  # Should run after any data remapping
     (GenerateSiteMappingsAndExtTables,),
-    (CancerConceptSuppression,),  # Should run after any data remapping rules
     (AggregateZipCodes,),
     (RemoveExtraTables,),  # Should be last cleaning rule to be run
     (CleanMappingExtTables,),  # should be one of the last cleaning rules run
@@ -299,6 +290,73 @@ def get_parser():
         type=DataStage,
         choices=list([s for s in DataStage if s is not DataStage.UNSPECIFIED]),
         help='Specify the dataset')
+    engine_parser.add_argument(
+        '-w',
+        '--max_workers',
+        dest='max_workers',
+        action='store',
+        type=int,
+        default=1,
+        help=('Number of rules and queries to run at the same time.  Rules '
+              'which do not use the same tables run concurrently.  Defaults '
+              f'to 1, suggested {ce_consts.MAX_WORKERS}'))
+    engine_parser.add_argument(
+        '--fuse_rewrites',
+        dest='fuse_rewrites',
+        action='store_true',
+        help=('Rewrite a table once for consecutive rules which each rewrite '
+              'it with a SELECT and set fusable_rewrite'))
+    engine_parser.add_argument(
+        '--fused_verify',
+        dest='verify_fused',
+        action='store_true',
+        help=('With --fuse_rewrites, check each fused rewrite against the '
+              'rules run one at a time'))
+    engine_parser.add_argument(
+        '--run_ledger',
+        dest='ledger_path',
+        action='store',
+        default=None,
+        help=('SQLite file recording the completed rules and queries, so a '
+              'failed run can be resumed'))
+    engine_parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        help='Resume the last unfinished run recorded in --run_ledger')
+    engine_parser.add_argument(
+        '--prune_empty',
+        dest='prune_empty',
+        action='store_true',
+        help=('Skip the queries of rules which change nothing because the '
+              'tables they clean are empty'))
+    engine_parser.add_argument(
+        '--dry_run',
+        dest='dry_run',
+        action='store_true',
+        help=('Dry run the queries of all rules to find errors and estimate '
+              'bytes processed without changing data'))
+    engine_parser.add_argument(
+        '--profile_csv',
+        dest='profile_csv',
+        action='store',
+        default=None,
+        help=('Csv file to write the slot-ms, bytes and rows of each query '
+              'to.  Compare two runs with cdr_cleaner.run_profiler'))
+    engine_parser.add_argument(
+        '--profile_table',
+        dest='profile_table',
+        action='store',
+        default=None,
+        help='Table in the sandbox dataset to append the query profiles to')
+    engine_parser.add_argument(
+        '--compile_only',
+        dest='compile_dir',
+        action='store',
+        default=None,
+        help=('Directory to write the SQL of all rules to, with a manifest of '
+              'hashes, without connecting to BigQuery.  The directory must be '
+              'empty or hold the output of an earlier run'))
     return engine_parser
 
 
@@ -393,6 +451,30 @@ def validate_custom_params(rules, **kwargs):
             f'Missing required custom parameter(s): {missing_param_rules}')
 
 
+def write_run_profile(args, jobs, skipped=None):
+    """
+    Write the profile of the jobs of a cleaning run
+
+    :param args: parsed arguments with the profile_csv and profile_table
+    :param jobs: list of the completed BigQuery jobs of the run
+    :param skipped: list of the queries the run skipped
+    """
+    profile = run_profiler.get_run_profile(jobs,
+                                           args.dataset_id,
+                                           args.sandbox_dataset_id,
+                                           skipped=skipped)
+    if args.profile_csv:
+        run_profiler.write_profile_csv(args.profile_csv, profile)
+        LOGGER.info(f'Wrote the profile of {len(jobs)} jobs to '
+                    f'{args.profile_csv}')
+    if args.profile_table:
+        client = bq.get_client(args.project_id)
+        run_profiler.load_profile_table(client, args.sandbox_dataset_id,
+                                        args.profile_table, profile)
+        LOGGER.info(f'Appended the profile of {len(jobs)} jobs to '
+                    f'{args.sandbox_dataset_id}.{args.profile_table}')
+
+
 def main(args=None):
     """
     :param args: list of all the arguments to apply the cleaning rules
@@ -414,14 +496,54 @@ def main(args=None):
             **kwargs)
         for query in query_list:
             LOGGER.info(query)
+    elif args.compile_dir:
+        clean_engine.add_console_logging(args.console_log)
+        compiled, errors = clean_engine.compile_rules(
+            project_id=args.project_id,
+            dataset_id=args.dataset_id,
+            sandbox_dataset_id=args.sandbox_dataset_id,
+            rules=rules,
+            table_namer=args.data_stage.value,
+            **kwargs)
+        manifest = sql_compiler.write_compiled_sql(args.compile_dir, compiled,
+                                                   errors)
+        # rules which could not be generated without BigQuery are only logged
+        failed = sql_compiler.log_manifest(args.compile_dir, manifest)
+        if failed:
+            raise RuntimeError(
+                f'Compiling found problems in {failed} statement(s)')
+    elif args.dry_run:
+        clean_engine.add_console_logging(args.console_log)
+        reports = clean_engine.dry_run_rules(
+            project_id=args.project_id,
+            dataset_id=args.dataset_id,
+            sandbox_dataset_id=args.sandbox_dataset_id,
+            rules=rules,
+            table_namer=args.data_stage.value,
+            **kwargs)
+        failed_rules = clean_engine.log_dry_run_reports(reports)
+        if failed_rules:
+            raise RuntimeError(
+                f'Dry run found errors in {failed_rules} cleaning rule(s)')
     else:
         clean_engine.add_console_logging(args.console_log)
-        clean_engine.clean_dataset(project_id=args.project_id,
-                                   dataset_id=args.dataset_id,
-                                   sandbox_dataset_id=args.sandbox_dataset_id,
-                                   rules=rules,
-                                   table_namer=args.data_stage.value,
-                                   **kwargs)
+        skipped = []
+        jobs = clean_engine.clean_dataset(
+            project_id=args.project_id,
+            dataset_id=args.dataset_id,
+            sandbox_dataset_id=args.sandbox_dataset_id,
+            rules=rules,
+            table_namer=args.data_stage.value,
+            max_workers=args.max_workers,
+            fuse_rewrites=args.fuse_rewrites,
+            verify_fused=args.verify_fused,
+            ledger_path=args.ledger_path,
+            resume=args.resume,
+            prune_empty=args.prune_empty,
+            skipped_queries=skipped,
+            **kwargs)
+        if args.profile_csv or args.profile_table:
+            write_run_profile(args, jobs, skipped)
 
 
 if __name__ == '__main__':
@@ -1,14 +1,18 @@
 # Python imports
 import inspect
 import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures import TimeoutError as TOError
 
 # Third party imports
 import google.cloud.bigquery as gbq
-from google.cloud.exceptions import GoogleCloudError
+from google.cloud.exceptions import GoogleCloudError, NotFound
 
 # Project imports
-from utils import bq
+from utils import bq, dag_executor
+from cdr_cleaner import run_ledger, table_counts
 from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
 from constants import bq_utils as bq_consts
 from constants.cdr_cleaner import clean_cdr as cdr_consts
@@ -16,6 +20,29 @@ from constants.cdr_cleaner import clean_cdr_engine as ce_consts
 
 LOGGER = logging.getLogger(__name__)
 
+# dotted names which may refer to a table, e.g. project.dataset.table
+TABLE_REF_PATTERN = re.compile(r'[\w-]+(?:\.[\w-]+)+')
+# the table written by a DML or DDL statement
+WRITE_TARGET_PATTERN = re.compile(
+    r'\b(?:UPDATE|DELETE(?:\s+FROM)?|INSERT(?:\s+INTO)?|MERGE(?:\s+INTO)?|'
+    r'TRUNCATE\s+TABLE|ALTER\s+TABLE|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|'
+    r'CREATE(?:\s+OR\s+REPLACE)?\s+TABLE(?:\s+IF\s+NOT\s+EXISTS)?)'
+    r'\s+([\w.-]+)', re.IGNORECASE)
+DYNAMIC_SQL_PATTERN = re.compile(r'\bEXECUTE\s+IMMEDIATE\b', re.IGNORECASE)
+SELECT_PATTERN = re.compile(r'\(?\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+# a table created from a query, e.g. for sandboxing rows
+CREATE_TABLE_AS_PATTERN = re.compile(
+    r'(CREATE\s+(?:OR\s+REPLACE\s+)?TABLE\s+[\w.`-]+\s+AS)\s+(.*)',
+    re.IGNORECASE | re.DOTALL)
+METADATA_TABLES = ['__TABLES__', 'INFORMATION_SCHEMA']
+# stands for every table in a dataset
+ALL_TABLES = '*'
+# the single table an UPDATE or DELETE statement changes
+DML_TARGET_PATTERN = re.compile(
+    r'\s*(?:UPDATE|DELETE(?:\s+FROM)?)\s+([\w.`-]+)', re.IGNORECASE)
+MISSING_TABLE_PATTERN = re.compile(
+    r'Not found: Table ([\w-]+)[:.]([\w-]+)\.([\w$-]+)')
+
 
 def add_console_logging(add_handler=True):
     """
@@ -44,20 +71,84 @@ def clean_dataset(project_id,
                   sandbox_dataset_id,
                   rules,
                   table_namer='',
+                  max_workers=1,
+                  fuse_rewrites=False,
+                  verify_fused=False,
+                  ledger_path=None,
+                  resume=False,
+                  prune_empty=False,
+                  skipped_queries=None,
                   **kwargs):
     """
     Run the assigned cleaning rules and return list of BQ job objects
 
+    With max_workers above one, rules and their queries that do not touch
+    the same tables run concurrently.  See run_rules_in_parallel.  With
+    fuse_rewrites, consecutive rules rewriting the same table do so in one
+    query.  See run_rules_fused.  With ledger_path, progress is recorded so
+    a failed run can be resumed.  See run_rules_with_ledger.  With
+    prune_empty, queries which change nothing because their tables are empty
+    are skipped.  See get_skip_reason.
+
     :param project_id: identifies the project
     :param dataset_id: identifies the dataset to clean
     :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
     :param rules: a list of cleaning rule objects/functions as tuples
     :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param max_workers: maximum number of rules and of queries to run at the
+        same time.  Rules run one at a time, in order, by default.
+    :param fuse_rewrites: if True, fuse the table rewrites of consecutive rules
+    :param verify_fused: if True, compare each fused rewrite to the output of
+        the rules' own queries instead of applying it
+    :param ledger_path: path of a SQLite file recording the run's progress
+    :param resume: if True, resume the last unfinished run in the ledger
+    :param prune_empty: if True, skip queries whose tables are empty
+    :param skipped_queries: list a record of each skipped query is appended
+        to, with the rule, query_no and reason
     :param kwargs: keyword arguments a cleaning rule may require
     :return all_jobs: List of BigQuery job objects
+    :raises ValueError: if fuse_rewrites is combined with max_workers above
+        one, or the ledger or prune_empty with either of them, or resume has
+        no ledger
     """
+    if resume and not ledger_path:
+        raise ValueError('A ledger_path is needed to resume a run')
+    if ledger_path and (fuse_rewrites or max_workers > 1):
+        raise ValueError('The run ledger records rules run one at a time, '
+                         'set max_workers to 1 and do not fuse rewrites')
+    if prune_empty and (ledger_path or fuse_rewrites or max_workers > 1):
+        raise ValueError('Pruning empty tables runs rules one at a time, '
+                         'set max_workers to 1 without a ledger or fusing')
+
     # Set up client
     client = bq.get_client(project_id=project_id)
+    # counts cached by an earlier run may be out of date
+    table_counts.clear()
+
+    if ledger_path:
+        return run_rules_with_ledger(client, project_id, dataset_id,
+                                     sandbox_dataset_id, rules, table_namer,
+                                     ledger_path, resume, **kwargs)
+
+    if fuse_rewrites:
+        if max_workers > 1:
+            raise ValueError('Fused rewrites run one rule at a time, '
+                             'set max_workers to 1 to fuse rewrites')
+        return run_rules_fused(client, project_id, dataset_id,
+                               sandbox_dataset_id, rules, table_namer,
+                               verify_fused, **kwargs)
+
+    if max_workers > 1:
+        return run_rules_in_parallel(client, project_id, dataset_id,
+                                     sandbox_dataset_id, rules, table_namer,
+                                     max_workers, **kwargs)
+
+    table_stats = None
+    if prune_empty:
+        table_stats = table_counts.get_table_stats(client, dataset_id)
+        written_tables = set()
+        if skipped_queries is None:
+            skipped_queries = []
 
     all_jobs = []
     for rule_index, rule in enumerate(rules):
@@ -71,7 +162,12 @@ def clean_dataset(project_id,
             f"{rule_index+1}/{len(rules)}")
         setup_function(client)
         query_list = query_function()
-        jobs = run_queries(client, query_list, rule_info)
+        if table_stats is None:
+            jobs = run_queries(client, query_list, rule_info)
+        else:
+            jobs = run_pruned_queries(client, dataset_id, query_list, rule_info,
+                                      table_stats, written_tables,
+                                      skipped_queries)
         LOGGER.info(
             f"For clean rule {rule_info[cdr_consts.MODULE_NAME]}, {len(jobs)} jobs "
             f"were run successfully for {len(query_list)} queries")
@@ -79,6 +175,1028 @@ def clean_dataset(project_id,
     return all_jobs
 
 
+def _to_table_name(ref):
+    """
+    Normalize a dotted reference to 'dataset.table'
+
+    References to dataset metadata (__TABLES__, INFORMATION_SCHEMA) become
+    'dataset.*' since they change with every table in the dataset.
+
+    :param ref: dotted reference found in a query, e.g. project.dataset.table
+    :return: normalized table name or None if ref cannot name a table
+    """
+    parts = ref.split('.')
+    for index, part in enumerate(parts):
+        if part.upper() in METADATA_TABLES:
+            return f'{parts[index - 1]}.{ALL_TABLES}' if index else None
+    if len(parts) not in (2, 3):
+        return None
+    return '.'.join(parts[-2:])
+
+
+def get_query_tables(query_dict):
+    """
+    Get the tables a query spec reads and writes
+
+    Table names are 'dataset.table', where a table of '*' stands for every
+    table in the dataset.  The reads are over-reported, e.g. alias.column
+    references are included, which never makes two queries look independent
+    when they are not.
+
+    :param query_dict: dictionary for the query
+    :return: tuple of the set of tables read and the set of tables written,
+        the written tables are None if they cannot be determined
+    """
+    query = query_dict.get(cdr_consts.QUERY, '').replace('`', '')
+    reads = {_to_table_name(ref) for ref in TABLE_REF_PATTERN.findall(query)}
+    reads.discard(None)
+    writes = {
+        _to_table_name(target) for target in WRITE_TARGET_PATTERN.findall(query)
+    }
+    writes.discard(None)
+
+    destination_dataset = query_dict.get(cdr_consts.DESTINATION_DATASET)
+    destination_table = query_dict.get(cdr_consts.DESTINATION_TABLE)
+    if destination_table:
+        writes.add(f'{destination_dataset}.{destination_table}')
+    if DYNAMIC_SQL_PATTERN.search(query):
+        # the statement text is only known at run time
+        if not destination_dataset:
+            return reads, None
+        writes.add(f'{destination_dataset}.{ALL_TABLES}')
+    return reads, writes
+
+
+def _tables_overlap(left, right):
+    """
+    Determine if two sets of table names share a table
+
+    :param left: set of 'dataset.table' names
+    :param right: set of 'dataset.table' names
+    :return: True if a table is in both sets, False otherwise
+    """
+    if left & right:
+        return True
+    left_all = {t.split('.')[0] for t in left if t.endswith(f'.{ALL_TABLES}')}
+    right_all = {t.split('.')[0] for t in right if t.endswith(f'.{ALL_TABLES}')}
+    return any(t.split('.')[0] in right_all for t in left) or any(
+        t.split('.')[0] in left_all for t in right)
+
+
+def _conflicts(earlier, later):
+    """
+    Determine if running two units of work concurrently could change results
+
+    :param earlier: tuple of tables read and tables written, or None if unknown
+    :param later: tuple of tables read and tables written, or None if unknown
+    :return: True if later must wait for earlier, False otherwise
+    """
+    if earlier is None or later is None:
+        return True
+    earlier_reads, earlier_writes = earlier
+    later_reads, later_writes = later
+    if earlier_writes is None or later_writes is None:
+        return True
+    return (_tables_overlap(earlier_writes, later_reads | later_writes) or
+            _tables_overlap(later_writes, earlier_reads))
+
+
+def get_conflict_dependencies(table_usages):
+    """
+    Order units of work which use the same tables
+
+    A unit waits for every earlier unit which writes a table it reads or
+    writes, or reads a table it writes.  A unit whose tables are unknown waits
+    for, and is waited on by, every other unit.
+
+    :param table_usages: list of (reads, writes) tuples, or None if unknown,
+        in the order the units would run serially
+    :return: dict mapping the index of a unit to the indexes it depends on
+    """
+    dependencies = dict()
+    for later_index, later in enumerate(table_usages):
+        dependencies[later_index] = {
+            earlier_index
+            for earlier_index, earlier in enumerate(table_usages[:later_index])
+            if _conflicts(earlier, later)
+        }
+    return dependencies
+
+
+def _get_rule_tables(instance, dataset_id, query_list):
+    """
+    Get the tables a rule reads and writes from its declarations and queries
+
+    :param instance: the BaseCleaningRule instance or None for a rule function
+    :param dataset_id: identifies the dataset to clean
+    :param query_list: list of query_dicts generated by the rule
+    :return: tuple of tables read and tables written, or None if unknown
+    """
+    reads, writes = set(), set()
+    if instance is not None:
+        writes.update(
+            f'{dataset_id}.{table}' for table in instance.affected_tables or [])
+    for query_dict in query_list:
+        query_reads, query_writes = get_query_tables(query_dict)
+        if query_writes is None:
+            return None
+        reads.update(query_reads)
+        writes.update(query_writes)
+    return reads, writes
+
+
+def plan_rules(project_id, dataset_id, sandbox_dataset_id, rules, table_namer,
+               **kwargs):
+    """
+    Work out which rules must run before which
+
+    A rule depends on the earlier rules in its depends_on list and on the
+    earlier rules it shares tables with, see get_conflict_dependencies.  The
+    tables come from affected_tables and from the queries the rule generates
+    before it is set up.  Rules whose queries cannot be generated or parsed
+    yet, or that generate none, depend on and are depended on by every other
+    rule.
+
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param rules: a list of cleaning rule objects/functions as tuples
+    :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param kwargs: keyword arguments a cleaning rule may require
+    :return: tuple of the list of (query_function, setup_function, rule_info,
+        rule tables) for each rule and a dict mapping the index of a rule to
+        the indexes of the rules it depends on
+    """
+    planned_rules = []
+    for rule in rules:
+        clazz = rule[0]
+        query_function, setup_function, rule_info = infer_rule(
+            clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
+            **kwargs)
+        instance = getattr(query_function, '__self__', None)
+        try:
+            query_list = query_function()
+            rule_tables = _get_rule_tables(instance, dataset_id,
+                                           query_list) if query_list else None
+        except Exception as exp:
+            LOGGER.info(f'Running {rule_info[cdr_consts.MODULE_NAME]} on its '
+                        f'own, its queries cannot be planned: {exp}')
+            rule_tables = None
+        planned_rules.append(
+            (query_function, setup_function, rule_info, rule_tables))
+
+    dependencies = get_conflict_dependencies(
+        [rule_tables for _, _, _, rule_tables in planned_rules])
+    rule_classes = [rule[0] for rule in rules]
+    for rule_index, (query_function, _, _, _) in enumerate(planned_rules):
+        instance = getattr(query_function, '__self__', None)
+        for clazz in getattr(instance, 'depends_on_classes', []):
+            dependencies[rule_index].update(
+                index for index, rule_class in enumerate(rule_classes)
+                if rule_class is clazz and index < rule_index)
+    return planned_rules, dependencies
+
+
+def _within_rule_tables(rule_tables, query_list, shared_tables):
+    """
+    Determine if the queries of a rule stay within the tables it was planned with
+
+    :param rule_tables: tuple of tables read and tables written, or None if
+        the rule runs on its own
+    :param query_list: list of query_dicts generated by the rule
+    :param shared_tables: set of tables written by any of the planned rules.
+        Reads of other tables cannot conflict with other rules.
+    :return: True if the queries only use planned tables, False otherwise
+    """
+    if rule_tables is None:
+        return True
+    planned_reads, planned_writes = rule_tables
+    for query_dict in query_list:
+        reads, writes = get_query_tables(query_dict)
+        if writes is None:
+            return False
+        for table in writes:
+            if not _tables_overlap({table}, planned_writes):
+                return False
+        for table in reads:
+            if (_tables_overlap({table}, shared_tables) and not _tables_overlap(
+                {table}, planned_reads | planned_writes)):
+                return False
+    return True
+
+
+def run_rules_in_parallel(client, project_id, dataset_id, sandbox_dataset_id,
+                          rules, table_namer, max_workers, **kwargs):
+    """
+    Run cleaning rules concurrently where their tables allow it
+
+    Rules start once the rules they depend on have finished, see plan_rules.
+    Each rule is set up and generates its queries as in a serial run.  Its
+    queries then run concurrently where they do not share tables, with at
+    most max_workers BigQuery jobs running across all rules.  After a failure
+    no further rules or queries are started.
+
+    :param client: BigQuery client
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param rules: a list of cleaning rule objects/functions as tuples
+    :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param max_workers: maximum number of rules and of queries to run at the
+        same time
+    :param kwargs: keyword arguments a cleaning rule may require
+    :return all_jobs: List of BigQuery job objects, in rule order
+    :raises RuntimeError: if a rule generates queries on tables it was not
+        planned with
+    """
+    planned_rules, dependencies = plan_rules(project_id, dataset_id,
+                                             sandbox_dataset_id, rules,
+                                             table_namer, **kwargs)
+    shared_tables = set()
+    for _, _, _, rule_tables in planned_rules:
+        if rule_tables is not None:
+            shared_tables.update(rule_tables[1])
+    job_slots = threading.BoundedSemaphore(max_workers)
+
+    def run_rule(rule_index):
+        query_function, setup_function, rule_info, rule_tables = planned_rules[
+            rule_index]
+        LOGGER.info(
+            f"Applying cleaning rule {rule_info[cdr_consts.MODULE_NAME]} "
+            f"{rule_index+1}/{len(rules)}")
+        setup_function(client)
+        query_list = query_function()
+        if not _within_rule_tables(rule_tables, query_list, shared_tables):
+            raise RuntimeError(
+                f'Clean rule {rule_info[cdr_consts.MODULE_NAME]} generated '
+                f'queries on tables it was not planned with after setup, '
+                f'declare them in affected_tables or run this stage with '
+                f'max_workers=1')
+
+        def run_rule_query(query_no):
+            with job_slots:
+                return run_query(client, query_list[query_no], rule_info,
+                                 query_no, len(query_list))
+
+        query_dependencies = get_conflict_dependencies(
+            [get_query_tables(query_dict) for query_dict in query_list])
+        query_jobs = dag_executor.run_dag(list(range(len(query_list))),
+                                          query_dependencies, run_rule_query,
+                                          max_workers)
+        jobs = [query_jobs[query_no] for query_no in range(len(query_list))]
+        LOGGER.info(
+            f"For clean rule {rule_info[cdr_consts.MODULE_NAME]}, {len(jobs)} jobs "
+            f"were run successfully for {len(query_list)} queries")
+        return jobs
+
+    rule_jobs = dag_executor.run_dag(list(range(len(rules))), dependencies,
+                                     run_rule, max_workers)
+    return [
+        job for rule_index in range(len(rules)) for job in rule_jobs[rule_index]
+    ]
+
+
+def _split_select(query_dict):
+    """
+    Split a query spec storing the result of a single SELECT
+
+    :param query_dict: dictionary for the query
+    :return: tuple of the statement prefix, e.g. 'CREATE TABLE x AS', and
+        the SELECT, or None if the query is not a single standard SQL SELECT
+        with a destination table or CREATE TABLE AS SELECT statement
+    """
+    query = query_dict.get(cdr_consts.QUERY, '').strip().rstrip(';')
+    if query_dict.get(cdr_consts.LEGACY_SQL) or ';' in query:
+        return None
+    if query_dict.get(cdr_consts.DESTINATION_TABLE):
+        prefix, select = '', query
+    else:
+        create_table_as = CREATE_TABLE_AS_PATTERN.match(query)
+        if not create_table_as:
+            return None
+        prefix, select = create_table_as.groups()
+    if not SELECT_PATTERN.match(select):
+        return None
+    return prefix, select
+
+
+def get_rewritten_table(query_dict, dataset_id):
+    """
+    Get the table a query spec replaces with the result of a single SELECT
+
+    :param query_dict: dictionary for the query
+    :param dataset_id: identifies the dataset to clean
+    :return: the name of the rewritten table in dataset_id or None if the
+        query spec does not rewrite a table with a SELECT
+    """
+    if (_split_select(query_dict) is None or
+            query_dict.get(cdr_consts.DESTINATION_DATASET) != dataset_id or
+            query_dict.get(cdr_consts.DISPOSITION) != bq_consts.WRITE_TRUNCATE):
+        return None
+    return query_dict[cdr_consts.DESTINATION_TABLE]
+
+
+def _reads_table(query_dict, dataset_id, table):
+    """
+    Determine if a query spec may read a table
+
+    :param query_dict: dictionary for the query
+    :param dataset_id: dataset containing the table
+    :param table: name of the table
+    :return: True if the query may read the table, False otherwise
+    """
+    reads, _ = get_query_tables(query_dict)
+    return _tables_overlap(reads, {f'{dataset_id}.{table}'})
+
+
+def _replace_table_refs(query, dataset_id, table, replacement):
+    """
+    Replace the references to a table in a query
+
+    :param query: the query text
+    :param dataset_id: dataset containing the table
+    :param table: name of the table to replace
+    :param replacement: name to reference instead of the table
+    :return: the new query text or None if references to the table remain
+    """
+    table_ref_pattern = re.compile(rf'(?<![\w.`-])`?(?:[\w-]+\.)?'
+                                   rf'{re.escape(dataset_id)}\.'
+                                   rf'{re.escape(table)}`?(?![\w`-])')
+    query = table_ref_pattern.sub(replacement, query)
+    reads, _ = get_query_tables({cdr_consts.QUERY: query})
+    if _tables_overlap(reads, {f'{dataset_id}.{table}'}):
+        return None
+    return query
+
+
+def get_fusable_rewrite(query_list, dataset_id, sandbox_dataset_id, table=None):
+    """
+    Find the table rewrite of a rule which can be fused with other rules
+
+    A rule's rewrite can be fused if it is the rule's only query writing to
+    dataset_id and the rule's other queries only write sandbox tables.  The
+    other queries run before the fused rewrite, so those reading the table
+    after an earlier rewrite must be SELECTs or CREATE TABLE AS SELECTs, which
+    are then run on top of the earlier rewrites, see get_fused_queries.
+
+    :param query_list: list of query_dicts generated by the rule
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param table: the table rewritten by the rules before this one, or None
+        if this would be the first rule to fuse
+    :return: index of the rewrite in query_list or None if it cannot be fused
+    """
+    rewrite_nos = [
+        query_no for query_no, query_dict in enumerate(query_list)
+        if get_rewritten_table(query_dict, dataset_id) is not None
+    ]
+    if len(rewrite_nos) != 1:
+        return None
+    rewrite_no = rewrite_nos[0]
+    rewritten_table = get_rewritten_table(query_list[rewrite_no], dataset_id)
+    if table is not None and rewritten_table != table:
+        return None
+
+    for query_no, query_dict in enumerate(query_list):
+        if query_no == rewrite_no:
+            if table is None:
+                continue
+        else:
+            _, writes = get_query_tables(query_dict)
+            if writes is None or any(
+                    write.split('.')[0] != sandbox_dataset_id
+                    for write in writes):
+                return None
+            if table is None and query_no < rewrite_no:
+                continue
+        if (_reads_table(query_dict, dataset_id, rewritten_table) and
+            (_split_select(query_dict) is None or _replace_table_refs(
+                query_dict[cdr_consts.QUERY], dataset_id, rewritten_table,
+                ce_consts.FUSED_STEP.format(step_no=0)) is None)):
+            return None
+    return rewrite_no
+
+
+def fuse_rewrite_queries(dataset_id, table, rewrite_queries):
+    """
+    Compose the SELECTs rewriting a table into a single query
+
+    Each SELECT becomes a CTE reading the CTE before it in place of the table.
+
+    :param dataset_id: dataset containing the table
+    :param table: the rewritten table
+    :param rewrite_queries: list of the SELECT statements, in rule order
+    :return: the fused query text
+    """
+    step_queries = []
+    for step_no, query in enumerate(rewrite_queries):
+        if step_no:
+            query = _replace_table_refs(
+                query, dataset_id, table,
+                ce_consts.FUSED_STEP.format(step_no=step_no))
+        step_queries.append(query.strip().rstrip(';'))
+    return ce_consts.FUSED_REWRITE_QUERY.render(step_queries=step_queries)
+
+
+def get_fused_queries(dataset_id, group):
+    """
+    Get the queries of consecutive rules which rewrite the same table
+
+    The rules' other queries come first, in rule order, followed by a single
+    query applying all of the rewrites.  Other queries reading the table
+    after earlier rewrites read the fused SELECTs of those rewrites instead,
+    so they store the same rows as when the rules run one at a time.
+
+    :param dataset_id: identifies the dataset to clean
+    :param group: list of (rule_info, query_list, rewrite_no) for each rule
+    :return: tuple of the list of (rule_info, query_list) of the rules' other
+        queries and the fused rewrite query_dict
+    """
+    rewrite_queries = [
+        query_list[rewrite_no][cdr_consts.QUERY]
+        for _, query_list, rewrite_no in group
+    ]
+    _, first_query_list, first_rewrite_no = group[0]
+    first_rewrite = first_query_list[first_rewrite_no]
+    table = first_rewrite[cdr_consts.DESTINATION_TABLE]
+
+    other_queries = []
+    for step_no, (rule_info, query_list, rewrite_no) in enumerate(group):
+        rule_queries = []
+        for query_no, query_dict in enumerate(query_list):
+            if query_no == rewrite_no:
+                continue
+            steps_before = step_no + (query_no > rewrite_no)
+            if steps_before and _reads_table(query_dict, dataset_id, table):
+                prefix, select = _split_select(query_dict)
+                fused_select = fuse_rewrite_queries(
+                    dataset_id, table,
+                    rewrite_queries[:steps_before] + [select])
+                query_dict = dict(
+                    query_dict,
+                    **{cdr_consts.QUERY: f'{prefix}\n{fused_select}'.strip()})
+            rule_queries.append(query_dict)
+        other_queries.append((rule_info, rule_queries))
+
+    fused_rewrite = dict(
+        first_rewrite, **{
+            cdr_consts.QUERY:
+                fuse_rewrite_queries(dataset_id, table, rewrite_queries)
+        })
+    return other_queries, fused_rewrite
+
+
+def verify_fused_rewrite(client, dataset_id, sandbox_dataset_id, table,
+                         fused_table):
+    """
+    Compare a table rewritten rule by rule to the output of the fused rewrite
+
+    :param client: BigQuery client
+    :param dataset_id: dataset containing the table
+    :param sandbox_dataset_id: dataset containing the fused output
+    :param table: the table rewritten rule by rule
+    :param fused_table: the table holding the fused output
+    :raises RuntimeError: if the tables do not contain the same rows
+    """
+    diff_query = ce_consts.FUSED_DIFF_QUERY.render(
+        project=client.project,
+        dataset=dataset_id,
+        table=table,
+        sandbox_dataset=sandbox_dataset_id,
+        fused_table=fused_table)
+    diff_count = list(client.query(diff_query).result())[0].diff_count
+    if diff_count:
+        raise RuntimeError(
+            f'Fused rewrite of {dataset_id}.{table} differs from the rules run '
+            f'one at a time in {diff_count} row(s), see '
+            f'{sandbox_dataset_id}.{fused_table}')
+    LOGGER.info(f'Fused rewrite of {dataset_id}.{table} matches the rules run '
+                f'one at a time')
+
+
+def is_fusable_rule(clazz):
+    """
+    Check if a rule opted in to having its table rewrite fused
+
+    A rule is set up and generates its queries before the rules ahead of it
+    in its group have rewritten the table, so it must not read the dataset
+    while doing so.  Rules declare this with fusable_rewrite.
+
+    :param clazz: Clean rule class or old style clean function
+    :return: True if the rule's rewrite may be fused
+    """
+    return (inspect.isclass(clazz) and issubclass(clazz, BaseCleaningRule) and
+            clazz.fusable_rewrite)
+
+
+def run_fused_group(client,
+                    dataset_id,
+                    sandbox_dataset_id,
+                    group,
+                    verify=False):
+    """
+    Run the queries of consecutive rules which rewrite the same table
+
+    The queries from get_fused_queries run in order.  With verify, the fused
+    rewrite writes to a sandbox table instead, the rules' rewrites run one at
+    a time and the results are compared.
+
+    :param client: BigQuery client
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param group: list of (rule_info, query_list, rewrite_no) for each rule
+    :param verify: if True, compare the fused rewrite to the rules' rewrites
+    :return: list of BigQuery job objects
+    :raises RuntimeError: if verify finds the results differ
+    """
+    if len(group) == 1:
+        rule_info, query_list, _ = group[0]
+        return run_queries(client, query_list, rule_info)
+
+    other_queries, fused_rewrite = get_fused_queries(dataset_id, group)
+    first_rule_info = group[0][0]
+    table = fused_rewrite[cdr_consts.DESTINATION_TABLE]
+    LOGGER.info(f'Fusing the rewrites of {dataset_id}.{table} by '
+                f'{[info[cdr_consts.MODULE_NAME] for info, _, _ in group]}')
+
+    jobs = []
+    for rule_info, query_list in other_queries:
+        jobs.extend(run_queries(client, query_list, rule_info))
+
+    if not verify:
+        jobs.append(run_query(client, fused_rewrite, first_rule_info, 0, 1))
+        return jobs
+
+    fused_table = ce_consts.FUSED_CHECK_TABLE.format(table=table)
+    fused_check = dict(
+        fused_rewrite, **{
+            cdr_consts.DESTINATION_DATASET: sandbox_dataset_id,
+            cdr_consts.DESTINATION_TABLE: fused_table
+        })
+    jobs.append(run_query(client, fused_check, first_rule_info, 0, 1))
+    for rule_info, query_list, rewrite_no in group:
+        jobs.append(
+            run_query(client, query_list[rewrite_no], rule_info, rewrite_no,
+                      len(query_list)))
+    verify_fused_rewrite(client, dataset_id, sandbox_dataset_id, table,
+                         fused_table)
+    return jobs
+
+
+def run_rules_fused(client,
+                    project_id,
+                    dataset_id,
+                    sandbox_dataset_id,
+                    rules,
+                    table_namer,
+                    verify=False,
+                    **kwargs):
+    """
+    Run cleaning rules in order, fusing rewrites of the same table
+
+    Consecutive rules whose rewrites can be fused, see get_fusable_rewrite,
+    are run together by run_fused_group.  A rule is set up and generates its
+    queries before the rules ahead of it in its group have run, so only rules
+    which opted in, see is_fusable_rule, join a group.  The group is run
+    before any other rule is set up.
+
+    :param client: BigQuery client
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param rules: a list of cleaning rule objects/functions as tuples
+    :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param verify: if True, compare each fused rewrite to the rules' rewrites
+        instead of applying it
+    :param kwargs: keyword arguments a cleaning rule may require
+    :return all_jobs: List of BigQuery job objects
+    """
+    all_jobs = []
+    group = []
+    for rule_index, rule in enumerate(rules):
+        clazz = rule[0]
+        fusable = is_fusable_rule(clazz)
+        if group and not fusable:
+            # the rule may read the table the group rewrites
+            all_jobs.extend(
+                run_fused_group(client, dataset_id, sandbox_dataset_id, group,
+                                verify))
+            group = []
+
+        query_function, setup_function, rule_info = infer_rule(
+            clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
+            **kwargs)
+
+        LOGGER.info(
+            f"Applying cleaning rule {rule_info[cdr_consts.MODULE_NAME]} "
+            f"{rule_index+1}/{len(rules)}")
+        setup_function(client)
+        query_list = query_function()
+
+        if group:
+            _, group_queries, group_rewrite_no = group[0]
+            table = group_queries[group_rewrite_no][
+                cdr_consts.DESTINATION_TABLE]
+            rewrite_no = get_fusable_rewrite(query_list, dataset_id,
+                                             sandbox_dataset_id, table)
+            if rewrite_no is not None:
+                group.append((rule_info, query_list, rewrite_no))
+                continue
+            all_jobs.extend(
+                run_fused_group(client, dataset_id, sandbox_dataset_id, group,
+                                verify))
+            group = []
+
+        rewrite_no = get_fusable_rewrite(
+            query_list, dataset_id, sandbox_dataset_id) if fusable else None
+        if rewrite_no is not None:
+            group.append((rule_info, query_list, rewrite_no))
+        else:
+            all_jobs.extend(run_queries(client, query_list, rule_info))
+
+    if group:
+        all_jobs.extend(
+            run_fused_group(client, dataset_id, sandbox_dataset_id, group,
+                            verify))
+    return all_jobs
+
+
+def _get_modified(client, table_id):
+    """
+    Get the modification time of a table
+
+    :param client: BigQuery client
+    :param table_id: fully qualified table id
+    :return: ISO 8601 modification time or None if the table does not exist
+    """
+    try:
+        return client.get_table(table_id).modified.isoformat()
+    except NotFound:
+        return None
+
+
+def get_tables_modified(client, query_dict, recorded_tables):
+    """
+    Get the modification times of the tables a query may have changed
+
+    Queries writing unknown tables, e.g. dynamic SQL dropping tables, may
+    have changed any of the recorded tables, in their dataset if known.
+
+    :param client: BigQuery client
+    :param query_dict: dictionary for the query
+    :param recorded_tables: fully qualified ids of the tables recorded so far
+    :return: dict mapping fully qualified table ids to their ISO 8601
+        modification time, None if the table does not exist
+    """
+    _, writes = get_query_tables(query_dict)
+    if writes is None:
+        table_ids = set(recorded_tables)
+    else:
+        table_ids = set()
+        for table in writes:
+            dataset, table_name = table.split('.')
+            if table_name == ALL_TABLES:
+                table_ids.update(table_id for table_id in recorded_tables
+                                 if table_id.split('.')[1] == dataset)
+            else:
+                table_ids.add(f'{client.project}.{table}')
+    return {table_id: _get_modified(client, table_id) for table_id in table_ids}
+
+
+def check_tables_unchanged(client, ledger, run_id):
+    """
+    Check the tables written by a run were not modified since
+
+    :param client: BigQuery client
+    :param ledger: RunLedger recording the run
+    :param run_id: identifies the run
+    :raises RuntimeError: if a table was modified outside the run
+    """
+    changed = [
+        table_id
+        for table_id, modified in ledger.get_tables_modified(run_id).items()
+        if _get_modified(client, table_id) != modified
+    ]
+    if changed:
+        raise RuntimeError(
+            f'Cannot resume run {run_id} in {ledger.path}, tables {changed} '
+            f'were modified outside the run')
+
+
+def run_rules_with_ledger(client,
+                          project_id,
+                          dataset_id,
+                          sandbox_dataset_id,
+                          rules,
+                          table_namer,
+                          ledger_path,
+                          resume=False,
+                          **kwargs):
+    """
+    Run cleaning rules in order, recording each completed query and rule
+
+    A resumed run skips the rules which completed.  The first incomplete rule
+    is set up again and skips the queries which completed, after checking
+    they are unchanged.  A query which completed without being recorded
+    modified its tables after they were recorded, so the run refuses to
+    resume rather than apply it twice.
+
+    :param client: BigQuery client
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param rules: a list of cleaning rule objects/functions as tuples
+    :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param ledger_path: path of the SQLite file recording the run
+    :param resume: if True, resume the last unfinished run of the same rules
+        on the same dataset
+    :param kwargs: keyword arguments a cleaning rule may require
+    :return all_jobs: List of BigQuery job objects run by this call
+    :raises RuntimeError: if there is no run to resume, its tables were
+        modified outside the run or a rule generates different queries
+    """
+    rule_names = [
+        f'{rule[0].__module__}.{rule[0].__qualname__}' for rule in rules
+    ]
+    ledger = run_ledger.RunLedger(ledger_path)
+    try:
+        if resume:
+            run_id = ledger.get_unfinished_run(project_id, dataset_id,
+                                               sandbox_dataset_id, table_namer,
+                                               rule_names)
+            if run_id is None:
+                raise RuntimeError(
+                    f'No unfinished run of these rules on {dataset_id} in '
+                    f'{ledger_path} to resume')
+            check_tables_unchanged(client, ledger, run_id)
+            LOGGER.info(f'Resuming run {run_id} from {ledger_path}')
+        else:
+            run_id = ledger.start_run(project_id, dataset_id,
+                                      sandbox_dataset_id, table_namer,
+                                      rule_names)
+        completed_rules = ledger.get_completed_rules(run_id)
+
+        all_jobs = []
+        for rule_index, rule in enumerate(rules):
+            if rule_index in completed_rules:
+                LOGGER.info(f"Skipping completed cleaning rule "
+                            f"{rule_names[rule_index]} "
+                            f"{rule_index+1}/{len(rules)}")
+                continue
+            clazz = rule[0]
+            query_function, setup_function, rule_info = infer_rule(
+                clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
+                **kwargs)
+
+            LOGGER.info(
+                f"Applying cleaning rule {rule_info[cdr_consts.MODULE_NAME]} "
+                f"{rule_index+1}/{len(rules)}")
+            setup_function(client)
+            query_list = query_function()
+            completed_queries = ledger.get_completed_queries(run_id, rule_index)
+            for query_no, query_dict in enumerate(query_list):
+                query = query_dict.get(cdr_consts.QUERY, '')
+                if query_no in completed_queries:
+                    if completed_queries[query_no] != run_ledger.get_query_hash(
+                            query):
+                        raise RuntimeError(
+                            f'Query {query_no+1}/{len(query_list)} of '
+                            f'{rule_names[rule_index]} differs from the query '
+                            f'completed in run {run_id}')
+                    LOGGER.info(f'Skipping completed query '
+                                f'{query_no+1}/{len(query_list)} of '
+                                f'{rule_names[rule_index]}')
+                    continue
+                query_job = run_query(client, query_dict, rule_info, query_no,
+                                      len(query_list))
+                all_jobs.append(query_job)
+                ledger.record_query(
+                    run_id, rule_index, query_no, query, query_job.job_id,
+                    get_tables_modified(client, query_dict,
+                                        ledger.get_tables_modified(run_id)))
+            ledger.record_rule(run_id, rule_index, rule_names[rule_index])
+        ledger.finish_run(run_id)
+    finally:
+        ledger.close()
+    return all_jobs
+
+
+def dry_run_query(client, query_dict):
+    """
+    Validate a query and estimate its cost without running it
+
+    :param client: BigQuery client
+    :param query_dict: dictionary for the query
+    :return: the completed dry run QueryJob
+    """
+    job_config = gbq.job.QueryJobConfig()
+    job_config.dry_run = True
+    job_config.use_query_cache = False
+    job_config.use_legacy_sql = query_dict.get(cdr_consts.LEGACY_SQL, False)
+    return client.query(query=query_dict.get(cdr_consts.QUERY),
+                        job_config=job_config)
+
+
+def get_missing_table(exp):
+    """
+    Get the table a query failed to find
+
+    :param exp: exception raised by a dry run
+    :return: the missing table as 'dataset.table' or None if the query did
+        not fail because of a missing table
+    """
+    missing_table = MISSING_TABLE_PATTERN.search(str(exp))
+    if missing_table is None:
+        return None
+    _, dataset, table = missing_table.groups()
+    return f'{dataset}.{table}'
+
+
+def dry_run_rules(project_id,
+                  dataset_id,
+                  sandbox_dataset_id,
+                  rules,
+                  table_namer='',
+                  max_workers=ce_consts.MAX_WORKERS,
+                  **kwargs):
+    """
+    Validate and estimate the cost of a list of cleaning rules up front
+
+    Every rule generates its queries, without being set up, and all queries
+    are dry run concurrently.  No data is changed.  A query which cannot find
+    a table written by an earlier query, or a sandbox table which setup may
+    create, is reported as depending on it rather than as an error.
+
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param rules: a list of cleaning rule objects/functions as tuples
+    :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param max_workers: maximum number of dry runs at the same time
+    :param kwargs: keyword arguments a cleaning rule may require
+    :return: list of dicts reporting on each rule, with keys
+        rule: module name of the rule
+        query_count: number of queries the rule generated
+        bytes_processed: bytes the queries which could be dry run would read
+        referenced_tables: sorted list of the tables the queries read
+        errors: list of error messages
+        created_earlier: sorted list of the missing tables the queries need
+            from earlier queries or setup
+    """
+    client = bq.get_client(project_id=project_id)
+
+    reports = []
+    queries = []
+    for rule_index, rule in enumerate(rules):
+        clazz = rule[0]
+        report = {
+            ce_consts.DRY_RUN_RULE: getattr(clazz, '__name__', str(clazz)),
+            ce_consts.DRY_RUN_QUERY_COUNT: 0,
+            ce_consts.DRY_RUN_BYTES_PROCESSED: 0,
+            ce_consts.DRY_RUN_REFERENCED_TABLES: set(),
+            ce_consts.DRY_RUN_ERRORS: [],
+            ce_consts.DRY_RUN_CREATED_EARLIER: set()
+        }
+        reports.append(report)
+        try:
+            query_function, _, rule_info = infer_rule(clazz, project_id,
+                                                      dataset_id,
+                                                      sandbox_dataset_id,
+                                                      table_namer, **kwargs)
+            report[ce_consts.DRY_RUN_RULE] = rule_info[cdr_consts.MODULE_NAME]
+            query_list = query_function()
+        except Exception as exp:
+            report[ce_consts.DRY_RUN_ERRORS].append(
+                f'Queries could not be generated: {exp}')
+            continue
+        report[ce_consts.DRY_RUN_QUERY_COUNT] = len(query_list)
+        queries.extend((rule_index, query_dict) for query_dict in query_list)
+
+    def dry_run(query_dict):
+        try:
+            return dry_run_query(client, query_dict), None
+        except (GoogleCloudError, TOError) as exp:
+            return None, exp
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(
+            executor.map(dry_run, [query_dict for _, query_dict in queries]))
+
+    written_earlier = set()
+    for (rule_index, query_dict), (query_job, exp) in zip(queries, results):
+        report = reports[rule_index]
+        if query_job is not None:
+            report[ce_consts.DRY_RUN_BYTES_PROCESSED] += (
+                query_job.total_bytes_processed or 0)
+            report[ce_consts.DRY_RUN_REFERENCED_TABLES].update(
+                f'{table.dataset_id}.{table.table_id}'
+                for table in query_job.referenced_tables)
+        else:
+            missing_table = get_missing_table(exp)
+            if missing_table and (missing_table in written_earlier or
+                                  missing_table.split('.')[0]
+                                  == sandbox_dataset_id):
+                report[ce_consts.DRY_RUN_CREATED_EARLIER].add(missing_table)
+            else:
+                report[ce_consts.DRY_RUN_ERRORS].append(str(exp))
+        _, writes = get_query_tables(query_dict)
+        written_earlier.update(writes or [])
+
+    for report in reports:
+        for key in (ce_consts.DRY_RUN_REFERENCED_TABLES,
+                    ce_consts.DRY_RUN_CREATED_EARLIER):
+            report[key] = sorted(report[key])
+    return reports
+
+
+def log_dry_run_reports(reports):
+    """
+    Log the dry run report of each rule and the totals for all rules
+
+    :param reports: list of dicts returned by dry_run_rules
+    :return: number of rules with errors
+    """
+    failed_rules = 0
+    for rule_index, report in enumerate(reports):
+        message = (
+            f"Dry run of {report[ce_consts.DRY_RUN_RULE]} "
+            f"{rule_index+1}/{len(reports)}: "
+            f"{report[ce_consts.DRY_RUN_QUERY_COUNT]} queries, "
+            f"{report[ce_consts.DRY_RUN_BYTES_PROCESSED]} bytes processed, "
+            f"reads {report[ce_consts.DRY_RUN_REFERENCED_TABLES]}")
+        if report[ce_consts.DRY_RUN_CREATED_EARLIER]:
+            message += (f", needs {report[ce_consts.DRY_RUN_CREATED_EARLIER]} "
+                        f"from earlier queries or setup")
+        if report[ce_consts.DRY_RUN_ERRORS]:
+            failed_rules += 1
+            LOGGER.error(f"{message}, errors "
+                         f"{report[ce_consts.DRY_RUN_ERRORS]}")
+        else:
+            LOGGER.info(message)
+    total_bytes = sum(
+        report[ce_consts.DRY_RUN_BYTES_PROCESSED] for report in reports)
+    LOGGER.info(f'Dry run of {len(reports)} rules: {total_bytes} bytes '
+                f'processed, {failed_rules} rules with errors')
+    return failed_rules
+
+
+def get_compiled_sql(query_dict):
+    """
+    Get the text of a query spec, headed by its destination if it has one
+
+    :param query_dict: dictionary for the query
+    :return: the query text
+    """
+    query = query_dict.get(cdr_consts.QUERY, '')
+    if query_dict.get(cdr_consts.DESTINATION_TABLE) is None:
+        return query
+    disposition = query_dict.get(cdr_consts.DISPOSITION, bq_consts.WRITE_EMPTY)
+    return (f'-- destination: '
+            f'{query_dict.get(cdr_consts.DESTINATION_DATASET)}.'
+            f'{query_dict[cdr_consts.DESTINATION_TABLE]} {disposition}\n'
+            f'{query}')
+
+
+def compile_rules(project_id,
+                  dataset_id,
+                  sandbox_dataset_id,
+                  rules,
+                  table_namer='',
+                  **kwargs):
+    """
+    Generate the queries of a list of cleaning rules without BigQuery
+
+    No client is created and rules are not set up, so a rule which needs to
+    look at the dataset to generate its queries is reported as an error.
+
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param rules: a list of cleaning rule objects/functions as tuples
+    :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param kwargs: keyword arguments a cleaning rule may require
+    :return: tuple of a list of (name, sql) tuples, in run order, and a list
+        of (name, message) tuples for the rules which failed
+    """
+    compiled = []
+    errors = []
+    for rule in rules:
+        clazz = rule[0]
+        name = getattr(clazz, '__name__', str(clazz))
+        try:
+            query_function, _, rule_info = infer_rule(clazz, project_id,
+                                                      dataset_id,
+                                                      sandbox_dataset_id,
+                                                      table_namer, **kwargs)
+            name = get_rule_label(rule_info[cdr_consts.MODULE_NAME])
+            compiled.extend(
+                (f'{name}_{query_no}', get_compiled_sql(query_dict))
+                for query_no, query_dict in enumerate(query_function()))
+        except Exception as exp:
+            errors.append((name, f'Queries could not be generated: {exp}'))
+    return compiled, errors
+
+
 def generate_job_config(project_id, query_dict):
     """
     Generates BigQuery job_configuration object
@@ -104,6 +1222,72 @@ def generate_job_config(project_id, query_dict):
     return job_config
 
 
+def get_rule_label(module_name):
+    """
+    Get the BigQuery label value identifying a cleaning rule
+
+    :param module_name: name of the module defining the rule
+    :return: the last part of the module name as a valid label value
+    """
+    label = re.sub(r'[^a-z0-9_-]', '_', module_name.split('.')[-1].lower())
+    return label[:ce_consts.MAX_LABEL_LENGTH]
+
+
+def run_query(client, query_dict, rule_info, query_no, query_count):
+    """
+    Runs a query from a cleaning rule and waits for it to complete
+
+    :param client: BigQuery client
+    :param query_dict: dictionary for the query
+    :param rule_info: contains information about the query function
+    :param query_no: index of the query in the rule's query list
+    :param query_count: number of queries the rule generated
+    :return: the completed BigQuery job object
+    """
+    try:
+        LOGGER.info(
+            ce_consts.QUERY_RUN_MESSAGE_TEMPLATE.render(query_no=query_no,
+                                                        query_count=query_count,
+                                                        **rule_info))
+        job_config = generate_job_config(client.project, query_dict)
+        # labels identify the rule of each job when profiling the run
+        job_config.labels = {
+            ce_consts.CLEANING_RULE_LABEL:
+                get_rule_label(rule_info[cdr_consts.MODULE_NAME]),
+            ce_consts.QUERY_NO_LABEL:
+                str(query_no)
+        }
+
+        module_short_name = rule_info[cdr_consts.MODULE_NAME].split(
+            '.')[-1][:10]
+        query_job = client.query(query=query_dict.get(cdr_consts.QUERY),
+                                 job_config=job_config,
+                                 job_id_prefix=f'{module_short_name}_')
+        LOGGER.info(f'Running {query_job.job_id}')
+        # wait for job to complete
+        query_job.result()
+        if query_job.errors:
+            raise RuntimeError(
+                ce_consts.FAILURE_MESSAGE_TEMPLATE.render(
+                    client.project, query_job, **rule_info, **query_dict))
+        LOGGER.info(
+            ce_consts.SUCCESS_MESSAGE_TEMPLATE.render(project_id=client.project,
+                                                      query_job=query_job,
+                                                      query_no=query_no,
+                                                      query_count=query_count,
+                                                      **rule_info))
+        # counts of the tables the query wrote must be read again
+        table_counts.invalidate(get_query_tables(query_dict)[1])
+    except (GoogleCloudError, TOError) as exp:
+        LOGGER.exception(
+            ce_consts.FAILURE_MESSAGE_TEMPLATE.render(project_id=client.project,
+                                                      **rule_info,
+                                                      **query_dict,
+                                                      exception=exp))
+        raise exp
+    return query_job
+
+
 def run_queries(client, query_list, rule_info):
     """
     Runs queries from the list of query_dicts
@@ -116,40 +1300,98 @@ def run_queries(client, query_list, rule_info):
     query_count = len(query_list)
     jobs = []
     for query_no, query_dict in enumerate(query_list):
-        try:
-            LOGGER.info(
-                ce_consts.QUERY_RUN_MESSAGE_TEMPLATE.render(
-                    query_no=query_no, query_count=query_count, **rule_info))
-            job_config = generate_job_config(client.project, query_dict)
-
-            module_short_name = rule_info[cdr_consts.MODULE_NAME].split(
-                '.')[-1][:10]
-            query_job = client.query(query=query_dict.get(cdr_consts.QUERY),
-                                     job_config=job_config,
-                                     job_id_prefix=f'{module_short_name}_')
-            jobs.append(query_job)
-            LOGGER.info(f'Running {query_job.job_id}')
-            # wait for job to complete
-            query_job.result()
-            if query_job.errors:
-                raise RuntimeError(
-                    ce_consts.FAILURE_MESSAGE_TEMPLATE.render(
-                        client.project, query_job, **rule_info, **query_dict))
-            LOGGER.info(
-                ce_consts.SUCCESS_MESSAGE_TEMPLATE.render(
-                    project_id=client.project,
-                    query_job=query_job,
-                    query_no=query_no,
-                    query_count=query_count,
-                    **rule_info))
-        except (GoogleCloudError, TOError) as exp:
-            LOGGER.exception(
-                ce_consts.FAILURE_MESSAGE_TEMPLATE.render(
-                    project_id=client.project,
-                    **rule_info,
-                    **query_dict,
-                    exception=exp))
-            raise exp
+        jobs.append(
+            run_query(client, query_dict, rule_info, query_no, query_count))
+    return jobs
+
+
+def get_skip_tables(query_dict, dataset_id):
+    """
+    Get the tables a query spec changes nothing without
+
+    Rules declare the tables with the skip_if_empty key.  An UPDATE or
+    DELETE of a table in dataset_id needs no declaration.
+
+    :param query_dict: dictionary for the query
+    :param dataset_id: identifies the dataset to clean
+    :return: list of table names in dataset_id, empty if the query must run
+    """
+    if cdr_consts.SKIP_IF_EMPTY in query_dict:
+        return query_dict[cdr_consts.SKIP_IF_EMPTY]
+
+    query = query_dict.get(cdr_consts.QUERY, '').strip().rstrip(';')
+    dml_target = DML_TARGET_PATTERN.match(query)
+    if ';' in query or not dml_target:
+        return []
+    table = _to_table_name(dml_target.group(1).replace('`', ''))
+    if table is None or table.split('.')[0] != dataset_id:
+        return []
+    return [table.split('.')[1]]
+
+
+def get_skip_reason(query_dict, dataset_id, table_stats, written_tables):
+    """
+    Determine if a query spec can be skipped because its tables are empty
+
+    The row counts are from the start of the run, so tables written since
+    then are never considered empty.
+
+    :param query_dict: dictionary for the query
+    :param dataset_id: identifies the dataset to clean
+    :param table_stats: dict returned by get_table_stats
+    :param written_tables: set of the tables written earlier in the run, as
+        'dataset.table'
+    :return: the reason to skip the query or None if it must run
+    """
+    skip_tables = get_skip_tables(query_dict, dataset_id)
+    if not skip_tables:
+        return None
+    for table in skip_tables:
+        stats = table_stats.get(table)
+        if (stats is None or stats[ce_consts.ROW_COUNT] or
+                _tables_overlap({f'{dataset_id}.{table}'}, written_tables)):
+            return None
+    return f'empty table(s) {", ".join(skip_tables)}'
+
+
+def run_pruned_queries(client, dataset_id, query_list, rule_info, table_stats,
+                       written_tables, skipped_queries):
+    """
+    Runs the queries of a rule, skipping those whose tables are empty
+
+    :param client: BigQuery client
+    :param dataset_id: identifies the dataset to clean
+    :param query_list: list of query_dicts generated by a cleaning rule
+    :param rule_info: contains information about the query function
+    :param table_stats: dict returned by get_table_stats
+    :param written_tables: set of the tables written earlier in the run,
+        updated with the tables the queries write
+    :param skipped_queries: list a record of each skipped query is appended to
+    :return: list of the completed BigQuery jobs
+    """
+    query_count = len(query_list)
+    jobs = []
+    for query_no, query_dict in enumerate(query_list):
+        reason = get_skip_reason(query_dict, dataset_id, table_stats,
+                                 written_tables)
+        if reason:
+            LOGGER.info(f'Skipping query {query_no+1}/{query_count} of '
+                        f'{rule_info[cdr_consts.MODULE_NAME]}, {reason}')
+            skipped_queries.append({
+                ce_consts.SKIPPED_RULE:
+                    get_rule_label(rule_info[cdr_consts.MODULE_NAME]),
+                ce_consts.SKIPPED_QUERY_NO:
+                    query_no,
+                ce_consts.SKIPPED_REASON:
+                    reason
+            })
+            continue
+
+        jobs.append(
+            run_query(client, query_dict, rule_info, query_no, query_count))
+        _, writes = get_query_tables(query_dict)
+        written_tables.update(
+            writes if writes is not None else {f'{dataset_id}.{ALL_TABLES}'})
     return jobs
 
 
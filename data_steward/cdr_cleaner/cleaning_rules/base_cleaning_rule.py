@@ -20,6 +20,7 @@ from oauth2client.client import HttpAccessTokenRefreshError
 
 # Project imports
 import constants.cdr_cleaner.clean_cdr as cdr_consts
+from cdr_cleaner import table_counts
 from utils.sandbox import get_sandbox_table_name, get_sandbox_options
 from common import JINJA_ENV
 
@@ -164,7 +165,11 @@ class BaseCleaningRule(AbstractBaseCleaningRule):
     """
     string_list = List[str]
     cleaning_class_list = List[AbstractBaseCleaningRule]
-    TABLE_COUNT_QUERY = ''' SELECT COALESCE(COUNT(*), 0) AS row_count FROM `{dataset}.{table}` '''
+
+    # Set to True in rules whose setup_rule and get_query_specs do not read
+    # the dataset being cleaned.  Only their table rewrites are fused with
+    # those of the rules before them, see clean_cdr_engine.run_rules_fused
+    fusable_rewrite = False
 
     def __init__(self,
                  issue_numbers: string_list = None,
@@ -432,18 +437,29 @@ class BaseCleaningRule(AbstractBaseCleaningRule):
         """
         Method to get the row counts of the list of tables
 
+        The counts of all tables of the dataset are read from its metadata at
+        once and cached until the cleaning engine writes one of its tables.
+
         :param dataset: dataset identifier
         :param client: big query client that has been instantiated
         :param tables: list of tables
         :return: returns a dictionary with table name as key and row count as value
                 counts_dict -> {'measurement' : 100000000, 'observation': 2000000000000}
         """
-        counts_dict = dict()
-        for table in tables:
-            query = self.TABLE_COUNT_QUERY.format(dataset=dataset, table=table)
-            count = client.query(query).to_dataframe()
-            counts_dict[table] = count['row_count'][0]
-        return counts_dict
+        return table_counts.get_table_counts(client, dataset, tables)
+
+    def get_table_count_deltas(self, client, dataset, initial_counts):
+        """
+        Method to get the change in the row counts of tables since
+        get_table_counts was called
+
+        :param client: big query client that has been instantiated
+        :param dataset: dataset identifier
+        :param initial_counts: dictionary returned by get_table_counts
+        :return: returns a dictionary with table name as key and the rows added,
+                or removed if negative, as value
+        """
+        return table_counts.get_count_deltas(client, dataset, initial_counts)
 
     def validate_delete_rule(self, dataset, sandbox_dataset, sandbox_tables,
                              tables_affected, initial_counts, client):
@@ -459,10 +475,10 @@ class BaseCleaningRule(AbstractBaseCleaningRule):
         :return: returns success message when the validation is success full else
         raises a RuntimeError.
         """
-        final_row_counts = self.get_table_counts(dataset, tables_affected,
-                                                 client)
+        final_row_counts = self.get_table_counts(client, dataset,
+                                                 tables_affected)
         sandbox_row_counts = self.get_table_counts(
-            sandbox_dataset, list(sandbox_tables.values()), client)
+            client, sandbox_dataset, list(sandbox_tables.values()))
 
         for k, v in initial_counts.items():
             if v == final_row_counts[k] + sandbox_row_counts[sandbox_tables[k]]:
@@ -308,3 +308,178 @@ class AbstractInMemoryLookupTableConceptSuppression(AbstractConceptSuppression):
             cdr_consts.DISPOSITION: bq_consts.WRITE_TRUNCATE,
             cdr_consts.DESTINATION_DATASET: self.sandbox_dataset_id
         }
+
+
+class AbstractUnifiedConceptSuppression(AbstractConceptSuppression):
+    """
+    This class is to be extended to run several concept suppression rules in
+    one pass.
+
+    The suppressed concepts of all the rules are merged into one lookup table
+    keyed by the table and concept_id.  Each table is then sandboxed with one
+    scan and rewritten once, instead of once per rule.  The sandboxed records
+    are tagged with the names of the rules which suppressed them.
+    """
+    UNIFIED_LOOKUP_TABLE_QUERY_TEMPLATE = JINJA_ENV.from_string("""
+    CREATE OR REPLACE TABLE `{{project}}.{{sandbox_dataset}}.{{lookup_table}}` AS
+    {% for rule in rules %}
+    {% if loop.previtem is defined %}UNION ALL{% endif %}
+    SELECT DISTINCT
+      table_id,
+      concept_id,
+      '{{rule.name}}' AS suppression_rule
+    {% if rule.lookup_table %}
+    FROM `{{project}}.{{sandbox_dataset}}.{{rule.lookup_table}}`
+    {% else %}
+    FROM UNNEST ([{{rule.concept_ids | join(', ')}}]) AS concept_id
+    {% endif %}
+    CROSS JOIN UNNEST ([
+    {% for table_name in rule.tables %}
+        {% if loop.previtem is defined %}, {% else %}  {% endif %} '{{table_name}}'
+    {% endfor %}]) AS table_id
+    {% endfor %}
+    """)
+
+    UNIFIED_SANDBOX_QUERY_TEMPLATE = JINJA_ENV.from_string("""
+    WITH suppressed_concepts AS
+    (
+        SELECT
+          concept_id,
+          ARRAY_AGG(DISTINCT suppression_rule ORDER BY suppression_rule) AS suppression_rules
+        FROM `{{project}}.{{sandbox_dataset}}.{{lookup_table}}`
+        WHERE table_id = '{{domain_table}}'
+        GROUP BY concept_id
+    )
+
+    SELECT
+      d.*,
+      ARRAY(
+        SELECT DISTINCT suppression_rule
+        FROM UNNEST(ARRAY_CONCAT(
+        {% for concept_field in concept_fields %}
+            {% if loop.previtem is defined %}, {% else %}  {% endif %} IFNULL(s{{loop.index}}.suppression_rules, [])
+        {% endfor %})) AS suppression_rule
+        ORDER BY suppression_rule
+      ) AS suppression_rules
+    FROM `{{project}}.{{dataset}}.{{domain_table}}` AS d
+    {% for concept_field in concept_fields %}
+    LEFT JOIN suppressed_concepts AS s{{loop.index}}
+      ON d.{{concept_field}} = s{{loop.index}}.concept_id
+    {% endfor %}
+    WHERE COALESCE(
+    {% for concept_field in concept_fields %}
+        {% if loop.previtem is defined %}, {% else %}  {% endif %} s{{loop.index}}.concept_id
+    {% endfor %}) IS NOT NULL
+    """)
+
+    def __init__(self, project_id, dataset_id, sandbox_dataset_id, description,
+                 affected_datasets, suppression_rules,
+                 concept_suppression_lookup_table):
+        """
+        Initialize the class with proper info.
+
+        The issue numbers and affected tables are those of the suppression
+        rules.
+
+        :param suppression_rules: list of AbstractBqLookupTableConceptSuppression
+            and AbstractInMemoryLookupTableConceptSuppression classes to run
+        :param concept_suppression_lookup_table: name of the merged lookup
+            table in the sandbox dataset
+        """
+        self._suppression_rules = [
+            rule(project_id, dataset_id, sandbox_dataset_id)
+            for rule in suppression_rules
+        ]
+
+        issue_numbers = []
+        affected_tables = []
+        for rule in self._suppression_rules:
+            issue_numbers.extend(issue for issue in rule.issue_numbers
+                                 if issue not in issue_numbers)
+            affected_tables.extend(table for table in rule.affected_tables
+                                   if table not in affected_tables)
+
+        super().__init__(issue_numbers=issue_numbers,
+                         description=description,
+                         affected_datasets=affected_datasets,
+                         project_id=project_id,
+                         dataset_id=dataset_id,
+                         sandbox_dataset_id=sandbox_dataset_id,
+                         affected_tables=affected_tables)
+
+        self._concept_suppression_lookup_table = concept_suppression_lookup_table
+
+    @property
+    def suppression_rules(self):
+        """
+        Return the instances of the merged suppression rules.
+        """
+        return self._suppression_rules
+
+    @property
+    def concept_suppression_lookup_table(self):
+        """
+        Return the name of the merged lookup table.
+        """
+        return self._concept_suppression_lookup_table
+
+    def setup_rule(self, client: Client, *args, **keyword_args):
+        # Finds the tables in the dataset once for all the rules
+        super().setup_rule(client, *args, **keyword_args)
+
+        rules = []
+        for rule in self.suppression_rules:
+            tables = [
+                table for table in rule.affected_tables
+                if table in self.affected_tables
+            ]
+            if not tables:
+                continue
+
+            lookup_rule = {'name': rule.__class__.__name__, 'tables': tables}
+            if isinstance(rule, AbstractBqLookupTableConceptSuppression):
+                rule.create_suppression_lookup_table(client)
+                lookup_table = rule.concept_suppression_lookup_table
+                lookup_rule['lookup_table'] = lookup_table
+            else:
+                lookup_rule['concept_ids'] = rule.get_suppressed_concept_ids()
+            rules.append(lookup_rule)
+
+        if not rules:
+            return
+
+        query_job = client.query(
+            self.UNIFIED_LOOKUP_TABLE_QUERY_TEMPLATE.render(
+                project=self.project_id,
+                sandbox_dataset=self.sandbox_dataset_id,
+                lookup_table=self.concept_suppression_lookup_table,
+                rules=rules))
+        result = query_job.result()
+
+        if hasattr(result, 'errors') and result.errors:
+            LOGGER.error(f"Error running job {result.job_id}: {result.errors}")
+            raise GoogleCloudError(
+                f"Error running job {result.job_id}: {result.errors}")
+
+    def get_sandbox_query(self, table_name):
+        """
+        Sandbox records in the given table whose concept id fields contain any concepts 
+        suppressed by any of the rules, with the names of those rules
+
+        :param table_name: 
+        :return: 
+        """
+        suppression_record_sandbox_query = self.UNIFIED_SANDBOX_QUERY_TEMPLATE.render(
+            project=self.project_id,
+            dataset=self.dataset_id,
+            sandbox_dataset=self.sandbox_dataset_id,
+            domain_table=table_name,
+            concept_fields=get_concept_id_fields(table_name),
+            lookup_table=self.concept_suppression_lookup_table)
+
+        return {
+            cdr_consts.QUERY: suppression_record_sandbox_query,
+            cdr_consts.DESTINATION_TABLE: self.sandbox_table_for(table_name),
+            cdr_consts.DISPOSITION: bq_consts.WRITE_TRUNCATE,
+            cdr_consts.DESTINATION_DATASET: self.sandbox_dataset_id
+        }
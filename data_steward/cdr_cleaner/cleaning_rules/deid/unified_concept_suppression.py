@@ -0,0 +1,87 @@
+"""
+Sandbox and record suppress the records of all controlled tier concept
+suppression rules in one pass.
+
+The suppressed concepts of the rules are merged into one lookup table, so each
+table is sandboxed and rewritten once instead of once per rule.  The sandboxed
+records are tagged with the rules that suppressed them in the
+suppression_rules column, e.g. to count the records each rule suppressed:
+
+    SELECT suppression_rule, COUNT(*)
+    FROM `sandbox.observation_sandbox_table`, UNNEST(suppression_rules) AS suppression_rule
+    GROUP BY suppression_rule
+"""
+import logging
+
+import constants.cdr_cleaner.clean_cdr as cdr_consts
+from cdr_cleaner.cleaning_rules.cancer_concept_suppression import \
+    CancerConceptSuppression
+from cdr_cleaner.cleaning_rules.deid.birth_information_suppression import \
+    BirthInformationSuppression
+from cdr_cleaner.cleaning_rules.deid.concept_suppression import \
+    AbstractUnifiedConceptSuppression
+from cdr_cleaner.cleaning_rules.deid.geolocation_concept_suppression import \
+    GeoLocationConceptSuppression
+from cdr_cleaner.cleaning_rules.deid.motor_vehicle_accident_suppression import \
+    MotorVehicleAccidentSuppression
+from cdr_cleaner.cleaning_rules.free_text_survey_response_suppression import \
+    FreeTextSurveyResponseSuppression
+
+LOGGER = logging.getLogger(__name__)
+
+SUPPRESSION_RULES = [
+    FreeTextSurveyResponseSuppression, MotorVehicleAccidentSuppression,
+    GeoLocationConceptSuppression, BirthInformationSuppression,
+    CancerConceptSuppression
+]
+
+SUPPRESSION_RULE_CONCEPT_TABLE = 'unified_suppression_concept'
+
+
+class UnifiedConceptSuppression(AbstractUnifiedConceptSuppression):
+
+    def __init__(self, project_id, dataset_id, sandbox_dataset_id):
+        """
+        Initialize the class with proper info.
+
+        The issue numbers are those of the merged suppression rules.
+        """
+        desc = (
+            'Sandbox and record suppress all records with a concept_id or concept_code '
+            'suppressed by any of the controlled tier concept suppression rules. '
+        )
+        super().__init__(
+            description=desc,
+            affected_datasets=[cdr_consts.CONTROLLED_TIER_DEID],
+            project_id=project_id,
+            dataset_id=dataset_id,
+            sandbox_dataset_id=sandbox_dataset_id,
+            suppression_rules=SUPPRESSION_RULES,
+            concept_suppression_lookup_table=SUPPRESSION_RULE_CONCEPT_TABLE)
+
+    def setup_validation(self, client, *args, **keyword_args):
+        pass
+
+    def validate_rule(self, client, *args, **keyword_args):
+        pass
+
+
+if __name__ == '__main__':
+    import cdr_cleaner.args_parser as parser
+    import cdr_cleaner.clean_cdr_engine as clean_engine
+
+    ARGS = parser.default_parse_args()
+
+    if ARGS.list_queries:
+        clean_engine.add_console_logging()
+        query_list = clean_engine.get_query_list(ARGS.project_id,
+                                                 ARGS.dataset_id,
+                                                 ARGS.sandbox_dataset_id,
+                                                 [(UnifiedConceptSuppression,)])
+        for query in query_list:
+            LOGGER.info(query)
+    else:
+        clean_engine.add_console_logging(ARGS.console_log)
+        clean_engine.clean_dataset(ARGS.project_id, ARGS.dataset_id,
+                                   ARGS.sandbox_dataset_id,
+                                   [(UnifiedConceptSuppression,)])
@@ -237,6 +237,7 @@ class FillSourceValueTextFields(BaseCleaningRule):
                 query[cdr_consts.DESTINATION_TABLE] = table
                 query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
                 query[cdr_consts.DESTINATION_DATASET] = self.dataset_id
+                query[cdr_consts.SKIP_IF_EMPTY] = [table]
                 queries_list.append(query)
         return queries_list
 
@@ -234,7 +234,8 @@ class NullInvalidForeignKeys(BaseCleaningRule):
                     cdr_consts.DESTINATION_DATASET:
                         self.dataset_id,
                     cdr_consts.DISPOSITION:
-                        bq_consts.WRITE_TRUNCATE
+                        bq_consts.WRITE_TRUNCATE,
+                    cdr_consts.SKIP_IF_EMPTY: [table]
                 }
 
                 queries_list.append(invalid_foreign_key_query)
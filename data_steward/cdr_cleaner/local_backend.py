@@ -0,0 +1,707 @@
+"""
+Run cleaning rules on a local SQLite database instead of BigQuery.
+
+The LocalClient answers the calls the cleaning engine makes to a BigQuery
+client.  Each dataset is an attached in-memory SQLite database, tables are
+created from the schemas in resource_files/schemas and loaded with fixture
+rows, and queries are translated from BigQuery standard SQL to SQLite before
+they run.  Rules can then be checked and timed on synthetic data without a
+BigQuery project.
+
+The translation covers the features most rules use: backticked table
+references, CREATE OR REPLACE TABLE, CREATE TABLE ... AS (...), OPTIONS,
+CAST types, IF, GREATEST, LEAST, raw strings, # comments, the REGEXP_ and
+other string functions, EXTRACT, DATE_ADD, DATE_SUB and DATE_DIFF of dates,
+DATE literals, set operations with DISTINCT and the __TABLES__ metadata.
+Queries using arrays, structs, scripting, SELECT * EXCEPT or date parts other
+than DAY, WEEK, MONTH, QUARTER and YEAR fail with a BadRequest as a query
+BigQuery rejected would.
+
+Example:
+    client = LocalClient()
+    client.load_rows('dataset', 'observation', [{'observation_id': 1, ...}])
+    jobs = local_backend.run_rules(client, 'dataset', 'sandbox',
+                                   [(DropZeroConceptIDs,)])
+    rows = client.get_rows('dataset', 'observation')
+"""
+# Python imports
+import calendar
+import logging
+import re
+import sqlite3
+import time
+from datetime import date, datetime, timedelta, timezone
+from itertools import count
+
+# Third party imports
+import pandas as pd
+from google.cloud.exceptions import BadRequest, Conflict
+
+# Project imports
+import resources
+import cdr_cleaner.clean_cdr_engine as clean_engine
+from constants import bq_utils as bq_consts
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+LOGGER = logging.getLogger(__name__)
+
+LOCAL_PROJECT = 'local-project'
+METADATA_TABLE = '__TABLES__'
+RESULT_TABLE = '_local_result'
+
+# SQLite column types of the BigQuery field types
+SQLITE_TYPES = {
+    'integer': 'INTEGER',
+    'int64': 'INTEGER',
+    'boolean': 'INTEGER',
+    'bool': 'INTEGER',
+    'float': 'REAL',
+    'float64': 'REAL',
+    'numeric': 'REAL',
+    'bignumeric': 'REAL',
+}
+DEFAULT_SQLITE_TYPE = 'TEXT'
+
+# SQLite types of the BigQuery types in CAST expressions.  Dates and times are
+# kept as ISO formatted text.
+CAST_TYPE_PATTERN = re.compile(
+    r'\bAS\s+(INT64|FLOAT64|NUMERIC|BIGNUMERIC|STRING|BOOL|BOOLEAN|DATE|'
+    r'DATETIME|TIMESTAMP)\s*\)', re.IGNORECASE)
+CAST_TYPES = {
+    'INT64': 'INTEGER',
+    'FLOAT64': 'REAL',
+    'NUMERIC': 'REAL',
+    'BIGNUMERIC': 'REAL',
+    'BOOL': 'INTEGER',
+    'BOOLEAN': 'INTEGER'
+}
+BACKTICK_REF_PATTERN = re.compile(r'`([^`]+)`')
+CREATE_OR_REPLACE_PATTERN = re.compile(
+    r'\bCREATE\s+OR\s+REPLACE\s+TABLE\s+("[^"]+"\."[^"]+"|[\w.]+)',
+    re.IGNORECASE)
+OPTIONS_PATTERN = re.compile(r'\bOPTIONS\s*\(', re.IGNORECASE)
+SET_OPERATION_PATTERN = re.compile(r'\b(UNION|EXCEPT|INTERSECT)\s+DISTINCT\b',
+                                   re.IGNORECASE)
+IF_FUNCTION_PATTERN = re.compile(r'\bIF\s*\(', re.IGNORECASE)
+GREATEST_PATTERN = re.compile(r'\bGREATEST\s*\(', re.IGNORECASE)
+LEAST_PATTERN = re.compile(r'\bLEAST\s*\(', re.IGNORECASE)
+CURRENT_TIME_PATTERN = re.compile(r'\b(CURRENT_(?:DATE|TIMESTAMP))\s*\(\s*\)',
+                                  re.IGNORECASE)
+RAW_STRING_PATTERN = re.compile(r'(?<!\w)[rR](?=[\'"])')
+SAFE_CAST_PATTERN = re.compile(r'\bSAFE_CAST\s*\(', re.IGNORECASE)
+CREATE_AS_SUBQUERY_PATTERN = re.compile(
+    r'\bCREATE\s+TABLE\s+("[^"]+"\."[^"]+"|[\w.]+)\s+AS\s*\(', re.IGNORECASE)
+EXTRACT_PATTERN = re.compile(r'\bEXTRACT\s*\(\s*(YEAR|MONTH|DAY)\s+FROM\b',
+                             re.IGNORECASE)
+DATE_FUNCTION_PATTERN = re.compile(r'\b(DATE_ADD|DATE_SUB|DATE_DIFF)\s*\(',
+                                   re.IGNORECASE)
+# the last argument of DATE_ADD and DATE_SUB
+INTERVAL_PATTERN = re.compile(
+    r'(\s*)INTERVAL\s+(.+?)\s+(DAY|WEEK|MONTH|QUARTER|YEAR)\s*',
+    re.IGNORECASE | re.DOTALL)
+# the last argument of DATE_DIFF
+DATE_PART_PATTERN = re.compile(r'(\s*)(DAY|WEEK|MONTH|QUARTER|YEAR)\s*',
+                               re.IGNORECASE)
+# dates are kept as ISO formatted text
+DATE_LITERAL_PATTERN = re.compile(r"\bDATE\s+(?=')", re.IGNORECASE)
+# BigQuery allows a trailing comma in a SELECT list
+TRAILING_COMMA_PATTERN = re.compile(r',(\s*\bFROM\b)', re.IGNORECASE)
+HASH_COMMENT_PATTERN = re.compile(r'^(\s*)#', re.MULTILINE)
+
+
+def _regexp_extract(value, pattern):
+    if value is None:
+        return None
+    match = re.search(pattern, value)
+    if match is None:
+        return None
+    return match.group(1) if match.groups() else match.group(0)
+
+
+def _concat(*values):
+    if any(value is None for value in values):
+        return None
+    return ''.join(str(value) for value in values)
+
+
+def _timestamp_millis(millis):
+    if millis is None:
+        return None
+    return datetime.fromtimestamp(millis / 1000,
+                                  tz=timezone.utc).isoformat(sep=' ')
+
+
+def _to_date(value):
+    return None if value is None else date.fromisoformat(str(value)[:10])
+
+
+def _extract_part(part, value):
+    value = _to_date(value)
+    return None if value is None else getattr(value, part.lower())
+
+
+def _add_months(value, months):
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def _date_add(value, amount, part):
+    value = _to_date(value)
+    if value is None or amount is None:
+        return None
+    part = part.upper()
+    if part in ('DAY', 'WEEK'):
+        days = amount * 7 if part == 'WEEK' else amount
+        return (value + timedelta(days=days)).isoformat()
+    months = {'MONTH': 1, 'QUARTER': 3, 'YEAR': 12}[part] * amount
+    return _add_months(value, months).isoformat()
+
+
+def _week_start(value):
+    # BigQuery weeks start on Sunday
+    return value - timedelta(days=(value.weekday() + 1) % 7)
+
+
+def _date_diff(end, start, part):
+    """
+    Count the part boundaries crossed between two dates, as BigQuery does
+
+    e.g. there is one YEAR between 2017-12-31 and 2018-01-01.
+    """
+    end, start = _to_date(end), _to_date(start)
+    if end is None or start is None:
+        return None
+    part = part.upper()
+    if part == 'DAY':
+        return (end - start).days
+    if part == 'WEEK':
+        return (_week_start(end) - _week_start(start)).days // 7
+    if part == 'MONTH':
+        return (end.year - start.year) * 12 + end.month - start.month
+    if part == 'QUARTER':
+        return (end.year * 4 + (end.month - 1) // 3) - (start.year * 4 +
+                                                        (start.month - 1) // 3)
+    return end.year - start.year
+
+
+# Python implementations of BigQuery functions SQLite does not have
+FUNCTIONS = {
+    'REGEXP_CONTAINS':
+        (2, lambda value, pattern: None
+         if value is None else re.search(pattern, value) is not None),
+    'REGEXP_REPLACE':
+        (3, lambda value, pattern, replacement: None
+         if value is None else re.sub(pattern, replacement, value)),
+    'REGEXP_EXTRACT': (2, _regexp_extract),
+    'STARTS_WITH': (2, lambda value, prefix: None
+                    if value is None else value.startswith(prefix)),
+    'ENDS_WITH': (2, lambda value, suffix: None
+                  if value is None else value.endswith(suffix)),
+    'CONCAT': (-1, _concat),
+    'SAFE_DIVIDE': (2, lambda x, y: x / y if x is not None and y else None),
+    'TIMESTAMP_MILLIS': (1, _timestamp_millis),
+    'EXTRACT_PART': (2, _extract_part),
+    'DATE_ADD': (3, _date_add),
+    'DATE_SUB': (3, lambda value, amount, part: _date_add(
+        value, None if amount is None else -amount, part)),
+    'DATE_DIFF': (3, _date_diff),
+}
+
+
+def _remove_options(query):
+    """
+    Remove the OPTIONS clauses of table definitions
+
+    :param query: the SQL text
+    :return: the SQL without OPTIONS(...)
+    """
+    match = OPTIONS_PATTERN.search(query)
+    while match:
+        depth = 1
+        index = match.end()
+        while index < len(query) and depth:
+            if query[index] == '(':
+                depth += 1
+            elif query[index] == ')':
+                depth -= 1
+            index += 1
+        query = query[:match.start()] + query[index:]
+        match = OPTIONS_PATTERN.search(query, match.start())
+    return query
+
+
+def _unwrap_create_as(query):
+    """
+    Remove the parentheses SQLite does not allow around the query of a
+    CREATE TABLE ... AS
+
+    :param query: the SQL text
+    :return: the SQL with CREATE TABLE ... AS SELECT
+    """
+    match = CREATE_AS_SUBQUERY_PATTERN.search(query)
+    while match:
+        depth = 1
+        index = match.end()
+        while index < len(query) and depth:
+            if query[index] == '(':
+                depth += 1
+            elif query[index] == ')':
+                depth -= 1
+            index += 1
+        query = (f'{query[:match.end() - 1]} {query[match.end():index - 1]} '
+                 f'{query[index:]}')
+        match = CREATE_AS_SUBQUERY_PATTERN.search(query, match.end())
+    return query
+
+
+def _split_arguments(query, start):
+    """
+    Split the arguments of a function call at their top level commas
+
+    :param query: the SQL text
+    :param start: index just past the opening parenthesis of the call
+    :return: tuple of the list of arguments and the index just past the
+        closing parenthesis
+    :raises BadRequest: if the call is not closed
+    """
+    arguments = []
+    depth = 0
+    quote = None
+    argument_start = index = start
+    while index < len(query):
+        char = query[index]
+        if quote:
+            if char == '\\':
+                index += 1
+            elif char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            if not depth:
+                arguments.append(query[argument_start:index])
+                return arguments, index + 1
+            depth -= 1
+        elif char == ',' and not depth:
+            arguments.append(query[argument_start:index])
+            argument_start = index + 1
+        index += 1
+    raise BadRequest(f'Unclosed function call in local query:\n{query}')
+
+
+def _translate_date_functions(query):
+    """
+    Pass the date part of DATE_ADD, DATE_SUB and DATE_DIFF as a string
+
+    Only the last argument of these calls is rewritten, so columns named
+    like a date part elsewhere in the query are left alone.
+
+    :param query: the SQL text
+    :return: the SQL with e.g. DATE_ADD(d, 1, 'MONTH')
+    :raises BadRequest: if the date part is not supported
+    """
+    match = DATE_FUNCTION_PATTERN.search(query)
+    while match:
+        arguments, end = _split_arguments(query, match.end())
+        # nested calls are translated first
+        arguments = [
+            _translate_date_functions(argument) for argument in arguments
+        ]
+        if match[1].upper() == 'DATE_DIFF':
+            part = DATE_PART_PATTERN.fullmatch(arguments[-1])
+            last = part and f"{part[1]}'{part[2].upper()}'"
+        else:
+            part = INTERVAL_PATTERN.fullmatch(arguments[-1])
+            last = part and f"{part[1]}{part[2]}, '{part[3].upper()}'"
+        if not last:
+            raise BadRequest(f'Unsupported date part {arguments[-1].strip()} '
+                             f'of {match[1]} in local query:\n{query}')
+        call = f'{match[0]}{",".join(arguments[:-1] + [last])})'
+        query = query[:match.start()] + call + query[end:]
+        match = DATE_FUNCTION_PATTERN.search(query, match.start() + len(call))
+    return query
+
+
+def _to_local_ref(ref):
+    """
+    Translate a backticked BigQuery reference to a quoted SQLite reference
+
+    :param ref: the reference without backticks, e.g. 'project.dataset.table'
+    :return: the reference as '"dataset"."table"'
+    """
+    parts = ref.split('.')
+    if len(parts) > 2:
+        parts = parts[-2:]
+    return '.'.join(f'"{part}"' for part in parts)
+
+
+def translate_query(query, project_id=LOCAL_PROJECT):
+    """
+    Translate BigQuery standard SQL to SQLite
+
+    :param query: the BigQuery SQL
+    :param project_id: identifies the project of the table references
+    :return: the SQLite SQL
+    :raises BadRequest: if a date function uses an unsupported date part
+    """
+    query = BACKTICK_REF_PATTERN.sub(lambda match: _to_local_ref(match[1]),
+                                     query)
+    query = re.sub(rf'(?<![\w"-]){re.escape(project_id)}\.', '', query)
+    query = HASH_COMMENT_PATTERN.sub(r'\1--', query)
+    query = _remove_options(query)
+    query = CREATE_OR_REPLACE_PATTERN.sub(
+        lambda match: f'DROP TABLE IF EXISTS {match[1]};\nCREATE TABLE '
+        f'{match[1]}', query)
+    query = _unwrap_create_as(query)
+    query = TRAILING_COMMA_PATTERN.sub(r'\1', query)
+    query = EXTRACT_PATTERN.sub(lambda match: f"EXTRACT_PART('{match[1]}',",
+                                query)
+    query = _translate_date_functions(query)
+    query = DATE_LITERAL_PATTERN.sub('', query)
+    query = CAST_TYPE_PATTERN.sub(
+        lambda match:
+        f'AS {CAST_TYPES.get(match[1].upper(), DEFAULT_SQLITE_TYPE)})', query)
+    query = SAFE_CAST_PATTERN.sub('CAST(', query)
+    query = SET_OPERATION_PATTERN.sub(lambda match: match[1], query)
+    query = IF_FUNCTION_PATTERN.sub('IIF(', query)
+    query = GREATEST_PATTERN.sub('MAX(', query)
+    query = LEAST_PATTERN.sub('MIN(', query)
+    query = CURRENT_TIME_PATTERN.sub(lambda match: match[1], query)
+    query = RAW_STRING_PATTERN.sub('', query)
+    return query
+
+
+def split_statements(query):
+    """
+    Split SQLite SQL into its statements
+
+    :param query: the SQLite SQL
+    :return: list of statements, without empty ones
+    """
+    statements = []
+    statement = ''
+    for line in query.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement)
+            statement = ''
+    statements.append(statement)
+    return [
+        statement for statement in statements
+        if statement.strip().strip(';').strip()
+    ]
+
+
+class LocalQueryJob:
+    """
+    A completed query, with the attributes the engine and profiler read from
+    a BigQuery QueryJob
+    """
+
+    def __init__(self, job_id, query, rows, job_config, started, ended,
+                 num_dml_affected_rows):
+        self.job_id = job_id
+        self.query = query
+        self._rows = rows
+        self.labels = getattr(job_config, 'labels', None) or {}
+        self.destination = getattr(job_config, 'destination', None)
+        self.started = started
+        self.ended = ended
+        self.num_dml_affected_rows = num_dml_affected_rows
+        self.errors = None
+        self.error_result = None
+        self.ddl_target_table = None
+        self.query_plan = []
+        self.slot_millis = None
+        self.total_bytes_processed = None
+        self.total_bytes_billed = None
+
+    def result(self):
+        """
+        :return: list of the result rows as dicts
+        """
+        return self._rows
+
+    def to_dataframe(self):
+        """
+        :return: the result rows as a pandas DataFrame
+        """
+        return pd.DataFrame(self._rows)
+
+
+class LocalClient:
+    """
+    A stand-in for a BigQuery client backed by an in-memory SQLite database
+    """
+
+    def __init__(self, project_id=LOCAL_PROJECT):
+        self.project = project_id
+        self._connection = sqlite3.connect(':memory:', check_same_thread=False)
+        for name, (arg_count, function) in FUNCTIONS.items():
+            self._connection.create_function(name, arg_count, function)
+        self._datasets = set()
+        self._modified = {}
+        self._job_ids = count()
+
+    def create_dataset(self, dataset, exists_ok=False):
+        """
+        Create a dataset, as an attached in-memory database
+
+        :param dataset: identifies the dataset, as 'dataset' or
+            'project.dataset'
+        :param exists_ok: if False, raise Conflict if the dataset exists
+        :return: the dataset_id
+        """
+        dataset_id = str(dataset).split('.')[-1]
+        if dataset_id in self._datasets:
+            if not exists_ok:
+                raise Conflict(f'Already Exists: Dataset {dataset_id}')
+            return dataset_id
+        self._connection.execute(f"ATTACH DATABASE ':memory:' AS "
+                                 f'"{dataset_id}"')
+        self._datasets.add(dataset_id)
+        return dataset_id
+
+    def create_table(self, dataset_id, table_id, fields=None):
+        """
+        Create an empty table, replacing it if it exists
+
+        :param dataset_id: identifies the dataset, created if needed
+        :param table_id: identifies the table
+        :param fields: list of BigQuery field dicts, defaults to the schema of
+            the table in resource_files/schemas
+        """
+        self.create_dataset(dataset_id, exists_ok=True)
+        fields = fields or resources.fields_for(table_id)
+        columns = ', '.join(
+            f'"{field["name"]}" '
+            f'{SQLITE_TYPES.get(field["type"].lower(), DEFAULT_SQLITE_TYPE)}'
+            for field in fields)
+        self._connection.executescript(
+            f'DROP TABLE IF EXISTS "{dataset_id}"."{table_id}";\n'
+            f'CREATE TABLE "{dataset_id}"."{table_id}" ({columns});')
+        self._set_modified({f'{dataset_id}.{table_id}'})
+
+    def load_rows(self, dataset_id, table_id, rows, fields=None):
+        """
+        Append rows to a table, creating it if it does not exist
+
+        :param dataset_id: identifies the dataset
+        :param table_id: identifies the table
+        :param rows: list of dicts mapping column names to values
+        :param fields: list of BigQuery field dicts used to create the table
+        """
+        if table_id not in self.list_tables(dataset_id):
+            self.create_table(dataset_id, table_id, fields)
+        for row in rows:
+            columns = ', '.join(f'"{column}"' for column in row)
+            params = ', '.join('?' for _ in row)
+            self._connection.execute(
+                f'INSERT INTO "{dataset_id}"."{table_id}" ({columns}) '
+                f'VALUES ({params})', list(row.values()))
+        self._set_modified({f'{dataset_id}.{table_id}'})
+
+    def list_tables(self, dataset_id):
+        """
+        :param dataset_id: identifies the dataset
+        :return: list of the names of its tables
+        """
+        if dataset_id not in self._datasets:
+            return []
+        return [
+            row[0] for row in self._connection.execute(
+                f'SELECT name FROM "{dataset_id}".sqlite_master '
+                f"WHERE type = 'table' AND name != '{METADATA_TABLE}' "
+                f'ORDER BY name')
+        ]
+
+    def get_rows(self, dataset_id, table_id):
+        """
+        Get the rows of a table
+
+        :param dataset_id: identifies the dataset
+        :param table_id: identifies the table
+        :return: list of dicts, in the order of the first column
+        """
+        cursor = self._connection.execute(
+            f'SELECT * FROM "{dataset_id}"."{table_id}" ORDER BY 1')
+        return self._to_dicts(cursor)
+
+    def query(self, query, job_config=None, job_id_prefix='', **kwargs):
+        """
+        Run a BigQuery query and wait for it to complete
+
+        :param query: BigQuery standard SQL
+        :param job_config: QueryJobConfig with the destination table and its
+            write disposition, if any
+        :param job_id_prefix: prefix of the job_id
+        :return: the completed LocalQueryJob
+        :raises BadRequest: if SQLite cannot run the translated query
+        """
+        job_id = f'{job_id_prefix}local_{next(self._job_ids)}'
+        destination = getattr(job_config, 'destination', None)
+        started = datetime.now(timezone.utc)
+        local_query = translate_query(query, self.project)
+        if METADATA_TABLE in local_query:
+            self._refresh_metadata()
+
+        try:
+            if destination is None:
+                rows, dml_rows = self._execute(local_query)
+            else:
+                rows, dml_rows = self._write_destination(
+                    local_query, destination, job_config.write_disposition)
+        except sqlite3.Error as exp:
+            raise BadRequest(f'{exp} in local query {job_id}:\n{local_query}')
+
+        _, writes = clean_engine.get_query_tables({
+            cdr_consts.QUERY:
+                query,
+            cdr_consts.DESTINATION_DATASET:
+                getattr(destination, 'dataset_id', None),
+            cdr_consts.DESTINATION_TABLE:
+                getattr(destination, 'table_id', None)
+        })
+        self._set_modified(writes)
+        return LocalQueryJob(job_id, query, rows, job_config, started,
+                             datetime.now(timezone.utc), dml_rows)
+
+    @staticmethod
+    def _to_dicts(cursor):
+        if cursor.description is None:
+            return []
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _execute(self, local_query):
+        """
+        Run SQLite statements
+
+        :param local_query: SQLite SQL of one or more statements
+        :return: tuple of the rows of the last statement and the number of
+            rows changed by DML statements, None if there were none
+        """
+        rows, dml_rows = [], None
+        with self._connection:
+            for statement in split_statements(local_query):
+                cursor = self._connection.execute(statement)
+                rows = self._to_dicts(cursor)
+                if cursor.rowcount >= 0:
+                    dml_rows = (dml_rows or 0) + cursor.rowcount
+        return rows, dml_rows
+
+    def _write_destination(self, local_query, destination, write_disposition):
+        """
+        Write the result of a SELECT to a table
+
+        :param local_query: SQLite SELECT
+        :param destination: TableReference of the destination
+        :param write_disposition: WRITE_TRUNCATE, WRITE_APPEND or WRITE_EMPTY
+        :return: tuple of an empty list of rows and None
+        :raises BadRequest: if a WRITE_EMPTY destination has rows
+        """
+        dataset_id = self.create_dataset(destination.dataset_id, exists_ok=True)
+        table = f'"{dataset_id}"."{destination.table_id}"'
+        result = f'"{dataset_id}"."{RESULT_TABLE}"'
+        exists = destination.table_id in self.list_tables(dataset_id)
+        if (exists and write_disposition == bq_consts.WRITE_EMPTY and
+                self._connection.execute(
+                    f'SELECT COUNT(*) FROM {table}').fetchone()[0]):
+            raise BadRequest(f'Already Exists: Table {destination.table_id}')
+
+        with self._connection:
+            self._connection.execute(f'DROP TABLE IF EXISTS {result}')
+            self._connection.execute(
+                f'CREATE TABLE {result} AS {local_query.strip().rstrip(";")}')
+            if exists and write_disposition == bq_consts.WRITE_APPEND:
+                columns = ', '.join(
+                    f'"{row[1]}"' for row in self._connection.execute(
+                        f'PRAGMA "{dataset_id}".table_info("{RESULT_TABLE}")'))
+                self._connection.execute(f'INSERT INTO {table} ({columns}) '
+                                         f'SELECT {columns} FROM {result}')
+                self._connection.execute(f'DROP TABLE {result}')
+            else:
+                self._connection.execute(f'DROP TABLE IF EXISTS {table}')
+                self._connection.execute(
+                    f'ALTER TABLE {result} RENAME TO "{destination.table_id}"')
+        return [], None
+
+    def _set_modified(self, tables):
+        """
+        Record the modification time of tables
+
+        :param tables: set of 'dataset.table' or 'dataset.*', None if unknown
+        """
+        now = int(time.time() * 1000)
+        if tables is None:
+            tables = {
+                f'{dataset_id}.{clean_engine.ALL_TABLES}'
+                for dataset_id in self._datasets
+            }
+        for table in tables:
+            dataset_id, table_id = table.split('.', 1)
+            if table_id == clean_engine.ALL_TABLES:
+                for table_id in self.list_tables(dataset_id):
+                    self._modified[(dataset_id, table_id)] = now
+            else:
+                self._modified[(dataset_id, table_id)] = now
+
+    def _refresh_metadata(self):
+        """
+        Rebuild the __TABLES__ table of each dataset
+        """
+        with self._connection:
+            for dataset_id in self._datasets:
+                metadata = f'"{dataset_id}"."{METADATA_TABLE}"'
+                self._connection.execute(f'DROP TABLE IF EXISTS {metadata}')
+                self._connection.execute(
+                    f'CREATE TABLE {metadata} (project_id TEXT, '
+                    f'dataset_id TEXT, table_id TEXT, row_count INTEGER, '
+                    f'size_bytes INTEGER, last_modified_time INTEGER)')
+                for table_id in self.list_tables(dataset_id):
+                    row_count = self._connection.execute(
+                        f'SELECT COUNT(*) FROM "{dataset_id}"."{table_id}"'
+                    ).fetchone()[0]
+                    self._connection.execute(
+                        f'INSERT INTO {metadata} VALUES (?, ?, ?, ?, 0, ?)',
+                        (self.project, dataset_id, table_id, row_count,
+                         self._modified.get((dataset_id, table_id), 0)))
+
+
+def run_rules(client,
+              dataset_id,
+              sandbox_dataset_id,
+              rules,
+              table_namer='',
+              **kwargs):
+    """
+    Run cleaning rules the way clean_dataset does, on a LocalClient
+
+    :param client: the LocalClient
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset
+    :param rules: a list of cleaning rule objects/functions as tuples
+    :param table_namer: source differentiator of the sandbox tables
+    :param kwargs: keyword arguments a cleaning rule may require
+    :return: list of the completed LocalQueryJobs, with their start and end
+        times so run_profiler can profile them
+    """
+    client.create_dataset(dataset_id, exists_ok=True)
+    client.create_dataset(sandbox_dataset_id, exists_ok=True)
+
+    all_jobs = []
+    for rule in rules:
+        query_function, setup_function, rule_info = clean_engine.infer_rule(
+            rule[0], client.project, dataset_id, sandbox_dataset_id,
+            table_namer, **kwargs)
+        setup_function(client)
+        jobs = clean_engine.run_queries(client, query_function(), rule_info)
+        LOGGER.info(f'{rule_info[cdr_consts.MODULE_NAME]} ran {len(jobs)} '
+                    f'local queries')
+        all_jobs.extend(jobs)
+    return all_jobs
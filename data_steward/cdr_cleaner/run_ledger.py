@@ -0,0 +1,229 @@
+"""
+Record the progress of a cleaning run so a failed run can be resumed.
+
+The ledger is a local SQLite file.  For each run of a list of rules on a
+dataset it stores the queries and rules which completed, along with the
+modification time of the tables each query wrote.  A resumed run skips the
+completed rules and queries after checking the tables were not modified
+outside the run.
+
+Example:
+    ledger = RunLedger('combined_cleaning.db')
+    run_id = ledger.get_unfinished_run(project_id, dataset_id,
+                                       sandbox_dataset_id, table_namer,
+                                       rule_names)
+"""
+# Python imports
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import datetime
+
+LOGGER = logging.getLogger(__name__)
+
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS run (
+  run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  project_id TEXT NOT NULL,
+  dataset_id TEXT NOT NULL,
+  sandbox_dataset_id TEXT NOT NULL,
+  table_namer TEXT,
+  rule_names TEXT NOT NULL,
+  started TEXT NOT NULL,
+  finished TEXT
+);
+CREATE TABLE IF NOT EXISTS completed_query (
+  run_id INTEGER NOT NULL REFERENCES run (run_id),
+  rule_no INTEGER NOT NULL,
+  query_no INTEGER NOT NULL,
+  query_hash TEXT NOT NULL,
+  job_id TEXT,
+  completed TEXT NOT NULL,
+  PRIMARY KEY (run_id, rule_no, query_no)
+);
+CREATE TABLE IF NOT EXISTS table_modified (
+  run_id INTEGER NOT NULL REFERENCES run (run_id),
+  table_id TEXT NOT NULL,
+  modified TEXT,
+  PRIMARY KEY (run_id, table_id)
+);
+CREATE TABLE IF NOT EXISTS completed_rule (
+  run_id INTEGER NOT NULL REFERENCES run (run_id),
+  rule_no INTEGER NOT NULL,
+  rule_name TEXT NOT NULL,
+  completed TEXT NOT NULL,
+  PRIMARY KEY (run_id, rule_no)
+);
+"""
+
+
+def get_query_hash(query):
+    """
+    Identify the text of a query
+
+    :param query: the query text
+    :return: hex digest of the query text
+    """
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+def _now():
+    """
+    Get the current UTC time as an ISO 8601 string
+    """
+    return datetime.utcnow().isoformat()
+
+
+class RunLedger(object):
+    """
+    Progress of cleaning runs, stored in a SQLite file
+    """
+
+    def __init__(self, path):
+        """
+        Open the ledger, creating it if needed
+
+        :param path: path of the SQLite file
+        """
+        self._path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(CREATE_TABLES)
+
+    @property
+    def path(self):
+        """
+        Get the path of the SQLite file.
+        """
+        return self._path
+
+    def close(self):
+        """
+        Close the SQLite connection.
+        """
+        self._conn.close()
+
+    def start_run(self, project_id, dataset_id, sandbox_dataset_id, table_namer,
+                  rule_names):
+        """
+        Record the start of a run
+
+        :param project_id: identifies the project
+        :param dataset_id: identifies the dataset to clean
+        :param sandbox_dataset_id: identifies the sandbox dataset
+        :param table_namer: source differentiator of the run
+        :param rule_names: list of the names of the rules, in run order
+        :return: identifier of the new run
+        """
+        with self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO run (project_id, dataset_id, sandbox_dataset_id, '
+                'table_namer, rule_names, started) VALUES (?, ?, ?, ?, ?, ?)',
+                (project_id, dataset_id, sandbox_dataset_id, table_namer,
+                 json.dumps(rule_names), _now()))
+        return cursor.lastrowid
+
+    def get_unfinished_run(self, project_id, dataset_id, sandbox_dataset_id,
+                           table_namer, rule_names):
+        """
+        Get the latest unfinished run of the same rules on the same dataset
+
+        :param project_id: identifies the project
+        :param dataset_id: identifies the dataset to clean
+        :param sandbox_dataset_id: identifies the sandbox dataset
+        :param table_namer: source differentiator of the run
+        :param rule_names: list of the names of the rules, in run order
+        :return: identifier of the run or None if there is none
+        """
+        row = self._conn.execute(
+            'SELECT run_id FROM run WHERE project_id = ? AND dataset_id = ? '
+            'AND sandbox_dataset_id = ? AND table_namer IS ? '
+            'AND rule_names = ? AND finished IS NULL '
+            'ORDER BY run_id DESC LIMIT 1',
+            (project_id, dataset_id, sandbox_dataset_id, table_namer,
+             json.dumps(rule_names))).fetchone()
+        return row[0] if row else None
+
+    def finish_run(self, run_id):
+        """
+        Record that all rules of a run completed
+
+        :param run_id: identifies the run
+        """
+        with self._conn:
+            self._conn.execute('UPDATE run SET finished = ? WHERE run_id = ?',
+                               (_now(), run_id))
+
+    def record_query(self, run_id, rule_no, query_no, query, job_id,
+                     tables_modified):
+        """
+        Record a completed query and the tables it wrote
+
+        :param run_id: identifies the run
+        :param rule_no: index of the rule in the run
+        :param query_no: index of the query in the rule's query list
+        :param query: the query text
+        :param job_id: identifies the BigQuery job which ran the query
+        :param tables_modified: dict mapping each table the query wrote to its
+            modification time, None if the table no longer exists
+        """
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO completed_query VALUES '
+                '(?, ?, ?, ?, ?, ?)', (run_id, rule_no, query_no,
+                                       get_query_hash(query), job_id, _now()))
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO table_modified VALUES (?, ?, ?)',
+                [(run_id, table_id, modified)
+                 for table_id, modified in tables_modified.items()])
+
+    def record_rule(self, run_id, rule_no, rule_name):
+        """
+        Record a rule whose queries all completed
+
+        :param run_id: identifies the run
+        :param rule_no: index of the rule in the run
+        :param rule_name: name of the rule
+        """
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO completed_rule VALUES (?, ?, ?, ?)',
+                (run_id, rule_no, rule_name, _now()))
+
+    def get_completed_rules(self, run_id):
+        """
+        Get the rules of a run whose queries all completed
+
+        :param run_id: identifies the run
+        :return: set of the indexes of the completed rules
+        """
+        rows = self._conn.execute(
+            'SELECT rule_no FROM completed_rule WHERE run_id = ?', (run_id,))
+        return {rule_no for rule_no, in rows}
+
+    def get_completed_queries(self, run_id, rule_no):
+        """
+        Get the completed queries of a rule
+
+        :param run_id: identifies the run
+        :param rule_no: index of the rule in the run
+        :return: dict mapping the index of each completed query to the hash
+            of its text
+        """
+        rows = self._conn.execute(
+            'SELECT query_no, query_hash FROM completed_query '
+            'WHERE run_id = ? AND rule_no = ?', (run_id, rule_no))
+        return dict(rows)
+
+    def get_tables_modified(self, run_id):
+        """
+        Get the tables written by a run
+
+        :param run_id: identifies the run
+        :return: dict mapping each table to its modification time after the
+            run last wrote it, None if the table no longer existed
+        """
+        rows = self._conn.execute(
+            'SELECT table_id, modified FROM table_modified WHERE run_id = ?',
+            (run_id,))
+        return dict(rows)
@@ -0,0 +1,310 @@
+"""
+Profile the BigQuery jobs of a cleaning run and compare the cost of rules
+between runs.
+
+The cleaning engine labels every job with the rule and query that ran it.
+The profile of a run has a row per job with its wall time, slot-ms, bytes
+processed and billed, and the rows it wrote to the dataset or to the sandbox.
+Queries the engine skipped get a row with their reason and no cost.
+Profiles are written to a CSV and can be appended to a BigQuery table.
+
+Comparing two profiles lists the rules whose cost grew by more than a
+threshold, e.g. to find the rule that got much slower after a vocabulary
+refresh:
+
+    python -m cdr_cleaner.run_profiler -b last_run.csv -c this_run.csv \
+        -m slot_ms -t 2
+"""
+# Python imports
+import argparse
+import csv
+import logging
+import os
+import tempfile
+from collections import defaultdict
+from datetime import datetime
+
+# Project imports
+from utils import bq
+import cdr_cleaner.clean_cdr_engine as engine
+from constants import bq_utils as bq_consts
+from constants.cdr_cleaner import clean_cdr_engine as ce_consts
+from constants.cdr_cleaner import run_profiler as profile_consts
+
+LOGGER = logging.getLogger(__name__)
+
+
+def get_rows_written(job):
+    """
+    Get the number of rows a query job wrote
+
+    :param job: a completed BigQuery query job
+    :return: rows affected by a DML statement, otherwise the rows written by
+        the last stage of the query plan
+    """
+    if job.num_dml_affected_rows is not None:
+        return job.num_dml_affected_rows
+    if job.query_plan:
+        return job.query_plan[-1].records_written or 0
+    return 0
+
+
+def get_job_profile(job, dataset_id, sandbox_dataset_id, run_id):
+    """
+    Get the statistics of a query job run by a cleaning rule
+
+    :param job: a completed BigQuery query job
+    :param dataset_id: identifies the dataset being cleaned
+    :param sandbox_dataset_id: identifies the sandbox dataset
+    :param run_id: identifies the cleaning run
+    :return: dict with a value for each of the profile fields
+    """
+    labels = job.labels or {}
+    wall_time = None
+    if job.started and job.ended:
+        wall_time = (job.ended - job.started).total_seconds()
+
+    destination = job.destination or job.ddl_target_table
+    rows = get_rows_written(job)
+    sandboxed = (destination is not None and
+                 destination.dataset_id == sandbox_dataset_id)
+
+    return {
+        profile_consts.RUN_ID: run_id,
+        profile_consts.DATASET_ID: dataset_id,
+        profile_consts.RULE: labels.get(ce_consts.CLEANING_RULE_LABEL),
+        profile_consts.QUERY_NO: labels.get(ce_consts.QUERY_NO_LABEL),
+        profile_consts.JOB_ID: job.job_id,
+        profile_consts.WALL_TIME_SECONDS: wall_time,
+        profile_consts.SLOT_MS: job.slot_millis,
+        profile_consts.BYTES_PROCESSED: job.total_bytes_processed,
+        profile_consts.BYTES_BILLED: job.total_bytes_billed,
+        profile_consts.ROWS_WRITTEN: 0 if sandboxed else rows,
+        profile_consts.ROWS_SANDBOXED: rows if sandboxed else 0,
+        profile_consts.SKIPPED_REASON: None
+    }
+
+
+def get_skipped_profile(skipped_query, dataset_id, run_id):
+    """
+    Get the profile of a query the engine skipped
+
+    :param skipped_query: dict with the rule, query_no and reason recorded by
+        clean_dataset
+    :param dataset_id: identifies the dataset being cleaned
+    :param run_id: identifies the cleaning run
+    :return: dict with a value for each of the profile fields, costing nothing
+    """
+    return {
+        profile_consts.RUN_ID: run_id,
+        profile_consts.DATASET_ID: dataset_id,
+        profile_consts.RULE: skipped_query[ce_consts.SKIPPED_RULE],
+        profile_consts.QUERY_NO: str(skipped_query[ce_consts.SKIPPED_QUERY_NO]),
+        profile_consts.JOB_ID: None,
+        profile_consts.WALL_TIME_SECONDS: 0,
+        profile_consts.SLOT_MS: 0,
+        profile_consts.BYTES_PROCESSED: 0,
+        profile_consts.BYTES_BILLED: 0,
+        profile_consts.ROWS_WRITTEN: 0,
+        profile_consts.ROWS_SANDBOXED: 0,
+        profile_consts.SKIPPED_REASON: skipped_query[ce_consts.SKIPPED_REASON]
+    }
+
+
+def get_run_profile(jobs,
+                    dataset_id,
+                    sandbox_dataset_id,
+                    run_id=None,
+                    skipped=None):
+    """
+    Get the statistics of all query jobs of a cleaning run
+
+    :param jobs: list of completed BigQuery jobs returned by clean_dataset
+    :param dataset_id: identifies the dataset being cleaned
+    :param sandbox_dataset_id: identifies the sandbox dataset
+    :param run_id: identifies the cleaning run, defaults to the current time
+    :param skipped: list of the queries clean_dataset skipped
+    :return: list of job profiles, followed by the skipped queries
+    """
+    run_id = run_id or datetime.utcnow().isoformat()
+    profile = [
+        get_job_profile(job, dataset_id, sandbox_dataset_id, run_id)
+        for job in jobs
+    ]
+    profile.extend(
+        get_skipped_profile(skipped_query, dataset_id, run_id)
+        for skipped_query in skipped or [])
+    return profile
+
+
+def write_profile_csv(output_filepath, profile):
+    """
+    Write the profile of a run to a csv file
+
+    :param output_filepath: the filepath of a csv file
+    :param profile: list of job profiles
+    """
+    with open(output_filepath, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile,
+                                profile_consts.PROFILE_FIELDS,
+                                lineterminator=os.linesep)
+        writer.writeheader()
+        writer.writerows(profile)
+
+
+def read_profile_csv(input_filepath):
+    """
+    Read the profile of a run from a csv file
+
+    :param input_filepath: the filepath of a csv file written by
+        write_profile_csv
+    :return: list of job profiles, the cost metrics as floats
+    """
+    with open(input_filepath, newline='') as csvfile:
+        profile = list(csv.DictReader(csvfile))
+
+    for job_profile in profile:
+        for metric in profile_consts.COST_METRICS:
+            value = job_profile.get(metric)
+            job_profile[metric] = float(value) if value else None
+    return profile
+
+
+def load_profile_table(client, sandbox_dataset_id, table_name, profile):
+    """
+    Append the profile of a run to a BigQuery table
+
+    :param client: a BigQuery client object
+    :param sandbox_dataset_id: identifies the dataset of the profile table
+    :param table_name: name of the profile table
+    :param profile: list of job profiles
+    :return: the result of the load job
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        csv_path = os.path.join(temp_dir, f'{table_name}.csv')
+        write_profile_csv(csv_path, profile)
+        return bq.upload_csv_data_to_bq_table(client, sandbox_dataset_id,
+                                              table_name, csv_path,
+                                              bq_consts.WRITE_APPEND)
+
+
+def get_rule_costs(profile, metric=profile_consts.DEFAULT_METRIC):
+    """
+    Sum a cost metric over the jobs of each rule
+
+    :param profile: list of job profiles
+    :param metric: the profile field to sum
+    :return: dict mapping each rule to its total cost
+    """
+    costs = defaultdict(float)
+    for job_profile in profile:
+        costs[job_profile[profile_consts.RULE]] += job_profile[metric] or 0
+    return dict(costs)
+
+
+def compare_profiles(baseline,
+                     current,
+                     metric=profile_consts.DEFAULT_METRIC,
+                     threshold=profile_consts.DEFAULT_THRESHOLD):
+    """
+    Find the rules whose cost grew by more than a threshold between two runs
+
+    Rules that ran in only one of the runs are not compared.
+
+    :param baseline: list of job profiles of the earlier run
+    :param current: list of job profiles of the later run
+    :param metric: the cost metric to compare
+    :param threshold: ratio of the current to the baseline cost above which
+        a rule is reported
+    :return: list of dicts with the rule, its baseline and current cost and
+        their ratio, the largest ratio first
+    """
+    baseline_costs = get_rule_costs(baseline, metric)
+    current_costs = get_rule_costs(current, metric)
+
+    regressions = []
+    for rule, current_cost in current_costs.items():
+        if rule not in baseline_costs:
+            continue
+        baseline_cost = baseline_costs[rule]
+        if baseline_cost:
+            ratio = current_cost / baseline_cost
+        else:
+            ratio = float('inf') if current_cost else 1.0
+        if ratio > threshold:
+            regressions.append({
+                profile_consts.RULE: rule,
+                profile_consts.BASELINE: baseline_cost,
+                profile_consts.CURRENT: current_cost,
+                profile_consts.RATIO: ratio
+            })
+    return sorted(regressions,
+                  key=lambda regression: regression[profile_consts.RATIO],
+                  reverse=True)
+
+
+def get_parser():
+    """
+    Create a parser for comparing two run profiles
+
+    :return: parser
+    """
+    parser = argparse.ArgumentParser(
+        description='Report the cleaning rules whose cost grew between runs')
+    parser.add_argument('-b',
+                        '--baseline',
+                        dest='baseline',
+                        action='store',
+                        required=True,
+                        help='Profile csv of the earlier run')
+    parser.add_argument('-c',
+                        '--current',
+                        dest='current',
+                        action='store',
+                        required=True,
+                        help='Profile csv of the later run')
+    parser.add_argument('-m',
+                        '--metric',
+                        dest='metric',
+                        action='store',
+                        choices=profile_consts.COST_METRICS,
+                        default=profile_consts.DEFAULT_METRIC,
+                        help='Cost metric to compare')
+    parser.add_argument('-t',
+                        '--threshold',
+                        dest='threshold',
+                        action='store',
+                        type=float,
+                        default=profile_consts.DEFAULT_THRESHOLD,
+                        help=('Report rules whose cost grew by more than this '
+                              'factor'))
+    return parser
+
+
+def main(raw_args=None):
+    """
+    Compare two run profiles and log the rules whose cost grew
+
+    :param raw_args: The list of arguments to parse.  Defaults to parsing the
+        command line.
+    :return: list of the regressions found
+    """
+    args = get_parser().parse_args(raw_args)
+    engine.add_console_logging()
+
+    regressions = compare_profiles(read_profile_csv(args.baseline),
+                                   read_profile_csv(args.current), args.metric,
+                                   args.threshold)
+    for regression in regressions:
+        LOGGER.warning(
+            f'{regression[profile_consts.RULE]}: {args.metric} grew from '
+            f'{regression[profile_consts.BASELINE]:.0f} to '
+            f'{regression[profile_consts.CURRENT]:.0f} '
+            f'({regression[profile_consts.RATIO]:.1f}x)')
+    LOGGER.info(f'{len(regressions)} rule(s) grew by more than '
+                f'{args.threshold}x in {args.metric}')
+    return regressions
+
+
+if __name__ == '__main__':
+    main()
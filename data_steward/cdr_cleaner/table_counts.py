@@ -0,0 +1,129 @@
+"""
+Count the rows of tables from the dataset metadata.
+
+The row count and modification time of every table in a dataset come from a
+single read of its __TABLES__ metadata instead of a COUNT(*) job per table.
+The counts of a dataset are cached until the cleaning engine runs a query
+which writes one of its tables, so a rule can count its tables before and
+after it runs without running queries of its own.
+
+The row counts of __TABLES__ are exact for tables written by query jobs.
+Rows still in a streaming buffer are not counted.
+
+Example:
+    initial_counts = table_counts.get_table_counts(client, dataset_id,
+                                                   ['observation'])
+    ...
+    deltas = table_counts.get_count_deltas(client, dataset_id, initial_counts)
+"""
+# Python imports
+import logging
+import threading
+
+# Project imports
+from constants.cdr_cleaner import clean_cdr_engine as ce_consts
+
+LOGGER = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# (project, dataset) -> {table_id: {row_count, last_modified}}
+_dataset_stats = {}
+# incremented when the cache changes, so a read which overlaps the
+# invalidation of its dataset is not cached
+_generation = 0
+
+
+def get_table_stats(client, dataset_id):
+    """
+    Get the row count and modification time of every table in a dataset
+
+    The dataset metadata is read once and cached until a table of the dataset
+    is invalidated.
+
+    :param client: BigQuery client
+    :param dataset_id: identifies the dataset
+    :return: dict mapping each table name to a dict with its row_count and
+        last_modified time
+    """
+    key = (client.project, dataset_id)
+    with _lock:
+        if key in _dataset_stats:
+            return _dataset_stats[key]
+        generation = _generation
+
+    query = ce_consts.TABLE_STATS_QUERY.render(project=client.project,
+                                               dataset=dataset_id)
+    table_stats = {
+        row['table_id']: {
+            ce_consts.ROW_COUNT: row[ce_consts.ROW_COUNT],
+            ce_consts.LAST_MODIFIED: row[ce_consts.LAST_MODIFIED]
+        } for row in client.query(query).result()
+    }
+    LOGGER.debug(f'Read the row counts of {len(table_stats)} tables in '
+                 f'{client.project}.{dataset_id}')
+
+    with _lock:
+        if generation == _generation:
+            _dataset_stats[key] = table_stats
+    return table_stats
+
+
+def get_table_counts(client, dataset_id, tables):
+    """
+    Get the row counts of tables in a dataset
+
+    :param client: BigQuery client
+    :param dataset_id: identifies the dataset
+    :param tables: list of table names
+    :return: dict with table name as key and row count as value, 0 for tables
+        which do not exist
+    """
+    table_stats = get_table_stats(client, dataset_id)
+    return {
+        table:
+            table_stats[table][ce_consts.ROW_COUNT]
+            if table in table_stats else 0 for table in tables
+    }
+
+
+def get_count_deltas(client, dataset_id, initial_counts):
+    """
+    Get the change in the row counts of tables since they were counted
+
+    :param client: BigQuery client
+    :param dataset_id: identifies the dataset
+    :param initial_counts: dict returned by get_table_counts
+    :return: dict with table name as key and the rows added, or removed if
+        negative, as value
+    """
+    final_counts = get_table_counts(client, dataset_id, list(initial_counts))
+    return {
+        table: final_counts[table] - initial_count
+        for table, initial_count in initial_counts.items()
+    }
+
+
+def invalidate(written_tables):
+    """
+    Forget the counts of the datasets of tables which were written
+
+    :param written_tables: set of the tables written, as 'dataset.table' or
+        'dataset.*', or None if the tables are not known
+    """
+    global _generation
+    with _lock:
+        _generation += 1
+        if written_tables is None:
+            _dataset_stats.clear()
+            return
+        written_datasets = {table.split('.')[0] for table in written_tables}
+        for key in list(_dataset_stats):
+            if key[1] in written_datasets:
+                del _dataset_stats[key]
+
+
+def clear():
+    """
+    Forget the counts of all datasets
+    """
+    invalidate(None)
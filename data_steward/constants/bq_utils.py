@@ -2,6 +2,15 @@
 SOCKET_TIMEOUT = 600000
 BQ_DEFAULT_RETRY_COUNT = 10
 MAX_POLL_INTERVAL = 500
+MIN_POLL_INTERVAL = 0.25
+# Poll again after this fraction of the age of the youngest outstanding job
+POLL_BACKOFF_FRACTION = 0.25
+# Maximum number of jobs.get calls sent in one batch HTTP request
+JOB_STATUS_BATCH_SIZE = 50
+# HTTP statuses of errors which may not recur when the request is retried
+TRANSIENT_HTTP_STATUSES = (429, 500, 502, 503, 504)
+# Longest wait in seconds before resending a failed batch request
+MAX_RETRY_SLEEP = 32
 # Maximum results returned by list_tables (API has a low default value)
 LIST_TABLES_MAX_RESULTS = 10000
 DATE_FORMAT = '%Y%m%d'
@@ -34,6 +43,11 @@ FIELDS = 'fields'
 DATASET_REF = 'datasetReference'
 DATASET_ID = 'datasetId'
 
+# Column formats of query result batches
+LIST_COLUMNS = 'list'
+NUMPY_COLUMNS = 'numpy'
+COLUMN_FORMATS = [LIST_COLUMNS, NUMPY_COLUMNS]
+
 # BigQuery API expected strings
 TRUE = 'true'
 FALSE = 'false'
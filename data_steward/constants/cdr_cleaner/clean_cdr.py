@@ -29,6 +29,9 @@ RETRY_COUNT = 'retry_count'
 DISPOSITION = 'write_disposition'
 DESTINATION_DATASET = 'destination_dataset_id'
 BATCH = 'batch'
+# tables of the cleaned dataset the query changes nothing without, the engine
+# may skip the query when all of them are empty
+SKIP_IF_EMPTY = 'skip_if_empty'
 PROCEDURE_OCCURRENCE = 'procedure_occurrence'
 QUALIFIER_SOURCE_VALUE = 'qualifier_source_value'
 
@@ -53,3 +53,73 @@ The failed query ran with the following configuration:
 """
 
 FAILURE_MESSAGE_TEMPLATE = JINJA_ENV.from_string(FAILURE_MESSAGE)
+
+# Upper bound on rules and BigQuery jobs the engine runs at the same time
+# when it is asked to run a stage in parallel
+MAX_WORKERS = 8
+
+# Composes the full table rewrites of consecutive rules into one query.  Each
+# step reads the table as rewritten by the step before it.
+FUSED_STEP = 'fused_step_{step_no}'
+FUSED_REWRITE_QUERY = JINJA_ENV.from_string("""
+WITH
+{% for step_query in step_queries %}
+  fused_step_{{loop.index}} AS (
+{{step_query}}
+  ){{ ',' if not loop.last else '' }}
+{% endfor %}
+SELECT * FROM fused_step_{{step_queries|length}}
+""")
+
+# Sandbox table holding the fused output when verifying a fused rewrite
+FUSED_CHECK_TABLE = '{table}_fused_check'
+
+# Counts the rows whose multiplicity differs between two tables
+FUSED_DIFF_QUERY = JINJA_ENV.from_string("""
+WITH
+  sequential AS (
+    SELECT TO_JSON_STRING(t) AS row_json, COUNT(*) AS row_count
+    FROM `{{project}}.{{dataset}}.{{table}}` AS t
+    GROUP BY row_json
+  ),
+  fused AS (
+    SELECT TO_JSON_STRING(t) AS row_json, COUNT(*) AS row_count
+    FROM `{{project}}.{{sandbox_dataset}}.{{fused_table}}` AS t
+    GROUP BY row_json
+  )
+SELECT COUNT(*) AS diff_count
+FROM sequential
+FULL OUTER JOIN fused
+USING (row_json)
+WHERE sequential.row_count IS DISTINCT FROM fused.row_count
+""")
+
+# Keys of the per rule dry run report
+DRY_RUN_RULE = 'rule'
+DRY_RUN_QUERY_COUNT = 'query_count'
+DRY_RUN_BYTES_PROCESSED = 'bytes_processed'
+DRY_RUN_REFERENCED_TABLES = 'referenced_tables'
+DRY_RUN_ERRORS = 'errors'
+DRY_RUN_CREATED_EARLIER = 'created_earlier'
+
+# Labels identifying the rule and query of each cleaning job, see run_profiler
+CLEANING_RULE_LABEL = 'cleaning_rule'
+QUERY_NO_LABEL = 'query_no'
+# BigQuery label values are at most 63 lowercase letters, digits, _ or -
+MAX_LABEL_LENGTH = 63
+
+# Row counts and modification times of all tables of a dataset in one query
+TABLE_STATS_QUERY = JINJA_ENV.from_string("""
+SELECT
+  table_id,
+  row_count,
+  TIMESTAMP_MILLIS(last_modified_time) AS last_modified
+FROM `{{project}}.{{dataset}}.__TABLES__`
+""")
+ROW_COUNT = 'row_count'
+LAST_MODIFIED = 'last_modified'
+
+# Keys of the record of a query skipped because its tables are empty
+SKIPPED_RULE = 'rule'
+SKIPPED_QUERY_NO = 'query_no'
+SKIPPED_REASON = 'reason'
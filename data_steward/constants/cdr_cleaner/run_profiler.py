@@ -0,0 +1,34 @@
+"""
+Constants for profiling the queries of a cleaning run.
+"""
+RUN_ID = 'run_id'
+DATASET_ID = 'dataset_id'
+RULE = 'rule'
+QUERY_NO = 'query_no'
+JOB_ID = 'job_id'
+WALL_TIME_SECONDS = 'wall_time_seconds'
+SLOT_MS = 'slot_ms'
+BYTES_PROCESSED = 'bytes_processed'
+BYTES_BILLED = 'bytes_billed'
+ROWS_WRITTEN = 'rows_written'
+ROWS_SANDBOXED = 'rows_sandboxed'
+SKIPPED_REASON = 'skipped_reason'
+
+PROFILE_FIELDS = [
+    RUN_ID, DATASET_ID, RULE, QUERY_NO, JOB_ID, WALL_TIME_SECONDS, SLOT_MS,
+    BYTES_PROCESSED, BYTES_BILLED, ROWS_WRITTEN, ROWS_SANDBOXED, SKIPPED_REASON
+]
+
+# Profile fields which can be compared between runs
+COST_METRICS = [
+    WALL_TIME_SECONDS, SLOT_MS, BYTES_PROCESSED, BYTES_BILLED, ROWS_WRITTEN,
+    ROWS_SANDBOXED
+]
+
+DEFAULT_METRIC = SLOT_MS
+DEFAULT_THRESHOLD = 2.0
+
+# Keys of a regression found by comparing two runs
+BASELINE = 'baseline'
+CURRENT = 'current'
+RATIO = 'ratio'
@@ -1 +1,8 @@
 MAX_AGE = 89
+
+# lookup tables deid creates in the input dataset
+CONCEPT_ID_SUPPRESSION_TABLE = '_concept_ids_suppression'
+ALLOWED_STATES_TABLE = '_mapping_src_hpos_to_allowed_states'
+PERSON_SRC_HPO_TABLE = '_mapping_person_src_hpos'
+# label of a lookup table with the fingerprint of the inputs it was built from
+FINGERPRINT_LABEL = 'deid_lookup_fingerprint'
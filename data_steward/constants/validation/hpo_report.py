@@ -13,6 +13,7 @@ ERROR_OCCURRED_REPORT_KEY = 'error_occurred'
 COMPLETENESS_REPORT_KEY = 'completeness'
 LAB_CONCEPT_METRICS_REPORT_KEY = 'lab_concept_metrics'
 MISSING_PII_KEY = 'missing_pii'
+METRIC_LATENCY_REPORT_KEY = 'metric_latency'
 REPORT_KEYS = [
     HPO_NAME_REPORT_KEY, FOLDER_REPORT_KEY, TIMESTAMP_REPORT_KEY,
     RESULTS_REPORT_KEY, ERRORS_REPORT_KEY, WARNINGS_REPORT_KEY,
@@ -15,6 +15,14 @@ RESULT_PASS_CODE = '&#x2714'
 RESULT_FAIL_COLOR = 'red'
 RESULT_PASS_COLOR = 'green'
 
+# number of sites validated at the same time by ValidateAllHpoFiles
+VALIDATION_WORKERS_ENV = 'VALIDATION_WORKERS'
+DEFAULT_VALIDATION_WORKERS = 8
+# number of tables created at the same time for a submission
+TABLE_CREATION_WORKERS = 8
+# number of metric queries run at the same time for a submission
+METRICS_WORKERS = 6
+
 # datetime format
 DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S %Z'
 
@@ -225,6 +225,8 @@ class GCPStackDriverLogger(object):
 
         self._buffer_size = buffer_size
         self._buffer = collections.deque()
+        # worker threads of a request may share this object, see set_gcp_logger
+        self._lock = threading.RLock()
 
         self._reset()
 
@@ -301,23 +303,24 @@ class GCPStackDriverLogger(object):
         Capture and store a log event record.
         :param record: Python log record
         """
-        self._buffer.appendleft(record)
+        with self._lock:
+            self._buffer.appendleft(record)
 
-        if not self._first_log_ts:
-            self._first_log_ts = datetime.utcnow()
+            if not self._first_log_ts:
+                self._first_log_ts = datetime.utcnow()
 
-        if len(self._buffer) >= self._buffer_size:
-            if self.log_completion_status == LogCompletionStatusEnum.COMPLETE:
-                self.log_completion_status = LogCompletionStatusEnum.PARTIAL_BEGIN
-                self._operation_pb2 = update_long_operation(
-                    self._request_log_id, self.log_completion_status)
+            if len(self._buffer) >= self._buffer_size:
+                if self.log_completion_status == LogCompletionStatusEnum.COMPLETE:
+                    self.log_completion_status = LogCompletionStatusEnum.PARTIAL_BEGIN
+                    self._operation_pb2 = update_long_operation(
+                        self._request_log_id, self.log_completion_status)
 
-            elif self.log_completion_status == LogCompletionStatusEnum.PARTIAL_BEGIN:
-                self.log_completion_status = LogCompletionStatusEnum.PARTIAL_MORE
-                self._operation_pb2 = update_long_operation(
-                    self._request_log_id, self.log_completion_status)
+                elif self.log_completion_status == LogCompletionStatusEnum.PARTIAL_BEGIN:
+                    self.log_completion_status = LogCompletionStatusEnum.PARTIAL_MORE
+                    self._operation_pb2 = update_long_operation(
+                        self._request_log_id, self.log_completion_status)
 
-            self.publish_to_stackdriver()
+                self.publish_to_stackdriver()
 
     def finalize(self, _response=None, _request=None):
         """
@@ -451,6 +454,20 @@ def get_gcp_logger() -> GCPStackDriverLogger:
         return _logger
 
 
+def set_gcp_logger(_logger):
+    """
+    Use the GCPStackDriverLogger of another thread in this thread
+
+    Lets worker threads started while handling a request log to the request's
+    operation rather than to a logger of their own, e.g. as the `initializer`
+    of a ThreadPoolExecutor.
+    :param _logger: GCPStackDriverLogger returned by get_gcp_logger in the
+        request thread, None if not running in App Engine
+    """
+    if _logger:
+        setattr(_thread_store, 'logger', _logger)
+
+
 class GCPLoggingHandler(logging.Handler):
 
     def emit(self, record: logging.LogRecord):
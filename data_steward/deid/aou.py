@@ -76,12 +76,10 @@ DESIGN:
 import json
 import logging
 import os
-import time
 from copy import copy
 from datetime import datetime
 
 # Third party imports
-import numpy as np
 import pandas as pd
 from google.cloud import bigquery as bq
 from google.oauth2 import service_account
@@ -89,14 +87,31 @@ from google.oauth2 import service_account
 # Project imports
 import bq_utils
 import constants.bq_utils as bq_consts
-from constants.deid.deid import MAX_AGE
+from cdr_cleaner import table_counts
+from constants.deid.deid import (MAX_AGE, CONCEPT_ID_SUPPRESSION_TABLE,
+                                 ALLOWED_STATES_TABLE, PERSON_SRC_HPO_TABLE)
+from deid import execution
+from deid.lookups import LookupManager, get_file_inputs, get_table_inputs
 from deid.parser import parse_args
 from deid.press import Press
-from resources import DEID_PATH
-from tools.concept_ids_suppression import get_all_concept_ids
+from resources import DEID_PATH, fields_for
+from tools.concept_ids_suppression import (get_all_concept_ids,
+                                           COVID_CONCEPT_IDS_QUERY)
 
 LOGGER = logging.getLogger(__name__)
 
+INTERNAL_TABLES_PATH = os.path.join(DEID_PATH, 'config', 'internal_tables')
+CONCEPT_ID_SUPPRESSION_PATH = os.path.join(INTERNAL_TABLES_PATH,
+                                           'concept_ids_suppression_files')
+ALLOWED_STATES_CSV = os.path.join(INTERNAL_TABLES_PATH,
+                                  'src_hpos_to_allowed_states.csv')
+MAPPING_PREFIX = '_mapping_'
+PERSON_SRC_HPO_QUERY = ("select person_id, src_hpo_id "
+                        "from {input_dataset}._mapping_{table} "
+                        "join {input_dataset}.{table} "
+                        "using ({table}_id) "
+                        "where src_hpo_id not like 'rdr'")
+
 
 def milliseconds_since_epoch():
     """
@@ -115,12 +130,8 @@ def create_person_id_src_hpo_map(input_dataset, credentials):
     :param input_dataset:  the input dataset to deid
     :param credentidals:  the credentials needed to create a new table.
     """
-    map_tablename = "_mapping_person_src_hpos"
-    sql = ("select person_id, src_hpo_id "
-           "from {input_dataset}._mapping_{table} "
-           "join {input_dataset}.{table} "
-           "using ({table}_id) "
-           "where src_hpo_id not like 'rdr'")
+    map_tablename = PERSON_SRC_HPO_TABLE
+    sql = PERSON_SRC_HPO_QUERY
 
     # list dataset contents
     dataset_tables = bq_utils.list_dataset_contents(input_dataset)
@@ -184,10 +195,8 @@ def create_allowed_states_table(input_dataset, credentials):
     Create a mapping table of src_hpos to states they are located in.
     """
 
-    map_tablename = input_dataset + "._mapping_src_hpos_to_allowed_states"
-    data = pd.read_csv(
-        os.path.join(DEID_PATH, 'config', 'internal_tables',
-                     'src_hpos_to_allowed_states.csv'))
+    map_tablename = f'{input_dataset}.{ALLOWED_STATES_TABLE}'
+    data = pd.read_csv(ALLOWED_STATES_CSV)
 
     # write this to bigquery.
     data.to_gbq(map_tablename, credentials=credentials, if_exists='replace')
@@ -201,7 +210,7 @@ def create_concept_id_lookup_table(input_dataset, credentials):
     :param credentials: bigquery credentials
     """
 
-    lookup_tablename = input_dataset + "._concept_ids_suppression"
+    lookup_tablename = f'{input_dataset}.{CONCEPT_ID_SUPPRESSION_TABLE}'
     columns = [
         'vocabulary_id', 'concept_code', 'concept_name', 'concept_id',
         'domain_id', 'rule', 'question'
@@ -215,14 +224,62 @@ def create_concept_id_lookup_table(input_dataset, credentials):
     data.to_gbq(lookup_tablename, credentials=credentials, if_exists='replace')
 
 
+def create_lookup_tables(input_dataset, credentials, tablename, lookups):
+    """
+    Create the lookup tables deid reads for a table.
+
+    A lookup table is only built if it was not built from the same inputs
+    before, see deid.lookups.
+
+    :param input_dataset:  the input dataset to deid
+    :param credentials:  the credentials needed to create the tables
+    :param tablename:  the table to deid
+    :param lookups:  the LookupManager of the run
+    """
+    client = bq.Client(credentials=credentials)
+
+    suppression_files = [
+        os.path.join(CONCEPT_ID_SUPPRESSION_PATH, file)
+        for file in os.listdir(CONCEPT_ID_SUPPRESSION_PATH)
+    ]
+    lookups.ensure(
+        client, f'{input_dataset}.{CONCEPT_ID_SUPPRESSION_TABLE}',
+        get_file_inputs(suppression_files) + [COVID_CONCEPT_IDS_QUERY] +
+        get_table_inputs(client, input_dataset,
+                         ['concept', 'concept_ancestor']),
+        lambda: create_concept_id_lookup_table(input_dataset, credentials))
+
+    # only need to create these tables deidentifying the observation table
+    if 'observation' not in tablename.lower().split('.'):
+        return
+
+    lookups.ensure(
+        client, f'{input_dataset}.{ALLOWED_STATES_TABLE}',
+        get_file_inputs([ALLOWED_STATES_CSV]),
+        lambda: create_allowed_states_table(input_dataset, credentials))
+
+    table_stats = table_counts.get_table_stats(client, input_dataset)
+    mapped_tables = [
+        table[len(MAPPING_PREFIX):]
+        for table in table_stats
+        if table.startswith(MAPPING_PREFIX) and
+        table[len(MAPPING_PREFIX):] in table_stats
+    ]
+    mapping_tables = [MAPPING_PREFIX + table for table in mapped_tables]
+    lookups.ensure(
+        client, f'{input_dataset}.{PERSON_SRC_HPO_TABLE}',
+        [PERSON_SRC_HPO_QUERY] +
+        get_table_inputs(client, input_dataset, mapped_tables + mapping_tables),
+        lambda: create_person_id_src_hpo_map(input_dataset, credentials))
+
+
 class AOU(Press):
 
     def __init__(self, **args):
         args['store'] = 'bigquery'
         Press.__init__(self, **args)
         self.private_key = args.get('private_key', '')
-        self.credentials = service_account.Credentials.from_service_account_file(
-            self.private_key)
+        self.credentials = self.get_credentials()
         self.partition = args.get('cluster', False)
         self.priority = args.get('interactive', 'BATCH')
 
@@ -237,6 +294,13 @@ class AOU(Press):
                 json.dumps(self.deid_rules['shift']).replace(
                     ":SHIFT", shift_days))
 
+    def get_credentials(self):
+        """
+        Load the service account credentials from the private key file
+        """
+        return service_account.Credentials.from_service_account_file(
+            self.private_key)
+
     def initialize(self, **args):
         Press.initialize(self, **args)
         LOGGER.info(f"BEGINNING de-identification on table:\t{self.tablename}")
@@ -249,13 +313,10 @@ class AOU(Press):
 
         map_table = pd.DataFrame()
 
-        # Create concept_id lookup table for suppressions
-        create_concept_id_lookup_table(self.idataset, self.credentials)
-
-        # only need to create these tables deidentifying the observation table
-        if 'observation' in self.get_tablename().lower().split('.'):
-            create_allowed_states_table(self.idataset, self.credentials)
-            create_person_id_src_hpo_map(self.idataset, self.credentials)
+        # Create the lookup tables for suppressions, once for all tables
+        lookups = args.get('lookups') or LookupManager()
+        create_lookup_tables(self.idataset, self.credentials,
+                             self.get_tablename(), lookups)
 
         # ensure mapping table only contains participants within age limits
         sql = (f"SELECT DISTINCT p.person_id, "
@@ -482,15 +543,10 @@ class AOU(Press):
         """
         dml = False if dml is None else dml
         table_name = self.get_tablename()
-        client = bq.Client.from_service_account_json(self.private_key)
+        client = execution.get_client(self.private_key)
         #
         # Let's make sure the out dataset exists
-        datasets = list(client.list_datasets())
-        found = np.sum(
-            [1 for dataset in datasets if dataset.dataset_id == self.odataset])
-        if not found:
-            dataset = bq.Dataset(client.dataset(self.odataset))
-            client.create_dataset(dataset)
+        execution.ensure_dataset(client, self.odataset)
 
         # create the output table
         if create:
@@ -565,36 +621,96 @@ class AOU(Press):
         """
         LOGGER.info(
             f"sleeping for table:\t{self.get_tablename()}\t\tjob_id:\t{job_id}")
-        status = 'NONE'
+        status = execution.wait_for_job(client, job_id).state
 
-        while True:
-            status = client.get_job(job_id).state
+        LOGGER.info(f"awake.  status is:\t{status}")
 
-            if status == 'DONE':
-                break
-            else:
-                time.sleep(5)
 
-        LOGGER.info(f"awake.  status is:\t{status}")
+class CompiledAOU(AOU):
+    """
+    Build the de-identification SQL of a table without BigQuery
 
+    Table columns come from the schemas in resources.fields_for, and the
+    statements are collected rather than submitted.  Lookup tables are not
+    created and the age limits of the _deid_map table are not checked.
+    """
 
-def main(raw_args=None):
+    def __init__(self, **args):
+        args['action'] = 'submit'
+        AOU.__init__(self, **args)
+        self.statements = []
+
+    def get_credentials(self):
+        return None
+
+    def initialize(self, **args):
+        Press.initialize(self, **args)
+        return True
+
+    def get_table_columns(self, tablename):
+        """
+        Return a list of columns for the given table name from its schema.
+        """
+        return [field.get('name') for field in fields_for(tablename)]
+
+    def get_dataframe(self, sql=None, limit=None, query_config=None):
+        return pd.DataFrame()
+
+    def submit(self, sql, create, dml=None):
+        """
+        Collect a statement instead of submitting it.
+        """
+        self.statements.append(sql)
+
+
+def compile_table(**args):
     """
-    Run the de-identifying software.
+    Build the de-identification SQL of a table without BigQuery
 
-    Entry point for de-identification.  Setting the main this way allows the
-    module to run as a stand alone script or as part of the pipeline.
+    :param args: the arguments deid runs with, see deid.parser.parse_args
+    :return: list of the statements deid would submit, in order
+    """
+    handle = CompiledAOU(**args)
+    handle.initialize(age_limit=args.get('age_limit'))
+    handle.do()
+    return handle.statements
+
+
+def initialize_table(raw_args=None, lookups=None):
+    """
+    Create and initialize the de-identifying software for a table.
+
+    The lookup tables deid reads are created in the input dataset, so tables
+    should be initialized one at a time.
+
+    :param raw_args: the command line arguments, see deid.parser.parse_args
+    :param lookups: the LookupManager shared by the tables of a run, so the
+        lookup tables are built once per run
+    :return: the initialized AOU handle, or None if it could not be
+        initialized
     """
     sys_args = parse_args(raw_args)
 
     handle = AOU(**sys_args)
 
-    if handle.initialize(age_limit=sys_args.get('age_limit')):
+    if handle.initialize(age_limit=sys_args.get('age_limit'), lookups=lookups):
+        return handle
+
+    LOGGER.error(f"Unable to initialize process.  Check _deid_map table "
+                 f"contents against {sys_args.get('idataset')}.person contents")
+    return None
+
+
+def main(raw_args=None):
+    """
+    Run the de-identifying software.
+
+    Entry point for de-identification.  Setting the main this way allows the
+    module to run as a stand alone script or as part of the pipeline.
+    """
+    handle = initialize_table(raw_args)
+    if handle:
         handle.do()
-    else:
-        LOGGER.error(
-            f"Unable to initialize process.  Check _deid_map table "
-            f"contents against {sys_args.get('idataset')}.person contents")
 
 
 if __name__ == '__main__':
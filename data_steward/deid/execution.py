@@ -0,0 +1,92 @@
+"""
+Run the jobs of deid with shared BigQuery clients.
+
+Deid submits several statements for every table.  The BigQuery client of a
+service account is created once and shared by all of them, the output
+dataset is checked once per run instead of listing every dataset of the
+project per statement, and jobs are polled with a delay which grows from
+WAIT_MIN_SECONDS to WAIT_MAX_SECONDS, so short jobs are not held up by a
+fixed sleep.
+"""
+# Python imports
+import logging
+import threading
+import time
+
+# Third party imports
+from google.cloud import bigquery as bq
+from google.cloud.exceptions import NotFound
+
+LOGGER = logging.getLogger(__name__)
+
+WAIT_MIN_SECONDS = 0.5
+WAIT_MAX_SECONDS = 5
+WAIT_BACKOFF = 1.5
+
+_lock = threading.Lock()
+# private key file -> client
+_clients = {}
+# (project, dataset_id) of the datasets known to exist
+_datasets = set()
+
+
+def get_client(private_key):
+    """
+    Get the BigQuery client of a service account, created once per run
+
+    :param private_key: path of the service account key file
+    :return: the BigQuery client
+    """
+    with _lock:
+        if private_key not in _clients:
+            _clients[private_key] = bq.Client.from_service_account_json(
+                private_key)
+        return _clients[private_key]
+
+
+def ensure_dataset(client, dataset_id):
+    """
+    Create a dataset if it does not exist, checking once per run
+
+    :param client: BigQuery client
+    :param dataset_id: identifies the dataset
+    """
+    key = (client.project, dataset_id)
+    with _lock:
+        if key in _datasets:
+            return
+    # other threads are not held up by the requests, at worst a dataset is
+    # checked more than once
+    try:
+        client.get_dataset(dataset_id)
+    except NotFound:
+        client.create_dataset(bq.Dataset(f'{client.project}.{dataset_id}'),
+                              exists_ok=True)
+    with _lock:
+        _datasets.add(key)
+
+
+def wait_for_job(client, job_id):
+    """
+    Wait for a job to finish, polling with a growing delay
+
+    :param client: BigQuery client
+    :param job_id: identifies the job
+    :return: the finished job
+    """
+    delay = WAIT_MIN_SECONDS
+    while True:
+        job = client.get_job(job_id)
+        if job.state == 'DONE':
+            return job
+        time.sleep(delay)
+        delay = min(delay * WAIT_BACKOFF, WAIT_MAX_SECONDS)
+
+
+def clear():
+    """
+    Forget the clients and datasets of the run
+    """
+    with _lock:
+        _clients.clear()
+        _datasets.clear()
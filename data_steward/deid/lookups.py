@@ -0,0 +1,143 @@
+"""
+Build the lookup tables deid reads once per run.
+
+Every table deid runs on reads the same lookup tables from the input dataset,
+e.g. the suppressed concept_ids.  A LookupManager builds each lookup table at
+most once per run, and not at all if the table was already built from the
+same inputs.  The inputs of a table, e.g. the contents of its csv files and
+the modification times of the vocabulary tables it queries, are hashed into a
+fingerprint which is stored as a label of the table.
+
+Example:
+    lookups = LookupManager()
+    lookups.ensure(client, 'dataset._lookup', [csv_contents, query],
+                   build_lookup)
+"""
+# Python imports
+import hashlib
+import logging
+import os
+import threading
+
+# Third party imports
+from google.api_core.exceptions import NotFound
+
+# Project imports
+from cdr_cleaner import table_counts
+from constants.cdr_cleaner import clean_cdr_engine as ce_consts
+from constants.deid.deid import FINGERPRINT_LABEL
+
+LOGGER = logging.getLogger(__name__)
+
+# label values are limited to 63 characters
+FINGERPRINT_LENGTH = 40
+
+
+def get_fingerprint(inputs):
+    """
+    Hash the inputs of a lookup table
+
+    :param inputs: list of strings or bytes the table is built from
+    :return: hex digest of the inputs
+    """
+    digest = hashlib.sha256()
+    for value in inputs:
+        value = value if isinstance(value, bytes) else str(value).encode()
+        # the length keeps the boundaries between inputs
+        digest.update(f'{len(value)}:'.encode())
+        digest.update(value)
+    return digest.hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def get_file_inputs(paths):
+    """
+    Get the names and contents of files, as inputs of a fingerprint
+
+    :param paths: list of file paths
+    :return: list of the names and contents of the files, in name order
+    """
+    inputs = []
+    for path in sorted(paths, key=os.path.basename):
+        inputs.append(os.path.basename(path))
+        with open(path, 'rb') as input_file:
+            inputs.append(input_file.read())
+    return inputs
+
+
+def get_table_inputs(client, dataset_id, tables):
+    """
+    Get the modification times of tables, as inputs of a fingerprint
+
+    :param client: BigQuery client
+    :param dataset_id: identifies the dataset of the tables
+    :param tables: list of table names
+    :return: list of 'table:last_modified', None for missing tables
+    """
+    table_stats = table_counts.get_table_stats(client, dataset_id)
+    return [
+        f'{table}:{table_stats.get(table, {}).get(ce_consts.LAST_MODIFIED)}'
+        for table in sorted(tables)
+    ]
+
+
+class LookupManager:
+    """
+    Build each lookup table deid reads at most once per run
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # table_id -> fingerprint built or verified in this run
+        self._fingerprints = {}
+
+    def get_stored_fingerprint(self, client, table_id):
+        """
+        :param client: BigQuery client
+        :param table_id: identifies the table, as 'dataset.table'
+        :return: the fingerprint of the table, None if it does not exist or
+            was built without one
+        """
+        try:
+            table = client.get_table(table_id)
+        except NotFound:
+            return None
+        return (table.labels or {}).get(FINGERPRINT_LABEL)
+
+    def store_fingerprint(self, client, table_id, fingerprint):
+        """
+        Label a table with the fingerprint of its inputs
+
+        :param client: BigQuery client
+        :param table_id: identifies the table, as 'dataset.table'
+        :param fingerprint: the fingerprint of its inputs
+        """
+        table = client.get_table(table_id)
+        table.labels = {**(table.labels or {}), FINGERPRINT_LABEL: fingerprint}
+        client.update_table(table, ['labels'])
+
+    def ensure(self, client, table_id, inputs, build):
+        """
+        Build a lookup table unless it was built from the same inputs
+
+        :param client: BigQuery client
+        :param table_id: identifies the table, as 'dataset.table'
+        :param inputs: list of strings or bytes the table is built from
+        :param build: function without arguments which builds the table
+        :return: True if the table was built, False if it was reused
+        """
+        fingerprint = get_fingerprint(inputs)
+        with self._lock:
+            if self._fingerprints.get(table_id) == fingerprint:
+                return False
+
+            built = self.get_stored_fingerprint(client, table_id) != fingerprint
+            if built:
+                build()
+                self.store_fingerprint(client, table_id, fingerprint)
+                LOGGER.info(f"Built lookup table {table_id}")
+            else:
+                LOGGER.info(f"Reusing lookup table {table_id}, its inputs "
+                            f"have not changed")
+
+            self._fingerprints[table_id] = fingerprint
+            return built
@@ -201,6 +201,19 @@ def parse_args(raw_args=None):
         type=query_priority,
         const='INTERACTIVE',
         help='Run the query in interactive mode.  Default is batch mode.')
+    parser.add_argument(
+        '--segment_jobs',
+        dest='segment_jobs',
+        action='store_true',
+        help=('Write each SQL segment of a meta table with its own append '
+              'job.  By default the segments are written by one UNION ALL '
+              'job.'))
+    parser.add_argument(
+        '--verify_union',
+        dest='verify_union',
+        action='store_true',
+        help=('Verify the table written by the UNION ALL job against its '
+              'SQL segments run side by side.'))
     parser.add_argument('--version', action='version', version='deid-02')
     # normally, the parsed arguments are returned as a namespace object.  To avoid
     # rewriting a lot of existing code, the namespace elements will be turned into
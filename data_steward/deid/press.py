@@ -107,6 +107,10 @@ class Press(ABC):
         self.action = [term.strip() for term in args['action'].split(',')
                       ] if 'action' in args else ['submit']
 
+        # submit the segments of a meta table as one UNION ALL job
+        self.segment_jobs = args.get('segment_jobs', False)
+        self.verify_union = args.get('verify_union', False)
+
     def meta(self, data_frame):
         return pd.DataFrame({
             "names": list(data_frame.dtypes.to_dict().keys()),
@@ -215,6 +219,10 @@ class Press(ABC):
         if 'debug' in self.action:
             self.debug(p)
         else:
+            segments = sql
+            if len(segments) > 1 and not self.segment_jobs:
+                sql = [self.to_union_sql(segments)]
+
             # write SQL to file
             sql_filepath = os.path.join(self.logpath, self.idataset,
                                         self.tablename + '.sql')
@@ -235,6 +243,9 @@ class Press(ABC):
                 for index, statement in enumerate(sql):
                     self.submit(statement, not index)
 
+                if self.verify_union and len(segments) > 1:
+                    self.verify_segments(segments)
+
                 for statement in dml_sql:
                     self.submit(statement, False, dml=True)
 
@@ -245,6 +256,53 @@ class Press(ABC):
 
         LOGGER.info(f"FINISHED de-identification on table:\t{self.tablename}")
 
+    def to_union_sql(self, segments):
+        """
+        Combine the SQL segments of a meta table into one query.
+
+        The segments select the same columns in the same order, so the table
+        can be written by one job instead of one append job per segment.
+
+        :param segments: list of SQL segments, in order
+        :return: a UNION ALL of the segments, in the same order
+        """
+        return '\nUNION ALL\n'.join(f'({segment})' for segment in segments)
+
+    def verify_segments(self, segments):
+        """
+        Verify the output table holds exactly the rows of its SQL segments.
+
+        Each segment is run on its own, side by side with the output table
+        written by the UNION ALL of the segments.  The row counts must match
+        and every row of every segment must be in the output table.
+
+        :param segments: list of SQL segments of the table
+        :raises RuntimeError: if the output table does not match the segments
+        """
+        output_table = f'{self.odataset}.{self.tablename}'
+        segment_rows = ' + '.join(
+            f'(SELECT COUNT(*) FROM ({segment}))' for segment in segments)
+        missing_rows = ' + '.join(
+            f'(SELECT COUNT(*) FROM (({segment}) EXCEPT DISTINCT '
+            f'SELECT * FROM {output_table}))' for segment in segments)
+        sql = (f'SELECT (SELECT COUNT(*) FROM {output_table}) AS table_rows, '
+               f'{segment_rows} AS segment_rows, '
+               f'{missing_rows} AS missing_rows')
+
+        result = self.get_dataframe(sql=sql)
+        if result.shape[0] == 0:
+            raise RuntimeError(
+                f"Unable to verify the segments of table:\t{output_table}")
+
+        row = result.iloc[0]
+        if row.table_rows != row.segment_rows or row.missing_rows:
+            raise RuntimeError(
+                f"table:\t{output_table} has {row.table_rows} rows and "
+                f"{row.missing_rows} missing rows, its segments have "
+                f"{row.segment_rows} rows")
+        LOGGER.info(f"verified the {row.table_rows} rows of table:\t"
+                    f"{output_table} match its {len(segments)} segments")
+
     def get_tablename(self):
         return self.idataset + "." + self.tablename if self.idataset else self.tablename
 
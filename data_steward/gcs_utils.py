@@ -6,7 +6,10 @@ import mimetypes
 import os
 from io import BytesIO
 
-import googleapiclient.discovery
+import googleapiclient.http
+from googleapiclient.errors import HttpError
+
+from utils import api_client_pool
 
 MIMETYPES = {
     'json': 'application/json',
@@ -51,7 +54,12 @@ def hpo_gcs_path(hpo_id):
 
 
 def create_service():
-    return googleapiclient.discovery.build('storage', 'v1', cache={})
+    """
+    Get the shared Cloud Storage service from the process-wide client pool
+
+    :return: Cloud Storage v1 discovery service
+    """
+    return api_client_pool.get_service('storage', 'v1')
 
 
 def list_bucket_dir(gcs_path):
@@ -87,11 +95,14 @@ def get_metadata(bucket, name, default=None):
     :param default: alternate value to return if object with the given name is not found
     :return: the object metadata if it exists, None otherwise
     """
-    all_objects = list_bucket(bucket)
-    for obj in all_objects:
-        if obj['name'] == name:
-            return obj
-    return default
+    service = create_service()
+    req = service.objects().get(bucket=bucket, object=name)
+    try:
+        return req.execute(num_retries=GCS_DEFAULT_RETRY_COUNT)
+    except HttpError as err:
+        if err.resp.status != 404:
+            raise
+        return default
 
 
 def list_bucket(bucket):
@@ -110,6 +121,82 @@ def list_bucket(bucket):
     return all_objects
 
 
+class BucketIndex(list):
+    """
+    Metadata of the objects in a bucket, indexed by top-level folder
+
+    Built from a single listing so that several lookups during one request
+    do not each list or scan the whole bucket.  It is a list of the object
+    metadata, so it can be used wherever a bucket listing is expected.
+    """
+
+    def __init__(self, bucket_items=()):
+        super(BucketIndex, self).__init__(bucket_items)
+        self._by_name = {}
+        self._by_folder = {}
+        for item in self:
+            name = item['name']
+            self._by_name[name] = item
+            parts = name.split('/')
+            # files in root do not belong to any folder
+            if len(parts) > 1:
+                self._by_folder.setdefault(parts[0] + '/', []).append(item)
+
+    @classmethod
+    def for_items(cls, bucket_items):
+        """
+        Get an index for a bucket listing, reusing it if it is already one
+
+        :param bucket_items: list of object metadata or a BucketIndex
+        :return: a BucketIndex
+        """
+        if isinstance(bucket_items, cls):
+            return bucket_items
+        return cls(bucket_items)
+
+    @classmethod
+    def from_bucket(cls, bucket):
+        """
+        Index the objects in a bucket
+
+        :param bucket: name of the bucket
+        :return: a BucketIndex
+        """
+        return cls(list_bucket(bucket))
+
+    def folders(self):
+        """
+        :return: list of top-level folder prefixes (e.g. `folder/`)
+        """
+        return list(self._by_folder)
+
+    def folder_items(self, folder_prefix):
+        """
+        Get metadata for the objects whose name starts with a folder prefix
+
+        :param folder_prefix: prefix containing the folder name (e.g. `folder/`
+            or `folder/subfolder/`)
+        :return: list of metadata objects
+        """
+        top_level_folder = folder_prefix.split('/')[0] + '/'
+        items = self._by_folder.get(top_level_folder, [])
+        if folder_prefix == top_level_folder:
+            return list(items)
+        return [
+            item for item in items if item['name'].startswith(folder_prefix)
+        ]
+
+    def get(self, name, default=None):
+        """
+        Get the metadata for an object with the given name
+
+        :param name: the name of the object
+        :param default: value to return if the object is not in the index
+        :return: the object metadata if it exists, default otherwise
+        """
+        return self._by_name.get(name, default)
+
+
 def list_bucket_prefixes(gcs_path):
     """
     Get metadata for each object within the given GCS path
@@ -154,16 +241,20 @@ def get_object(bucket, name, as_text=True):
     return result_bytes
 
 
-def upload_object(bucket, name, fp):
+def upload_object(bucket, name, fp, content_encoding=None):
     """
     Upload file to a GCS bucket
     :param bucket: name of the bucket
     :param name: name for the file
     :param fp: a file-like object containing file contents
+    :param content_encoding: Content-Encoding of the contents (e.g. `gzip`),
+        None if they are not encoded
     :return: metadata about the uploaded file
     """
     service = create_service()
     body = {'name': name}
+    if content_encoding is not None:
+        body['contentEncoding'] = content_encoding
     ext = name.split('.')[-1]
     if ext in MIMETYPES:
         mimetype = MIMETYPES[ext]
@@ -0,0 +1,127 @@
+"""
+Check that fused achilles jobs produce the same results as one job per analysis
+
+Runs the achilles analyses on an existing OMOP CDM BigQuery dataset once with
+one job per analysis and once in fused mode (see
+validation.achilles.get_fused_commands), then compares achilles_results and
+achilles_results_dist row for row.  Rows are compared as JSON strings, so
+floating point aggregates (e.g. stdev_value) computed in a different order
+may be reported as differences in the last digits.
+
+The following environment variables must be set:
+  * BIGQUERY_DATASET_ID: BQ dataset where the OMOP CDM is stored
+  * APPLICATION_ID: GCP project ID (e.g. all-of-us-ehr-dev)
+  * GOOGLE_APPLICATION_CREDENTIALS: location of service account key json file (e.g.
+  /path/to/all-of-us-ehr-dev-abc123.json)
+
+Note: the achilles tables are recreated by this script
+"""
+import argparse
+import logging
+import sys
+
+import bq_utils
+from constants import bq_utils as bq_consts
+from validation import achilles
+
+RESULT_TABLES = [achilles.ACHILLES_RESULTS, achilles.ACHILLES_RESULTS_DIST]
+PER_ANALYSIS_SUFFIX = '_per_analysis'
+FUSED_SUFFIX = '_fused'
+RESULT_LIMIT = 20
+
+COPY_QUERY = '''SELECT * FROM `{table_id}`'''
+
+COMPARE_QUERY = '''
+WITH expected AS (
+  SELECT TO_JSON_STRING(t) AS row_json, COUNT(*) AS row_count
+  FROM `{expected_table_id}` t
+  GROUP BY row_json
+),
+actual AS (
+  SELECT TO_JSON_STRING(t) AS row_json, COUNT(*) AS row_count
+  FROM `{actual_table_id}` t
+  GROUP BY row_json
+)
+SELECT
+  row_json,
+  IFNULL(expected.row_count, 0) AS expected_count,
+  IFNULL(actual.row_count, 0) AS actual_count
+FROM expected
+FULL OUTER JOIN actual USING (row_json)
+WHERE IFNULL(expected.row_count, 0) != IFNULL(actual.row_count, 0)
+ORDER BY row_json
+'''
+
+
+def run_and_copy(hpo_id, fused, suffix):
+    """
+    Run the achilles analyses and copy the results to tables with a suffix
+
+    :param hpo_id: hpo_id of the site to run on, None for the whole dataset
+    :param fused: whether to run the analyses in fused mode
+    :param suffix: appended to the result table ids of the copies
+    :return: None
+    """
+    achilles.create_tables(hpo_id, drop_existing=True)
+    achilles.load_analyses(hpo_id)
+    achilles.run_analyses(hpo_id, fused=fused)
+    job_ids = []
+    for table_name in RESULT_TABLES:
+        table_id = bq_utils.get_table_id(hpo_id, table_name)
+        job = bq_utils.query(COPY_QUERY.format(table_id=table_id),
+                             destination_table_id=table_id + suffix,
+                             write_disposition=bq_consts.WRITE_TRUNCATE)
+        job_ids.append(job['jobReference']['jobId'])
+    incomplete_jobs = bq_utils.wait_on_jobs(job_ids)
+    if incomplete_jobs:
+        raise RuntimeError(f'Copy job(s) {incomplete_jobs} did not complete')
+
+
+def compare_results(hpo_id):
+    """
+    Get the rows of each result table which differ between the two runs
+
+    :param hpo_id: hpo_id of the site the analyses ran on
+    :return: dict mapping a result table name to the list of differing rows,
+        each with row_json, expected_count and actual_count
+    """
+    differences = dict()
+    for table_name in RESULT_TABLES:
+        table_id = bq_utils.get_table_id(hpo_id, table_name)
+        query = COMPARE_QUERY.format(expected_table_id=table_id +
+                                     PER_ANALYSIS_SUFFIX,
+                                     actual_table_id=table_id + FUSED_SUFFIX)
+        response = bq_utils.query(query)
+        differences[table_name] = bq_utils.large_response_to_rowlist(response)
+    return differences
+
+
+def main(hpo_id):
+    run_and_copy(hpo_id, fused=False, suffix=PER_ANALYSIS_SUFFIX)
+    run_and_copy(hpo_id, fused=True, suffix=FUSED_SUFFIX)
+    differences = compare_results(hpo_id)
+    matched = True
+    for table_name, rows in differences.items():
+        if not rows:
+            logging.info(f'{table_name}: fused results match')
+            continue
+        matched = False
+        logging.error(f'{table_name}: {len(rows)} row(s) differ')
+        for row in rows[:RESULT_LIMIT]:
+            logging.error(f"expected {row['expected_count']}, "
+                          f"actual {row['actual_count']}: {row['row_json']}")
+    return matched
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument(
+        '--hpo_id',
+        default=None,
+        help='Identifies the site whose tables are analyzed. '
+        'By default the unprefixed tables of the dataset are used.')
+    args = parser.parse_args()
+    sys.exit(0 if main(args.hpo_id) else 1)
@@ -8,18 +8,22 @@ A central script to execute deid for each table needing de-identification.
 from datetime import datetime
 import logging
 import os
+import time
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Third party imports
-import google
 import app_identity
 
 # Project imports
 import bq_utils
 import deid.aou as aou
+from deid.lookups import LookupManager
+from cdr_cleaner import table_counts
 from deid.parser import odataset_name_verification
+from deid.parser import parse_args as parse_deid_args
 from resources import fields_for, fields_path, DEID_PATH
-from utils import bq
+from utils import bq, sql_compiler
 from common import JINJA_ENV
 
 LOGGER = logging.getLogger(__name__)
@@ -120,6 +124,20 @@ def get_output_tables(input_dataset, known_tables, skip_tables, only_tables):
     :return: a list of table names to execute deid over.
     """
     tables = bq_utils.list_dataset_contents(input_dataset)
+    return filter_output_tables(tables, known_tables, skip_tables, only_tables)
+
+
+def filter_output_tables(tables, known_tables, skip_tables, only_tables):
+    """
+    Filter a list of table names down to the tables deid should produce.
+
+    :param tables:  list of candidate table names.
+    :param known_tables:  list of tables known to curation.
+    :param skip_tables:  command line csv string of tables to skip for deid.
+    :param only_tables:  command line csv string of the only tables to deid.
+
+    :return: a list of table names to execute deid over.
+    """
     skip_tables = [table.strip() for table in skip_tables.split(',')]
     only_tables = [table.strip() for table in only_tables.split(',')]
 
@@ -235,6 +253,32 @@ def parse_args(raw_args=None):
                         action='store_true',
                         required=False,
                         help='Log to the console as well as to a file.')
+    parser.add_argument(
+        '--compile_only',
+        dest='compile_dir',
+        action='store',
+        required=False,
+        default=None,
+        help=('Directory to write the deid SQL of each table to, with a '
+              'manifest of hashes.  Table schemas are read from the resource '
+              'files and BigQuery is not used.  The directory must be empty '
+              'or hold the output of an earlier run.'))
+    parser.add_argument(
+        '-w',
+        '--max_workers',
+        dest='max_workers',
+        action='store',
+        type=int,
+        default=1,
+        help=('Number of tables to de-identify at the same time.  The largest '
+              'tables are started first.  Defaults to 1.'))
+    parser.add_argument(
+        '--verify_union',
+        dest='verify_union',
+        action='store_true',
+        required=False,
+        help=('Verify each meta table written by one UNION ALL job against '
+              'its SQL segments run side by side.'))
     parser.add_argument('--version', action='version', version='deid-02')
     parser.add_argument('-m',
                         '--age_limit',
@@ -292,6 +336,170 @@ def load_deid_map_table(deid_map_dataset_name, age_limit):
         )
 
 
+def get_parameter_list(args, table, configured_tables, deid_tables_path):
+    """
+    Get the deid command line arguments for a table.
+
+    :param args:  parsed command line arguments of the runner.
+    :param table:  name of the table to de-identify.
+    :param configured_tables:  list of tables with a deid configuration file.
+    :param deid_tables_path:  path of the deid table configuration files.
+
+    :return: a list of arguments for deid.aou
+    """
+    tablepath = None
+    if table in configured_tables:
+        tablepath = os.path.join(deid_tables_path, table + '.json')
+    else:
+        tablepath = table
+
+    parameter_list = [
+        '--rules',
+        os.path.join(DEID_PATH, 'config', 'ids', 'config.json'),
+        '--private_key', args.private_key, '--table', tablepath, '--action',
+        args.action, '--idataset', args.input_dataset, '--log', LOGS_PATH,
+        '--odataset', args.odataset, '--age-limit', args.age_limit
+    ]
+
+    if args.interactive_mode:
+        parameter_list.append('--interactive')
+
+    if args.verify_union:
+        parameter_list.append('--verify_union')
+
+    field_names = [field.get('name') for field in fields_for(table)]
+    if 'person_id' in field_names:
+        parameter_list.append('--cluster')
+
+    return parameter_list
+
+
+def get_table_rows(input_dataset, tables):
+    """
+    Get the row counts of the tables to de-identify.
+
+    The counts come from one read of the input dataset's __TABLES__ metadata.
+
+    :param input_dataset:  name of the input dataset.
+    :param tables:  list of the tables to de-identify.
+
+    :return: a dict with table name as key and row count as value
+    """
+    project_id = app_identity.get_application_id()
+    client = bq.get_client(project_id)
+    return table_counts.get_table_counts(client, input_dataset, tables)
+
+
+def _timed_deid_table(table, handle, init_seconds):
+    """
+    Run deid on an initialized table, catching any failure.
+
+    :return: a tuple (table, succeeded, seconds)
+    """
+    start = time.time()
+    try:
+        handle.do()
+    except Exception:
+        LOGGER.exception(f"Encountered deid exception on table: {table}")
+        return table, False, init_seconds + time.time() - start
+    LOGGER.info(f"Successfully executed deid on table: {table}")
+    return table, True, init_seconds + time.time() - start
+
+
+def deid_tables(args, tables, configured_tables, deid_tables_path, table_rows):
+    """
+    De-identify several tables concurrently.
+
+    The tables are initialized one at a time, sharing a LookupManager so the
+    lookup tables they read are built once, and then run by up to
+    args.max_workers threads with the largest tables started first.  A
+    failure in one table does not stop the others.
+
+    :param args:  parsed command line arguments of the runner.
+    :param tables:  list of the tables to de-identify.
+    :param configured_tables:  list of tables with a deid configuration file.
+    :param deid_tables_path:  path of the deid table configuration files.
+    :param table_rows:  dict with table name as key and row count as value.
+
+    :return: list of tuples (table, succeeded, seconds, rows)
+    """
+    start = time.time()
+    ordered_tables = sorted(tables,
+                            key=lambda table: table_rows.get(table, 0),
+                            reverse=True)
+    lookups = LookupManager()
+    results = []
+    handles = []
+    for table in ordered_tables:
+        parameter_list = get_parameter_list(args, table, configured_tables,
+                                            deid_tables_path)
+        LOGGER.info(f"Executing deid with:\n\tpython deid/aou.py "
+                    f"{' '.join(parameter_list)}")
+        init_start = time.time()
+        try:
+            handle = aou.initialize_table(parameter_list, lookups=lookups)
+        except Exception:
+            LOGGER.exception(f"Encountered deid exception on table: {table}")
+            handle = None
+        if handle:
+            handles.append((table, handle, time.time() - init_start))
+        else:
+            results.append((table, False, time.time() - init_start))
+
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        futures = [
+            executor.submit(_timed_deid_table, table, handle, init_seconds)
+            for table, handle, init_seconds in handles
+        ]
+        results.extend(future.result() for future in as_completed(futures))
+
+    summary = [(table, succeeded, seconds, table_rows.get(table, 0))
+               for table, succeeded, seconds in results]
+    summary.sort(key=lambda row: row[2], reverse=True)
+    lines = [
+        f"{table}: {'done' if succeeded else 'FAILED'} in {seconds:.1f}s "
+        f"({rows} rows)" for table, succeeded, seconds, rows in summary
+    ]
+    LOGGER.info(f"De-identified {len(summary)} tables in "
+                f"{time.time() - start:.1f}s using {args.max_workers} "
+                f"workers:\n" + '\n'.join(lines))
+    return summary
+
+
+def compile_deid(args, tables, configured_tables, deid_tables_path):
+    """
+    Write the deid SQL of each table to args.compile_dir without BigQuery.
+
+    :param args:  parsed command line arguments of the runner.
+    :param tables:  list of the tables to de-identify.
+    :param configured_tables:  list of tables with a deid configuration file.
+    :param deid_tables_path:  path of the deid table configuration files.
+    :raises RuntimeError: if the SQL of a table could not be generated or
+        did not pass the checks
+    """
+    compiled = []
+    errors = []
+    for table in tables:
+        parameter_list = get_parameter_list(args, table, configured_tables,
+                                            deid_tables_path)
+        try:
+            statements = aou.compile_table(**parse_deid_args(parameter_list))
+        except Exception as exp:
+            LOGGER.exception(f"Unable to compile deid for table: {table}")
+            errors.append((table, str(exp)))
+            continue
+        compiled.extend((f'{table}_{index}', statement)
+                        for index, statement in enumerate(statements))
+
+    manifest = sql_compiler.write_compiled_sql(args.compile_dir, compiled,
+                                               errors)
+    failed = sql_compiler.log_manifest(args.compile_dir, manifest)
+    # unlike cleaning rules, deid never needs BigQuery to generate its SQL
+    failed += len(manifest[sql_compiler.ERRORS])
+    if failed:
+        raise RuntimeError(f'Compiling found problems in {failed} statement(s)')
+
+
 def main(raw_args=None):
     """
     Execute deid as a single script.
@@ -303,6 +511,14 @@ def main(raw_args=None):
     known_tables = get_known_tables(fields_path)
     deid_tables_path = os.path.join(DEID_PATH, 'config', 'ids', 'tables')
     configured_tables = get_known_tables(deid_tables_path)
+
+    if args.compile_dir:
+        # the table schemas stand in for the contents of the input dataset
+        tables = filter_output_tables(sorted(known_tables), known_tables,
+                                      args.skip_tables, args.tables)
+        compile_deid(args, tables, configured_tables, deid_tables_path)
+        return
+
     tables = get_output_tables(args.input_dataset, known_tables,
                                args.skip_tables, args.tables)
     logging.info(f"Loading {DEID_MAP_TABLE} table...")
@@ -310,42 +526,11 @@ def main(raw_args=None):
                         age_limit=args.age_limit)
     logging.info(f"Loaded {DEID_MAP_TABLE} table.")
 
-    exceptions = []
-    successes = []
-    for table in tables:
-        tablepath = None
-        if table in configured_tables:
-            tablepath = os.path.join(deid_tables_path, table + '.json')
-        else:
-            tablepath = table
-
-        parameter_list = [
-            '--rules',
-            os.path.join(DEID_PATH, 'config', 'ids', 'config.json'),
-            '--private_key', args.private_key, '--table', tablepath, '--action',
-            args.action, '--idataset', args.input_dataset, '--log', LOGS_PATH,
-            '--odataset', args.odataset, '--age-limit', args.age_limit
-        ]
-
-        if args.interactive_mode:
-            parameter_list.append('--interactive')
-
-        field_names = [field.get('name') for field in fields_for(table)]
-        if 'person_id' in field_names:
-            parameter_list.append('--cluster')
-
-        LOGGER.info(
-            f"Executing deid with:\n\tpython deid/aou.py {' '.join(parameter_list)}"
-        )
-
-        try:
-            aou.main(parameter_list)
-        except google.api_core.exceptions.GoogleAPIError:
-            LOGGER.exception("Encountered deid exception:\n")
-            exceptions.append(table)
-        else:
-            LOGGER.info(f"Successfully executed deid on table: {table}")
-            successes.append(table)
+    table_rows = get_table_rows(args.input_dataset, tables)
+    summary = deid_tables(args, tables, configured_tables, deid_tables_path,
+                          table_rows)
+    successes = [table for table, succeeded, _, _ in summary if succeeded]
+    exceptions = [table for table, succeeded, _, _ in summary if not succeeded]
 
     copy_suppressed_table_schemas(known_tables, args.odataset)
 
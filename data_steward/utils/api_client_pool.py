@@ -0,0 +1,240 @@
+"""
+A process-wide pool of Google API discovery clients.
+
+`bq_utils` and `gcs_utils` used to build a new discovery service for every
+call, which re-reads the discovery document and creates a new authorized
+transport (and TLS connection) each time.  This module builds each service
+once per process and shares it across threads.  Requests go through
+:class:`PooledHttp`, which lends an idle authorized transport to the calling
+thread and bounds the number of transports in use at the same time.
+
+Example:
+    service = api_client_pool.get_service('bigquery', 'v2')
+    service.jobs().get(projectId=project_id, jobId=job_id).execute()
+"""
+# Python imports
+import logging
+import os
+import threading
+import time
+
+# Third party imports
+import google.auth
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_CONNECTIONS_ENV = 'API_CLIENT_MAX_CONNECTIONS'
+"""Environment variable used to override the connection bound"""
+DEFAULT_MAX_CONNECTIONS = 16
+"""Default maximum number of transports in use at the same time"""
+SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+class PoolStats(object):
+    """
+    Thread-safe counters describing how the pool is being used
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.service_hits = 0
+        self.service_builds = 0
+        self.transport_hits = 0
+        self.transport_builds = 0
+        self.setup_seconds = 0.0
+
+    def record_service(self, hit, seconds=0.0):
+        with self._lock:
+            if hit:
+                self.service_hits += 1
+            else:
+                self.service_builds += 1
+                self.setup_seconds += seconds
+
+    def record_transport(self, hit, seconds=0.0):
+        with self._lock:
+            if hit:
+                self.transport_hits += 1
+            else:
+                self.transport_builds += 1
+                self.setup_seconds += seconds
+
+    def snapshot(self):
+        """
+        Get a consistent copy of the counters
+
+        :return: dict of counter name to value
+        """
+        with self._lock:
+            return {
+                'service_hits': self.service_hits,
+                'service_builds': self.service_builds,
+                'transport_hits': self.transport_hits,
+                'transport_builds': self.transport_builds,
+                'setup_seconds': self.setup_seconds
+            }
+
+
+class PooledHttp(object):
+    """
+    Thread-safe stand-in for `httplib2.Http` used by shared discovery services
+
+    httplib2 transports must not be used by more than one thread at a time, so
+    each request borrows an idle transport (or creates one) and returns it
+    when the response has been read.  At most `max_connections` transports
+    are lent out at once; further requests block until one is returned.
+    """
+
+    def __init__(self, credentials, stats, max_connections):
+        # googleapiclient reads credentials from the http object when
+        # authorizing batch requests and refreshing tokens
+        self.credentials = credentials
+        self._stats = stats
+        self._idle = []
+        self._idle_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _checkout(self):
+        self._slots.acquire()
+        with self._idle_lock:
+            transport = self._idle.pop() if self._idle else None
+        if transport is not None:
+            self._stats.record_transport(hit=True)
+            return transport
+        start = time.time()
+        try:
+            transport = AuthorizedHttp(self.credentials, http=build_http())
+        except Exception:
+            self._slots.release()
+            raise
+        self._stats.record_transport(hit=False, seconds=time.time() - start)
+        return transport
+
+    def _checkin(self, transport):
+        if transport is not None:
+            with self._idle_lock:
+                self._idle.append(transport)
+        self._slots.release()
+
+    def request(self, *args, **kwargs):
+        """
+        Issue a request on a pooled transport
+
+        Accepts the same arguments as `httplib2.Http.request`.  A transport
+        whose request raised is discarded rather than returned to the pool.
+        """
+        transport = self._checkout()
+        try:
+            response = transport.request(*args, **kwargs)
+        except Exception:
+            self._checkin(None)
+            raise
+        self._checkin(transport)
+        return response
+
+
+class ClientPool(object):
+    """
+    Builds each discovery service once and shares it across threads
+    """
+
+    def __init__(self,
+                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                 credentials=None):
+        self.max_connections = max_connections
+        self.stats = PoolStats()
+        self._credentials = credentials
+        self._http = None
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def _get_http(self):
+        if self._http is None:
+            if self._credentials is None:
+                self._credentials, _ = google.auth.default(scopes=SCOPES)
+            self._http = PooledHttp(self._credentials, self.stats,
+                                    self.max_connections)
+        return self._http
+
+    def get_service(self, api_name, api_version):
+        """
+        Get the shared service object for an API
+
+        :param api_name: name of the API (e.g. `bigquery`, `storage`)
+        :param api_version: version of the API (e.g. `v2`)
+        :return: a googleapiclient Resource backed by the pooled transports
+        """
+        key = (api_name, api_version)
+        service = self._services.get(key)
+        if service is None:
+            with self._lock:
+                service = self._services.get(key)
+                if service is None:
+                    start = time.time()
+                    service = build(api_name,
+                                    api_version,
+                                    http=self._get_http(),
+                                    cache_discovery=False)
+                    self._services[key] = service
+                    self.stats.record_service(hit=False,
+                                              seconds=time.time() - start)
+                    LOGGER.info(f'Built {api_name} {api_version} service')
+                    return service
+        self.stats.record_service(hit=True)
+        return service
+
+
+def get_pool():
+    """
+    Get the process-wide client pool, creating it on first use
+
+    The connection bound is read from `API_CLIENT_MAX_CONNECTIONS` if set.
+
+    :return: the shared ClientPool
+    """
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                max_connections = int(
+                    os.environ.get(MAX_CONNECTIONS_ENV,
+                                   DEFAULT_MAX_CONNECTIONS))
+                _POOL = ClientPool(max_connections=max_connections)
+    return _POOL
+
+
+def get_service(api_name, api_version):
+    """
+    Get a shared discovery service from the process-wide pool
+
+    :param api_name: name of the API (e.g. `bigquery`, `storage`)
+    :param api_version: version of the API (e.g. `v2`)
+    :return: a googleapiclient Resource
+    """
+    return get_pool().get_service(api_name, api_version)
+
+
+def get_stats():
+    """
+    Get reuse and setup counters of the process-wide pool
+
+    :return: dict of counter name to value
+    """
+    return get_pool().stats.snapshot()
+
+
+def reset_pool():
+    """
+    Discard the process-wide pool so the next call builds a new one
+
+    Useful after credentials change or in a forked worker process.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        _POOL = None
@@ -0,0 +1,105 @@
+"""
+Run interdependent tasks concurrently.
+
+A task starts as soon as every task it depends on has succeeded, with at most
+`max_workers` tasks running at the same time.  Ready tasks start in the order
+they were given, so a serial list of commands keeps its relative order where
+it matters and gains concurrency where it does not.
+
+Example:
+    # 'c' must wait for 'a' and 'b', which may run at the same time
+    results = dag_executor.run_dag(['a', 'b', 'c'], {'c': {'a', 'b'}},
+                                   run_task, max_workers=4)
+"""
+# Python imports
+import logging
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+LOGGER = logging.getLogger(__name__)
+
+
+def get_dependents(tasks, dependencies):
+    """
+    Invert a dependency mapping
+
+    :param tasks: list of task keys
+    :param dependencies: dict mapping a task to the tasks it depends on
+    :return: dict mapping a task to the list of tasks which depend on it
+    :raises ValueError: if a task depends on an unknown task
+    """
+    known_tasks = set(tasks)
+    dependents = defaultdict(list)
+    for task in tasks:
+        for dependency in dependencies.get(task, ()):
+            if dependency not in known_tasks:
+                raise ValueError(
+                    f'Task {task} depends on unknown task {dependency}')
+            dependents[dependency].append(task)
+    return dependents
+
+
+def run_dag(tasks,
+            dependencies,
+            run_task,
+            max_workers,
+            initializer=None,
+            initargs=()):
+    """
+    Run tasks concurrently, each one after the tasks it depends on
+
+    If a task raises, no further tasks are started, the running ones are
+    allowed to finish and the first exception is raised.
+
+    :param tasks: list of hashable task keys, in the order they should start
+        when several are ready
+    :param dependencies: dict mapping a task to the tasks it depends on
+    :param run_task: callable which accepts a task key and runs the task
+    :param max_workers: maximum number of tasks running at the same time
+    :param initializer: callable run at the start of each worker thread
+    :param initargs: tuple of arguments passed to the initializer
+    :return: dict mapping each task to the value returned by run_task
+    :raises RuntimeError: if the dependencies contain a cycle
+    """
+    dependents = get_dependents(tasks, dependencies)
+    waiting_on = {task: set(dependencies.get(task, ())) for task in tasks}
+    ready = [task for task in tasks if not waiting_on[task]]
+    results = dict()
+    running = dict()
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers,
+                            initializer=initializer,
+                            initargs=initargs) as executor:
+        while ready or running:
+            # the executor bounds how many of the submitted tasks run at once
+            while ready and error is None:
+                task = ready.pop(0)
+                running[executor.submit(run_task, task)] = task
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                if future.cancelled():
+                    continue
+                exc = future.exception()
+                if exc is not None:
+                    if error is None:
+                        LOGGER.error(f'Task {task} failed, waiting on '
+                                     f'{len(running)} running task(s)')
+                        error = exc
+                        for pending in running:
+                            pending.cancel()
+                    continue
+                results[task] = future.result()
+                for dependent in dependents[task]:
+                    waiting_on[dependent].discard(task)
+                    if not waiting_on[dependent]:
+                        ready.append(dependent)
+    if error is not None:
+        raise error
+    if len(results) != len(tasks):
+        not_run = [task for task in tasks if task not in results]
+        raise RuntimeError(f'Tasks {not_run} were never ready to run, check '
+                           f'the dependencies for a cycle')
+    return results
@@ -0,0 +1,189 @@
+"""
+Track many asynchronous jobs with one shared poller.
+
+Callers register job ids and block until their own jobs finish.  A single
+background thread looks up the state of every outstanding job at once (for
+BigQuery, in batched HTTP requests), wakes each caller as soon as its jobs
+are done and stops when nothing is left to watch.
+
+The poll interval adapts to how long jobs have been running: a job submitted
+a moment ago is checked after `min_poll_interval`, while jobs that have been
+running for minutes are checked less often, up to `max_poll_interval`.
+
+A failed lookup only fails the job when the error is definitive (e.g. the job
+does not exist).  Transient errors are retried by the following polls, and
+fail the job after `max_failures` consecutive failed lookups.
+"""
+# Python imports
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+DONE = 'DONE'
+
+
+class _WatchedJob(object):
+    """
+    State shared between the poller and the callers waiting on one job
+    """
+
+    def __init__(self, job_id, started):
+        self.job_id = job_id
+        self.started = started
+        self.done = threading.Event()
+        self.error = None
+        self.failures = 0
+        self.waiters = 0
+
+
+class JobWatcher(object):
+    """
+    Waits on jobs by polling their states together
+    """
+
+    def __init__(self,
+                 fetch_states,
+                 min_poll_interval=0.25,
+                 max_poll_interval=500,
+                 backoff_fraction=0.25,
+                 is_transient=None,
+                 max_failures=10):
+        """
+        :param fetch_states: callable which accepts a list of job ids and
+            returns a dict mapping each id to its state string or to the
+            exception raised while looking it up
+        :param min_poll_interval: seconds to wait before the first poll
+        :param max_poll_interval: longest wait between two polls
+        :param backoff_fraction: the next poll happens after this fraction of
+            the age of the youngest outstanding job
+        :param is_transient: callable which accepts the exception raised while
+            looking up a job and returns True if the lookup may succeed when
+            retried, by default no error is transient
+        :param max_failures: number of consecutive transient failures after
+            which the lookup error is raised to the callers
+        """
+        self._fetch_states = fetch_states
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff_fraction = backoff_fraction
+        self._is_transient = is_transient or (lambda exc: False)
+        self.max_failures = max_failures
+        self._jobs = {}
+        self._condition = threading.Condition()
+        self._poller = None
+
+    def _next_interval(self, now):
+        youngest_age = min(now - job.started for job in self._jobs.values())
+        interval = youngest_age * self.backoff_fraction
+        return min(max(interval, self.min_poll_interval),
+                   self.max_poll_interval)
+
+    def _poll_forever(self):
+        while True:
+            with self._condition:
+                if not self._jobs:
+                    self._poller = None
+                    return
+                self._condition.wait(self._next_interval(time.time()))
+                job_ids = list(self._jobs)
+            if not job_ids:
+                continue
+            self._poll(job_ids)
+
+    def _poll(self, job_ids):
+        try:
+            states = self._fetch_states(job_ids)
+        except Exception as exc:
+            LOGGER.exception(f'Unable to get state of job(s): {job_ids}')
+            states = {job_id: exc for job_id in job_ids}
+        with self._condition:
+            for job_id, state in states.items():
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                if isinstance(state, Exception):
+                    job.failures += 1
+                    if (self._is_transient(state) and
+                            job.failures < self.max_failures):
+                        LOGGER.warning(
+                            f'Retrying lookup of job {job_id} after failure '
+                            f'{job.failures} of {self.max_failures}: {state}')
+                        continue
+                    job.error = state
+                elif state != DONE:
+                    job.failures = 0
+                    continue
+                del self._jobs[job_id]
+                job.done.set()
+
+    def watch(self, job_ids):
+        """
+        Start tracking jobs
+
+        A job that is already tracked (e.g. awaited by another thread) is
+        shared rather than tracked twice.
+
+        :param job_ids: ids of the jobs to track
+        :return: list of handles for the jobs, passed to :meth:`wait_handles`
+        """
+        now = time.time()
+        handles = []
+        with self._condition:
+            for job_id in job_ids:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    job = _WatchedJob(job_id, now)
+                    self._jobs[job_id] = job
+                job.waiters += 1
+                handles.append(job)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_forever,
+                                                name='job-watcher',
+                                                daemon=True)
+                self._poller.start()
+            else:
+                # re-evaluate the interval now that a young job is tracked
+                self._condition.notify_all()
+        return handles
+
+    def wait_handles(self, handles, timeout=None):
+        """
+        Block until the jobs are done or the timeout elapses
+
+        :param handles: handles returned by :meth:`watch`
+        :param timeout: maximum number of seconds to wait, None to wait forever
+        :return: list of ids of the jobs which did not complete in time
+        :raises: the first exception raised while looking up one of the jobs
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        incomplete = []
+        for job in handles:
+            remaining = None if deadline is None else max(
+                deadline - time.time(), 0)
+            if not job.done.wait(remaining):
+                incomplete.append(job.job_id)
+        self._release(handles)
+        for job in handles:
+            if job.error is not None:
+                raise job.error
+        return incomplete
+
+    def wait(self, job_ids, timeout=None):
+        """
+        Track jobs and block until they are done or the timeout elapses
+
+        :param job_ids: ids of the jobs to wait on
+        :param timeout: maximum number of seconds to wait, None to wait forever
+        :return: list of ids of the jobs which did not complete in time
+        """
+        return self.wait_handles(self.watch(job_ids), timeout)
+
+    def _release(self, handles):
+        with self._condition:
+            for job in handles:
+                job.waiters -= 1
+                if job.waiters == 0 and self._jobs.get(job.job_id) is job:
+                    # nobody is waiting on this job anymore
+                    del self._jobs[job.job_id]
@@ -0,0 +1,286 @@
+"""
+Write generated SQL to a directory and check it without BigQuery.
+
+Each statement is written to its own file, numbered in the order it would
+run, along with a manifest holding the content hash, size and complexity of
+every statement.  Nothing in the output depends on when it was written, so
+the SQL of two versions of the code can be compared with diff and the
+manifests used to catch statements which grew.
+
+The check is a local scan of the SQL rather than a full BigQuery parser.  It
+finds unterminated strings and comments, unbalanced parentheses, template
+placeholders which were never rendered and commas before a closing
+parenthesis.
+
+Example:
+    manifest = sql_compiler.write_compiled_sql(
+        'compiled/rdr', [('clean_years_0', sql)], errors=[])
+"""
+# Python imports
+import hashlib
+import json
+import logging
+import os
+import re
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+SQL_FILE = '{index:03d}_{name}.sql'
+
+# Keys of the manifest
+SHA256 = 'sha256'
+STATEMENTS = 'statements'
+ERRORS = 'errors'
+FILE = 'file'
+NAME = 'name'
+PROBLEMS = 'problems'
+ERROR = 'error'
+CHARACTERS = 'characters'
+LINES = 'lines'
+SELECTS = 'selects'
+JOINS = 'joins'
+MAX_DEPTH = 'max_depth'
+
+# Opening and closing delimiters of literals and comments, longest first
+LITERAL_DELIMITERS = [("'''", "'''"), ('"""', '"""'), ('/*', '*/'),
+                      ('--', '\n'), ('#', '\n'), ("'", "'"), ('"', '"'),
+                      ('`', '`')]
+QUOTES = {"'''", '"""', "'", '"'}
+
+# Jinja or str.format placeholders, or ':name' placeholders used by deid
+PLACEHOLDER_PATTERN = re.compile(r'\{\{|\{%|\{\w*\}|(?<![\w:]):[A-Za-z_]\w*')
+# BigQuery allows a trailing comma in a SELECT list, but not before ')'
+DANGLING_COMMA_PATTERN = re.compile(r',\s*\)')
+SELECT_KEYWORD_PATTERN = re.compile(r'\bSELECT\b', re.IGNORECASE)
+JOIN_KEYWORD_PATTERN = re.compile(r'\bJOIN\b', re.IGNORECASE)
+
+
+def _get_literal_end(sql, start, opening, closing):
+    """
+    Find the end of a literal or comment
+
+    :param sql: the SQL text
+    :param start: index just past the opening delimiter
+    :param opening: the opening delimiter
+    :param closing: the closing delimiter
+    :return: index just past the closing delimiter or None if unterminated
+    """
+    index = start
+    while index < len(sql):
+        if opening in QUOTES and sql[index] == '\\':
+            index += 2
+            continue
+        if sql.startswith(closing, index):
+            return index + len(closing)
+        index += 1
+    return len(sql) if closing == '\n' else None
+
+
+def strip_literals(sql):
+    """
+    Replace the strings and quoted identifiers of SQL with a token, and its
+    comments with a space
+
+    :param sql: the SQL text
+    :return: tuple of the remaining SQL code and a list of problems found
+    """
+    code = []
+    problems = []
+    index = 0
+    while index < len(sql):
+        for opening, closing in LITERAL_DELIMITERS:
+            if sql.startswith(opening, index):
+                end = _get_literal_end(sql, index + len(opening), opening,
+                                       closing)
+                if end is None:
+                    line_no = sql.count('\n', 0, index) + 1
+                    problems.append(f'Unterminated {opening} on line {line_no}')
+                    end = len(sql)
+                # keep a token in place of a string or quoted identifier
+                code.append(' x ' if opening in QUOTES | {'`'} else ' ')
+                index = end
+                break
+        else:
+            code.append(sql[index])
+            index += 1
+    return ''.join(code), problems
+
+
+def _get_max_depth(code, problems):
+    """
+    Get the deepest nesting of parentheses, noting unbalanced ones
+
+    :param code: SQL code without literals or comments
+    :param problems: list the problems found are appended to
+    :return: maximum depth of nested parentheses
+    """
+    depth = max_depth = 0
+    for char in code:
+        if char == '(':
+            depth += 1
+            max_depth = max(depth, max_depth)
+        elif char == ')':
+            depth -= 1
+            if depth < 0:
+                problems.append('Unbalanced closing parenthesis')
+                depth = 0
+    if depth:
+        problems.append(f'{depth} unclosed parenthesis(es)')
+    return max_depth
+
+
+def check_sql(sql):
+    """
+    Check a SQL statement and measure its size and complexity
+
+    :param sql: the SQL text
+    :return: dict of the statement's characters, lines, SELECT and JOIN
+        counts, maximum nesting depth and list of problems
+    """
+    code, problems = strip_literals(sql)
+    if not code.strip():
+        problems.append('Empty statement')
+
+    max_depth = _get_max_depth(code, problems)
+    for placeholder in sorted(set(PLACEHOLDER_PATTERN.findall(code))):
+        problems.append(f'Unrendered placeholder {placeholder}')
+    if DANGLING_COMMA_PATTERN.search(code):
+        problems.append('Comma before a closing parenthesis')
+
+    return {
+        CHARACTERS: len(sql),
+        LINES: sql.count('\n') + 1,
+        SELECTS: len(SELECT_KEYWORD_PATTERN.findall(code)),
+        JOINS: len(JOIN_KEYWORD_PATTERN.findall(code)),
+        MAX_DEPTH: max_depth,
+        PROBLEMS: problems
+    }
+
+
+def get_sql_hash(sql):
+    """
+    Identify the text of a statement
+
+    :param sql: the SQL text
+    :return: hex digest of the text
+    """
+    return hashlib.sha256(sql.encode('utf-8')).hexdigest()
+
+
+def _to_file_name(name):
+    """
+    Make a statement name safe to use in a file name
+
+    :param name: name of the statement
+    :return: the name with only letters, digits, '_', '-' and '.'
+    """
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def _remove_written_sql(output_dir):
+    """
+    Remove the SQL files an earlier run listed in its manifest
+
+    :param output_dir: directory the SQL files were written to
+    :raises FileExistsError: if the directory holds files but no manifest,
+        so files which were not written by write_compiled_sql are kept
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        file_names = [statement[FILE] for statement in manifest[STATEMENTS]]
+    except FileNotFoundError:
+        if os.listdir(output_dir):
+            raise FileExistsError(
+                f'{output_dir} is not empty and has no {MANIFEST_FILE}, '
+                f'choose an empty directory for the compiled SQL')
+        return
+    except (ValueError, KeyError, TypeError):
+        raise FileExistsError(f'{manifest_path} is not a manifest of '
+                              f'compiled SQL, choose another directory')
+
+    for file_name in file_names:
+        # only files directly in the directory, as written
+        if os.path.basename(file_name) == file_name:
+            try:
+                os.remove(os.path.join(output_dir, file_name))
+            except FileNotFoundError:
+                pass
+
+
+def write_compiled_sql(output_dir, compiled, errors=None):
+    """
+    Write statements to numbered files along with a manifest
+
+    The SQL files listed in the manifest of an earlier run are removed so
+    the manifest only lists the statements given.  Other files are kept.
+
+    :param output_dir: directory to write the files to, created if needed
+    :param compiled: list of (name, sql) tuples, in the order they would run
+    :param errors: list of (name, message) tuples for statements which could
+        not be generated
+    :return: the manifest dict, also written to manifest.json
+    :raises FileExistsError: if the directory holds files but no manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    _remove_written_sql(output_dir)
+
+    statements = []
+    for index, (name, sql) in enumerate(compiled):
+        content = f'{sql.strip()}\n'
+        file_name = SQL_FILE.format(index=index, name=_to_file_name(name))
+        with open(os.path.join(output_dir, file_name), 'w') as sql_file:
+            sql_file.write(content)
+
+        statement = {
+            FILE: file_name,
+            NAME: name,
+            SHA256: get_sql_hash(content),
+        }
+        statement.update(check_sql(content))
+        statements.append(statement)
+
+    manifest = {
+        SHA256:
+            get_sql_hash(''.join(
+                statement[FILE] + statement[SHA256] for statement in statements)
+                        ),
+        STATEMENTS:
+            statements,
+        ERRORS: [{
+            NAME: name,
+            ERROR: message
+        } for name, message in errors or []]
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+def log_manifest(output_dir, manifest):
+    """
+    Log the statements written and the problems found
+
+    Statements which could not be generated are reported apart from the
+    problems found in the SQL, e.g. rules which need BigQuery to build
+    their queries.
+
+    :param output_dir: directory the files were written to
+    :param manifest: the manifest dict returned by write_compiled_sql
+    :return: number of statements with problems in their SQL
+    """
+    failed = 0
+    for statement in manifest[STATEMENTS]:
+        if statement[PROBLEMS]:
+            failed += 1
+            LOGGER.warning(f'{statement[FILE]}: '
+                           f'{"; ".join(statement[PROBLEMS])}')
+    for error in manifest[ERRORS]:
+        LOGGER.warning(f'{error[NAME]} could not be generated: {error[ERROR]}')
+
+    LOGGER.info(f'Wrote {len(manifest[STATEMENTS])} statements to '
+                f'{output_dir} with hash {manifest[SHA256]}, {failed} with '
+                f'problems, {len(manifest[ERRORS])} could not be generated')
+    return failed
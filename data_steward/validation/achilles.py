@@ -1,10 +1,13 @@
 import json
 import logging
 import os
+from collections import OrderedDict
 
 import app_identity
 import bq_utils
 import resources
+from curation_logging import curation_gae_handler
+from utils import dag_executor
 from validation import sql_wrangle
 
 ACHILLES_ANALYSIS = 'achilles_analysis'
@@ -14,6 +17,14 @@ ACHILLES_TABLES = [ACHILLES_ANALYSIS, ACHILLES_RESULTS, ACHILLES_RESULTS_DIST]
 ACHILLES_DML_SQL_PATH = os.path.join(resources.resource_files_path,
                                      'achilles_dml.sql')
 INSERT_INTO = 'insert into'
+MAX_CONCURRENT_JOBS = 8
+# limits the size of a fused job's script
+MAX_FUSED_ANALYSES = 20
+FUSED_BRANCH = '''SELECT * FROM (
+{query}
+)'''
+FUSED_INSERT = '''insert into {table_name} ({columns})
+{branches}'''
 
 
 def _get_run_analysis_commands(hpo_id):
@@ -81,18 +92,138 @@ def run_analysis_job(command):
         raise RuntimeError('Job id %s taking too long' % job_id)
 
 
-def run_analyses(hpo_id):
+def run_command(command):
+    """
+    Runs an achilles command and waits for it to complete
+    :param command: query to run
+    :return: None
+    """
+    if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
+        drop_or_truncate_table(command)
+    else:
+        run_analysis_job(command)
+
+
+def get_source_table(command, source_table_ids):
+    """
+    Get the first source table an analysis reads
+    :param command: an insert command
+    :param source_table_ids: ids of the tables considered as sources
+    :return: the table id or None if the command reads none of them
+    """
+    for name in sql_wrangle.TABLE_NAME_PATTERN.findall(command):
+        if name in source_table_ids:
+            return name
+    return None
+
+
+def fuse_inserts(commands):
+    """
+    Combine insert commands into one job
+
+    Inserts into the same table with the same column list become a single
+    insert of the UNION ALL of their queries.  Several such inserts are run
+    as a multi-statement script.
+    :param commands: insert commands which do not depend on each other
+    :return: a single command
+    """
+    groups = OrderedDict()
+    for command in commands:
+        table_name, columns, query = sql_wrangle.get_insert_parts(command)
+        groups.setdefault((table_name, columns), []).append(query)
+    statements = []
+    for (table_name, columns), queries in groups.items():
+        branches = '\nUNION ALL\n'.join(
+            FUSED_BRANCH.format(query=query) for query in queries)
+        statements.append(
+            FUSED_INSERT.format(table_name=table_name,
+                                columns=', '.join(columns),
+                                branches=branches))
+    return ';\n'.join(statements)
+
+
+def get_fused_commands(commands,
+                       dependencies,
+                       hpo_id,
+                       max_fused_analyses=MAX_FUSED_ANALYSES):
+    """
+    Group independent analyses reading the same CDM table into fused commands
+
+    Only inserts which neither depend on nor are depended on by another
+    command are fused; the other commands are kept with their dependencies.
+    :param commands: qualified achilles commands
+    :param dependencies: dict mapping the index of a command to the indexes
+        of the commands it depends on
+    :param hpo_id: hpo_id of the site to run on
+    :param max_fused_analyses: maximum number of analyses in a fused command
+    :return: tuple (commands, dependencies) with the same meaning as the
+        arguments, where each fused command replaces several commands
+    """
+    source_table_ids = set(
+        bq_utils.get_table_id(hpo_id, table_name)
+        for table_name in resources.CDM_TABLES)
+    depended_on = set(index for index_dependencies in dependencies.values()
+                      for index in index_dependencies)
+
+    groups = OrderedDict()
+    kept = []
+    for index, command in enumerate(commands):
+        source_table = get_source_table(command, source_table_ids)
+        fusable = (not dependencies.get(index) and index not in depended_on and
+                   not sql_wrangle.is_truncate(command) and
+                   not sql_wrangle.is_drop(command) and
+                   not sql_wrangle.is_to_temp_table(command) and
+                   sql_wrangle.get_insert_parts(command) is not None and
+                   source_table is not None)
+        if fusable:
+            groups.setdefault(source_table, []).append(index)
+        else:
+            kept.append(index)
+
+    fused_commands = []
+    for indexes in groups.values():
+        for start in range(0, len(indexes), max_fused_analyses):
+            chunk = indexes[start:start + max_fused_analyses]
+            fused_commands.append(
+                fuse_inserts([commands[index] for index in chunk]))
+
+    # kept commands follow the fused ones, their dependencies renumbered
+    new_indexes = {
+        index: len(fused_commands) + position
+        for position, index in enumerate(kept)
+    }
+    new_dependencies = dict()
+    for index in kept:
+        new_dependencies[new_indexes[index]] = set(
+            new_indexes[dependency] for dependency in dependencies[index])
+    logging.info(f'Fused {len(commands) - len(kept)} achilles commands into '
+                 f'{len(fused_commands)} jobs')
+    return fused_commands + [commands[index] for index in kept
+                            ], new_dependencies
+
+
+def run_analyses(hpo_id, max_concurrent_jobs=MAX_CONCURRENT_JOBS, fused=False):
     """
     Run the achilles analyses
+
+    Commands which do not depend on each other's tables run concurrently.
     :param hpo_id: hpo_id of the site to run on
+    :param max_concurrent_jobs: maximum number of commands running at once
+    :param fused: if True, analyses reading the same CDM table are run as one
+        job (see get_fused_commands)
     :return: None
     """
     commands = _get_run_analysis_commands(hpo_id)
-    for command in commands:
-        if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
-            drop_or_truncate_table(command)
-        else:
-            run_analysis_job(command)
+    dependencies = sql_wrangle.get_command_dependencies(commands)
+    if fused:
+        commands, dependencies = get_fused_commands(commands, dependencies,
+                                                    hpo_id)
+    dag_executor.run_dag(list(range(len(commands))),
+                         dependencies,
+                         lambda index: run_command(commands[index]),
+                         max_concurrent_jobs,
+                         initializer=curation_gae_handler.set_gcp_logger,
+                         initargs=(curation_gae_handler.get_gcp_logger(),))
 
 
 def create_tables(hpo_id, drop_existing=False):
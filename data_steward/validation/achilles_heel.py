@@ -5,6 +5,8 @@ from io import open
 
 import bq_utils
 import resources
+from curation_logging import curation_gae_handler
+from utils import dag_executor
 from validation import sql_wrangle
 
 ACHILLES_HEEL_RESULTS = 'achilles_heel_results'
@@ -17,6 +19,8 @@ SPLIT_PATTERN = ';zzzzzz'
 TRUNCATE_TABLE_PATTERN = re.compile('\s*truncate\s+table\s+([^\s]+)')
 DROP_TABLE_PATTERN = re.compile('\s*drop\s+table\s+([^\s]+)')
 
+MAX_CONCURRENT_JOBS = 8
+
 ACHILLES_HEEL_DML = os.path.join(resources.resource_files_path,
                                  'achilles_heel_dml.sql')
 
@@ -101,19 +105,37 @@ def run_heel_analysis_job(command):
         raise RuntimeError('Job id %s taking too long' % job_id)
 
 
-def run_heel(hpo_id):
+def run_heel_command(command):
+    """
+    Runs a heel command and waits for it to complete
+
+    :param command: query to run
+    :returns: None
+    """
+    if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
+        drop_or_truncate_table(command)
+    else:
+        run_heel_analysis_job(command)
+
+
+def run_heel(hpo_id, max_concurrent_jobs=MAX_CONCURRENT_JOBS):
     """
     Run heel commands
 
+    Commands which do not depend on each other's tables run concurrently.
+
     :param hpo_id:  string name for the hpo identifier
+    :param max_concurrent_jobs: maximum number of commands running at once
     :returns: None
     """
-    commands = _get_heel_commands(hpo_id)
-    for command in commands:
-        if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
-            drop_or_truncate_table(command)
-        else:
-            run_heel_analysis_job(command)
+    commands = list(_get_heel_commands(hpo_id))
+    dependencies = sql_wrangle.get_command_dependencies(commands)
+    dag_executor.run_dag(list(range(len(commands))),
+                         dependencies,
+                         lambda index: run_heel_command(commands[index]),
+                         max_concurrent_jobs,
+                         initializer=curation_gae_handler.set_gcp_logger,
+                         initargs=(curation_gae_handler.get_gcp_logger(),))
 
 
 def create_tables(hpo_id, drop_existing=False):
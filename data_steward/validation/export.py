@@ -1,14 +1,21 @@
+import gzip
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
-from io import open
+from io import BytesIO, TextIOWrapper, open
 
 import bq_utils
 import resources
+from curation_logging import curation_gae_handler
 
 EXPORT_PATH = os.path.join(resources.resource_files_path, 'export')
 RESULTS_SCHEMA_PLACEHOLDER = '@results_database_schema.'
 VOCAB_SCHEMA_PLACEHOLDER = '@vocab_database_schema.'
 UNIONED_EHR = 'unioned_ehr'
+MAX_CONCURRENT_QUERIES = 8
+GZIP_ENCODING = 'gzip'
+_PAYLOAD_CONVERTERS = {'INTEGER': int, 'FLOAT': float}
 
 
 def list_files(base_path):
@@ -52,35 +59,59 @@ def is_hpo_id(hpo_id):
     return hpo_id in [item['hpo_id'] for item in bq_utils.get_hpo_info()]
 
 
-# TODO Make this function more generic.
-def export_from_path(p, datasource_id):
+def _export_file(file_path, datasource_id):
     """
-    Export results
-    :param p: path to SQL file
+    Run the export query in a SQL file
+    :param file_path: path to SQL file
     :param datasource_id: HPO or aggregate dataset to run export for
-    :return: `dict` structured for report render
+    :return: the query result as a payload
     """
-    result = dict()
-    if not is_hpo_id(datasource_id) and datasource_id != UNIONED_EHR:
-        datasource_id = None
+    with open(file_path, 'r') as fp:
+        sql = fp.read()
+    sql = render(sql,
+                 datasource_id,
+                 results_schema=bq_utils.get_dataset_id(),
+                 vocab_schema='')
+    query_result = bq_utils.query(sql)
+    # TODO reshape results
+    return query_result_to_payload(query_result)
+
+
+def _submit_exports(p, datasource_id, executor):
+    """
+    Start the export queries of every SQL file under a path
+    :param p: path to a directory of SQL files
+    :param datasource_id: HPO or aggregate dataset to run export for
+    :param executor: runs the queries
+    :return: tuple (files, dirs) where files is a list of tuples (name, future)
+        and dirs is a list of tuples (name, (files, dirs)) for subdirectories
+    """
+    files = []
     for f in list_files_only(p):
         name = f[0:-4].upper()
-        abs_path = os.path.join(p, f)
-        with open(abs_path, 'r') as fp:
-            sql = fp.read()
-            sql = render(sql,
-                         datasource_id,
-                         results_schema=bq_utils.get_dataset_id(),
-                         vocab_schema='')
-            query_result = bq_utils.query(sql)
-            # TODO reshape results
-            result[name] = query_result_to_payload(query_result)
-
+        future = executor.submit(_export_file, os.path.join(p, f),
+                                 datasource_id)
+        files.append((name, future))
+    dirs = []
     for d in list_dirs_only(p):
         abs_path = os.path.join(p, d)
-        name = d.upper()
-        # recursive call
-        dir_result = export_from_path(abs_path, datasource_id)
+        dirs.append(
+            (d.upper(), _submit_exports(abs_path, datasource_id, executor)))
+    return files, dirs
+
+
+def _collect_exports(submitted):
+    """
+    Assemble the results of export queries started by _submit_exports
+    :param submitted: tuple (files, dirs) returned by _submit_exports
+    :return: `dict` structured for report render
+    """
+    files, dirs = submitted
+    result = dict()
+    for name, future in files:
+        result[name] = future.result()
+    for name, dir_submitted in dirs:
+        dir_result = _collect_exports(dir_submitted)
         if name in result:
             # a sql file generated the item already
             result[name].update(dir_result)
@@ -90,6 +121,53 @@ def export_from_path(p, datasource_id):
     return result
 
 
+def export_from_paths(paths, datasource_id, max_workers=MAX_CONCURRENT_QUERIES):
+    """
+    Export results of several reports, running their queries concurrently
+    :param paths: paths to the directories of SQL files of the reports
+    :param datasource_id: HPO or aggregate dataset to run export for
+    :param max_workers: maximum number of queries running at the same time
+    :return: list of `dict` structured for report render, one per path
+    """
+    if not is_hpo_id(datasource_id) and datasource_id != UNIONED_EHR:
+        datasource_id = None
+    with ThreadPoolExecutor(
+            max_workers=max_workers,
+            initializer=curation_gae_handler.set_gcp_logger,
+            initargs=(curation_gae_handler.get_gcp_logger(),)) as executor:
+        submitted = [_submit_exports(p, datasource_id, executor) for p in paths]
+        return [_collect_exports(item) for item in submitted]
+
+
+# TODO Make this function more generic.
+def export_from_path(p, datasource_id):
+    """
+    Export results
+    :param p: path to SQL file
+    :param datasource_id: HPO or aggregate dataset to run export for
+    :return: `dict` structured for report render
+    """
+    return export_from_paths([p], datasource_id)[0]
+
+
+def gzip_json(payload):
+    """
+    Serialize a payload as gzip compressed JSON
+    :param payload: JSON serializable object
+    :return: file-like object positioned at the start of the compressed bytes
+    """
+    fp = BytesIO()
+    with gzip.GzipFile(fileobj=fp, mode='wb') as gz:
+        # encode while serializing rather than building the whole JSON string
+        text = TextIOWrapper(gz, encoding='utf-8')
+        json.dump(payload, text)
+        text.flush()
+        # leave closing the GzipFile to the with statement
+        text.detach()
+    fp.seek(0)
+    return fp
+
+
 def convert_value(value, tpe):
     """
     Cast to specified type
@@ -114,12 +192,17 @@ def query_result_to_payload(qr):
     result = dict()
     rows = qr['rows'] if int(qr['totalRows']) > 0 else []
     fields = qr['schema']['fields']
-    field_count = len(fields)
-    for i in range(0, field_count):
-        field = fields[i]
+    # transpose once instead of indexing every row for each column
+    columns = zip(*[[cell['v'] for cell in r['f']] for r in rows])
+    columns = list(columns) or [()] * len(fields)
+    for field, column in zip(fields, columns):
         key = field['name'].upper()
-        tpe = field['type'].upper()
-        values = [convert_value(r['f'][i]['v'], tpe) for r in rows]
+        convert = _PAYLOAD_CONVERTERS.get(field['type'].upper())
+        if convert is None:
+            values = list(column)
+        else:
+            # same as convert_value: falsey values are kept as is
+            values = [convert(value) if value else value for value in column]
         # according to AchillesWeb rjson serializes dataframes with 1 row as single element properties
         # see https://github.com/OHDSI/AchillesWeb/blob/master/js/app/common.js#L134
         result[key] = values[0] if len(values) == 1 else values
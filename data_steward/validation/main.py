@@ -11,6 +11,8 @@ import json
 import logging
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import StringIO, open
 
 # Third party imports
@@ -29,6 +31,7 @@ import resources
 from common import ACHILLES_EXPORT_PREFIX_STRING, ACHILLES_EXPORT_DATASOURCES_JSON
 from constants.validation import hpo_report as report_consts
 from constants.validation import main as consts
+from curation_logging import curation_gae_handler
 from curation_logging.curation_gae_handler import begin_request_logging, end_request_logging, \
     initialize_logging
 from curation_logging.slack_logging_handler import initialize_slack_logging
@@ -109,15 +112,24 @@ def run_export(datasource_id=None, folder_prefix="", target_bucket=None):
 
     # Run export queries and store json payloads in specified folder in the target bucket
     reports_prefix = folder_prefix + ACHILLES_EXPORT_PREFIX_STRING + datasource_name + '/'
-    for export_name in common.ALL_REPORTS:
-        sql_path = os.path.join(export.EXPORT_PATH, export_name)
-        result = export.export_from_path(sql_path, datasource_id)
-        content = json.dumps(result)
-        fp = StringIO(content)
-        result = gcs_utils.upload_object(target_bucket,
-                                         reports_prefix + export_name + '.json',
-                                         fp)
-        results.append(result)
+    sql_paths = [
+        os.path.join(export.EXPORT_PATH, export_name)
+        for export_name in common.ALL_REPORTS
+    ]
+    reports = export.export_from_paths(sql_paths, datasource_id)
+
+    def upload_report(export_name, report):
+        # AchillesWeb reads the reports with the Content-Encoding honored
+        return gcs_utils.upload_object(target_bucket,
+                                       reports_prefix + export_name + '.json',
+                                       export.gzip_json(report),
+                                       content_encoding=export.GZIP_ENCODING)
+
+    with ThreadPoolExecutor(
+            max_workers=len(reports),
+            initializer=curation_gae_handler.set_gcp_logger,
+            initargs=(curation_gae_handler.get_gcp_logger(),)) as executor:
+        results.extend(executor.map(upload_report, common.ALL_REPORTS, reports))
     result = save_datasources_json(datasource_id=datasource_id,
                                    folder_prefix=folder_prefix,
                                    target_bucket=target_bucket)
@@ -193,12 +205,122 @@ def validate_all_hpos():
     """
     validation end point for all hpo_ids
     """
-    for item in bq_utils.get_hpo_info():
-        hpo_id = item['hpo_id']
-        process_hpo(hpo_id)
+    hpo_ids = [item['hpo_id'] for item in bq_utils.get_hpo_info()]
+    validate_hpos(hpo_ids)
     return 'validation done!'
 
 
+def get_validation_workers():
+    """
+    Get the number of sites to validate at the same time
+
+    :return: value of VALIDATION_WORKERS if set, the default otherwise
+    """
+    return int(
+        os.environ.get(consts.VALIDATION_WORKERS_ENV,
+                       consts.DEFAULT_VALIDATION_WORKERS))
+
+
+def get_submission_size(bucket_items):
+    """
+    Estimate the size of the latest submission in a bucket
+
+    The most recently updated folder is taken to be the latest submission.
+
+    :param bucket_items: items in the bucket, as a list or gcs_utils.BucketIndex
+    :return: total size in bytes of the objects in the folder
+    """
+    bucket_index = gcs_utils.BucketIndex.for_items(bucket_items)
+    latest_folder_items = max(
+        (bucket_index.folder_items(folder)
+         for folder in bucket_index.folders()),
+        key=lambda items: max(item.get('updated', '') for item in items),
+        default=[])
+    return sum(int(item.get('size', 0)) for item in latest_folder_items)
+
+
+def _list_hpo_bucket(hpo_id):
+    """
+    List the bucket of a site for ordering and reuse by process_hpo
+
+    :param hpo_id: identifies the hpo site
+    :return: gcs_utils.BucketIndex of the bucket, None if it could not be
+        listed (process_hpo reports the error)
+    """
+    try:
+        bucket = gcs_utils.get_hpo_bucket(hpo_id)
+        return gcs_utils.BucketIndex(list_bucket(bucket))
+    except Exception:
+        logging.warning(f"Unable to list bucket for hpo_id '{hpo_id}'")
+        return None
+
+
+def _timed_process_hpo(hpo_id, bucket_items):
+    """
+    Validate a site, isolating and timing it
+
+    :param hpo_id: identifies the hpo site
+    :param bucket_items: items in the site's bucket, None to list them
+    :return: tuple (hpo_id, succeeded, seconds)
+    """
+    start = time.time()
+    succeeded = True
+    try:
+        process_hpo(hpo_id, bucket_items=bucket_items)
+    except Exception:
+        succeeded = False
+        logging.exception(f"Failed to process hpo_id '{hpo_id}'")
+    return hpo_id, succeeded, time.time() - start
+
+
+def validate_hpos(hpo_ids, max_workers=None):
+    """
+    Validate the latest submissions of several sites concurrently
+
+    Sites with the largest submissions are started first so that the slowest
+    site does not start last.  A failure in one site does not stop the others.
+
+    :param hpo_ids: identifies the hpo sites
+    :param max_workers: number of sites to validate at the same time, defaults
+        to get_validation_workers()
+    :return: list of tuples (hpo_id, succeeded, seconds, submission size)
+    """
+    if max_workers is None:
+        max_workers = get_validation_workers()
+    if not hpo_ids:
+        return []
+    start = time.time()
+    with ThreadPoolExecutor(
+            max_workers=max_workers,
+            initializer=curation_gae_handler.set_gcp_logger,
+            initargs=(curation_gae_handler.get_gcp_logger(),)) as executor:
+        bucket_indexes = dict(
+            zip(hpo_ids, executor.map(_list_hpo_bucket, hpo_ids)))
+        sizes = {
+            hpo_id: get_submission_size(bucket_index) if bucket_index else 0
+            for hpo_id, bucket_index in bucket_indexes.items()
+        }
+        ordered_hpo_ids = sorted(hpo_ids, key=sizes.get, reverse=True)
+        futures = [
+            executor.submit(_timed_process_hpo, hpo_id, bucket_indexes[hpo_id])
+            for hpo_id in ordered_hpo_ids
+        ]
+        summary = []
+        for future in as_completed(futures):
+            hpo_id, succeeded, seconds = future.result()
+            summary.append((hpo_id, succeeded, seconds, sizes[hpo_id]))
+
+    summary.sort(key=lambda row: row[2], reverse=True)
+    lines = [
+        f"{hpo_id}: {'done' if succeeded else 'FAILED'} in {seconds:.1f}s "
+        f"({size} bytes)" for hpo_id, succeeded, seconds, size in summary
+    ]
+    logging.info(f"Validated {len(summary)} sites in "
+                 f"{time.time() - start:.1f}s using {max_workers} workers:\n" +
+                 '\n'.join(lines))
+    return summary
+
+
 def list_bucket(bucket):
     try:
         return gcs_utils.list_bucket(bucket)
@@ -252,27 +374,14 @@ def validate_submission(hpo_id, bucket, folder_items, folder_prefix):
     found_cdm_files, found_pii_files, unknown_files = categorize_folder_items(
         folder_items)
 
-    errors = []
-    results = []
-
     # Create all tables first to simplify downstream processes
     # (e.g. ehr_union doesn't have to check if tables exist)
-    for file_name in resources.CDM_FILES + common.PII_FILES:
-        table_name = file_name.split('.')[0]
-        table_id = bq_utils.get_table_id(hpo_id, table_name)
-        bq_utils.create_standard_table(table_name, table_id, drop_existing=True)
-
-    for cdm_file_name in sorted(resources.CDM_FILES):
-        file_results, file_errors = perform_validation_on_file(
-            cdm_file_name, found_cdm_files, hpo_id, folder_prefix, bucket)
-        results.extend(file_results)
-        errors.extend(file_errors)
+    create_submission_tables(hpo_id)
 
-    for pii_file_name in sorted(common.PII_FILES):
-        file_results, file_errors = perform_validation_on_file(
-            pii_file_name, found_pii_files, hpo_id, folder_prefix, bucket)
-        results.extend(file_results)
-        errors.extend(file_errors)
+    # CDM and PII file names do not overlap, so load them as one batch
+    results, errors = load_submission_files(
+        sorted(resources.CDM_FILES) + sorted(common.PII_FILES),
+        found_cdm_files + found_pii_files, hpo_id, folder_prefix, bucket)
 
     # (filename, message) for each unknown file
     warnings = [
@@ -306,6 +415,7 @@ def generate_metrics(hpo_id, bucket, folder_prefix, summary):
     report_data[report_consts.HPO_NAME_REPORT_KEY] = get_hpo_name(hpo_id)
     report_data[report_consts.FOLDER_REPORT_KEY] = folder_prefix
     results = report_data['results']
+    metric_queries = []
     try:
         # TODO modify achilles to run successfully when tables are empty
         # achilles queries will raise exceptions (e.g. division by zero) if files not present
@@ -315,61 +425,99 @@ def generate_metrics(hpo_id, bucket, folder_prefix, summary):
             run_export(datasource_id=hpo_id, folder_prefix=folder_prefix)
             logging.info(f"Uploading achilles index files to '{gcs_path}'.")
             _upload_achilles_files(hpo_id, folder_prefix)
-            heel_error_query = get_heel_error_query(hpo_id)
-            report_data[report_consts.HEEL_ERRORS_REPORT_KEY] = query_rows(
-                heel_error_query)
+            metric_queries.append(
+                (report_consts.HEEL_ERRORS_REPORT_KEY, get_heel_error_query))
         else:
             report_data[
                 report_consts.
                 SUBMISSION_ERROR_REPORT_KEY] = "Required files are missing"
             logging.info(
                 f"Required files are missing in {gcs_path}. Skipping achilles.")
-
-        # non-unique key metrics
-        logging.info(f"Getting non-unique key stats for {hpo_id}")
-        nonunique_metrics_query = get_duplicate_counts_query(hpo_id)
-        report_data[
-            report_consts.NONUNIQUE_KEY_METRICS_REPORT_KEY] = query_rows(
-                nonunique_metrics_query)
-
-        # drug class metrics
-        logging.info(f"Getting drug class for {hpo_id}")
-        drug_class_metrics_query = get_drug_class_counts_query(hpo_id)
-        report_data[report_consts.DRUG_CLASS_METRICS_REPORT_KEY] = query_rows(
-            drug_class_metrics_query)
-
-        # missing PII
-        logging.info(f"Getting missing record stats for {hpo_id}")
-        missing_pii_query = get_hpo_missing_pii_query(hpo_id)
-        missing_pii_results = query_rows(missing_pii_query)
-        report_data[report_consts.MISSING_PII_KEY] = missing_pii_results
-
-        # completeness
-        logging.info(f"Getting completeness stats for {hpo_id}")
-        completeness_query = completeness.get_hpo_completeness_query(hpo_id)
-        report_data[report_consts.COMPLETENESS_REPORT_KEY] = query_rows(
-            completeness_query)
-
-        # lab concept metrics
-        logging.info(f"Getting lab concepts for {hpo_id}")
-        lab_concept_metrics_query = required_labs.get_lab_concept_summary_query(
-            hpo_id)
-        report_data[report_consts.LAB_CONCEPT_METRICS_REPORT_KEY] = query_rows(
-            lab_concept_metrics_query)
-
-        logging.info(f"Processing complete.")
     except HttpError as err:
         # cloud error occurred- log details for troubleshooting
         logging.exception(
             f"Failed to generate full report due to the following cloud error:\n\n{err.content}"
         )
         error_occurred = True
+
+    # the remaining metrics do not depend on achilles or on each other
+    metric_queries += [(report_consts.NONUNIQUE_KEY_METRICS_REPORT_KEY,
+                        get_duplicate_counts_query),
+                       (report_consts.DRUG_CLASS_METRICS_REPORT_KEY,
+                        get_drug_class_counts_query),
+                       (report_consts.MISSING_PII_KEY,
+                        get_hpo_missing_pii_query),
+                       (report_consts.COMPLETENESS_REPORT_KEY,
+                        completeness.get_hpo_completeness_query),
+                       (report_consts.LAB_CONCEPT_METRICS_REPORT_KEY,
+                        required_labs.get_lab_concept_summary_query)]
+    try:
+        if run_metric_queries(hpo_id, metric_queries, report_data):
+            error_occurred = True
+        logging.info(f"Processing complete.")
     finally:
         # report all results collected (attempt even if cloud error occurred)
         report_data[report_consts.ERROR_OCCURRED_REPORT_KEY] = error_occurred
     return report_data
 
 
+def _run_metric_query(hpo_id, get_query):
+    """
+    Generate and run a metric query for a site
+
+    :param hpo_id: identifies the HPO site
+    :param get_query: function which returns the query for an hpo_id
+    :return: tuple (rows, error, seconds) where rows is None and error is the
+        HttpError raised if a cloud error occurred
+    """
+    start = time.time()
+    try:
+        return query_rows(get_query(hpo_id)), None, time.time() - start
+    except HttpError as err:
+        return None, err, time.time() - start
+
+
+def run_metric_queries(hpo_id, metric_queries, report_data):
+    """
+    Run independent metric queries for a site concurrently
+
+    Results of the queries which succeed are stored in report_data even if
+    others fail.  The seconds taken by each query are stored under
+    METRIC_LATENCY_REPORT_KEY.
+
+    :param hpo_id: identifies the HPO site
+    :param metric_queries: list of tuples (report_key, get_query) where
+        get_query returns the query for an hpo_id
+    :param report_data: dict the results are stored in, keyed by report_key
+    :return: True if a cloud error occurred, False otherwise
+    """
+    error_occurred = False
+    latency = report_data.setdefault(report_consts.METRIC_LATENCY_REPORT_KEY,
+                                     dict())
+    with ThreadPoolExecutor(
+            max_workers=consts.METRICS_WORKERS,
+            initializer=curation_gae_handler.set_gcp_logger,
+            initargs=(curation_gae_handler.get_gcp_logger(),)) as executor:
+        futures = dict()
+        for report_key, get_query in metric_queries:
+            logging.info(f"Getting {report_key} for {hpo_id}")
+            future = executor.submit(_run_metric_query, hpo_id, get_query)
+            futures[future] = report_key
+        for future in as_completed(futures):
+            report_key = futures[future]
+            rows, err, latency[report_key] = future.result()
+            if err is None:
+                report_data[report_key] = rows
+            else:
+                # cloud error occurred- log details for troubleshooting
+                logging.error(
+                    f"Failed to get {report_key} due to the following cloud error:\n\n{err.content}",
+                    exc_info=err)
+                error_occurred = True
+    logging.info(f"Metric query latency (seconds) for {hpo_id}: {latency}")
+    return error_occurred
+
+
 def generate_empty_report(hpo_id, folder_prefix):
     """
     Generate an empty report with a "validation failed" error
@@ -477,24 +625,25 @@ def get_folder_items(bucket_items, folder_prefix):
     """
     Returns items in bucket which belong to a folder
 
-    :param bucket_items: items in the bucket
+    :param bucket_items: items in the bucket, as a list or gcs_utils.BucketIndex
     :param folder_prefix: prefix containing the folder name
     :return: list of items in the folder without the folder prefix
     """
+    bucket_index = gcs_utils.BucketIndex.for_items(bucket_items)
     return [
         item['name'][len(folder_prefix):]
-        for item in bucket_items
-        if item['name'].startswith(folder_prefix)
+        for item in bucket_index.folder_items(folder_prefix)
     ]
 
 
-def process_hpo(hpo_id, force_run=False):
+def process_hpo(hpo_id, force_run=False, bucket_items=None):
     """
     runs validation for a single hpo_id
 
     :param hpo_id: which hpo_id to run for
     :param force_run: if True, process the latest submission whether or not it
         has already been processed before
+    :param bucket_items: items in the hpo bucket if already listed
     :raises
     BucketDoesNotExistError:
       Raised when a configured bucket does not exist
@@ -504,7 +653,10 @@ def process_hpo(hpo_id, force_run=False):
     try:
         logging.info(f"Processing hpo_id {hpo_id}")
         bucket = gcs_utils.get_hpo_bucket(hpo_id)
-        bucket_items = list_bucket(bucket)
+        # index the listing once so folder lookups do not rescan the bucket
+        if bucket_items is None:
+            bucket_items = list_bucket(bucket)
+        bucket_items = gcs_utils.BucketIndex.for_items(bucket_items)
         folder_prefix = _get_submission_folder(bucket, bucket_items, force_run)
         if folder_prefix is None:
             logging.info(
@@ -671,20 +823,83 @@ def perform_validation_on_file(file_name, found_file_names, hpo_id,
      results is list of tuples (file_name, found, parsed, loaded)
      errors is list of tuples (file_name, message)
     """
+    return load_submission_files([file_name], found_file_names, hpo_id,
+                                 folder_prefix, bucket)
+
+
+def create_submission_tables(hpo_id):
+    """
+    Create (or recreate) empty CDM and PII tables for a site concurrently
+
+    :param hpo_id: identifies the hpo site
+    """
+    table_names = [
+        file_name.split('.')[0]
+        for file_name in resources.CDM_FILES + common.PII_FILES
+    ]
+
+    def create_table(table_name):
+        table_id = bq_utils.get_table_id(hpo_id, table_name)
+        bq_utils.create_standard_table(table_name, table_id, drop_existing=True)
+
+    with ThreadPoolExecutor(
+            max_workers=consts.TABLE_CREATION_WORKERS,
+            initializer=curation_gae_handler.set_gcp_logger,
+            initargs=(curation_gae_handler.get_gcp_logger(),)) as executor:
+        # list() re-raises the first error encountered
+        list(executor.map(create_table, table_names))
+
+
+def load_submission_files(file_names, found_file_names, hpo_id, folder_prefix,
+                          bucket):
+    """
+    Attempts to load csv files into BigQuery
+
+    Load jobs for all found files are started before waiting on any of them.
+
+    :param file_names: names of the files to validate
+    :param found_file_names: files found in the submission folder
+    :param hpo_id: identifies the hpo site
+    :param folder_prefix: directory containing the submission
+    :param bucket: bucket containing the submission
+    :return: tuple (results, errors) where
+     results is list of tuples (file_name, found, parsed, loaded) in the order
+     of file_names
+     errors is list of tuples (file_name, message)
+    """
+    load_job_ids = dict()
+    for file_name in file_names:
+        if file_name in found_file_names:
+            logging.info(f"Validating file '{file_name}'")
+            table_name = file_name.split('.')[0]
+            load_results = bq_utils.load_from_csv(hpo_id, table_name,
+                                                  folder_prefix)
+            load_job_ids[file_name] = load_results['jobReference']['jobId']
+
+    incomplete_jobs = bq_utils.wait_on_jobs(list(load_job_ids.values()))
+    if incomplete_jobs:
+        # Incomplete jobs are internal unrecoverable errors.
+        # Aborting the process allows for this submission to be validated when system recovers.
+        incomplete_tables = [
+            file_name.split('.')[0]
+            for file_name, load_job_id in load_job_ids.items()
+            if load_job_id in incomplete_jobs
+        ]
+        message = (f"Loading hpo_id '{hpo_id}' table(s) {incomplete_tables} "
+                   f"failed because job id(s) {incomplete_jobs} did not "
+                   f"complete.\n")
+        message += f"Aborting processing 'gs://{bucket}/{folder_prefix}'."
+        logging.error(message)
+        raise InternalValidationError(message)
+
     errors = []
     results = []
-    logging.info(f"Validating file '{file_name}'")
-    found = parsed = loaded = 0
-    table_name = file_name.split('.')[0]
-
-    if file_name in found_file_names:
-        found = 1
-        load_results = bq_utils.load_from_csv(hpo_id, table_name, folder_prefix)
-        load_job_id = load_results['jobReference']['jobId']
-        incomplete_jobs = bq_utils.wait_on_jobs([load_job_id])
-
-        if not incomplete_jobs:
-            job_resource = bq_utils.get_job_details(job_id=load_job_id)
+    for file_name in file_names:
+        found = parsed = loaded = 0
+        if file_name in load_job_ids:
+            found = 1
+            job_resource = bq_utils.get_job_details(
+                job_id=load_job_ids[file_name])
             job_status = job_resource['status']
             if 'errorResult' in job_status:
                 # These are issues (which we report back) as opposed to internal errors
@@ -698,18 +913,9 @@ def perform_validation_on_file(file_name, found_file_names, hpo_id,
             else:
                 # Processed ok
                 parsed = loaded = 1
-        else:
-            # Incomplete jobs are internal unrecoverable errors.
-            # Aborting the process allows for this submission to be validated when system recovers.
-            message = (
-                f"Loading hpo_id '{hpo_id}' table '{table_name}' failed because "
-                f"job id '{load_job_id}' did not complete.\n")
-            message += f"Aborting processing 'gs://{bucket}/{folder_prefix}'."
-            logging.error(message)
-            raise InternalValidationError(message)
-
-    if file_name in common.SUBMISSION_FILES:
-        results.append((file_name, found, parsed, loaded))
+
+        if file_name in common.SUBMISSION_FILES:
+            results.append((file_name, found, parsed, loaded))
 
     return results, errors
 
@@ -753,12 +959,12 @@ def list_submitted_bucket_items(folder_bucketitems):
     files_list = []
     object_retention_days = 30
     today = datetime.datetime.today()
+    retention_time = datetime.timedelta(days=object_retention_days)
+    retention_start_time = datetime.timedelta(days=1)
     for file_name in folder_bucketitems:
         if basename(file_name) not in resources.IGNORE_LIST:
             # in common.CDM_FILES or is_pii(basename(file_name)):
             created_date = initial_date_time_object(file_name)
-            retention_time = datetime.timedelta(days=object_retention_days)
-            retention_start_time = datetime.timedelta(days=1)
             age_threshold = created_date + retention_time - retention_start_time
             if age_threshold > today:
                 files_list.append(file_name)
@@ -783,7 +989,8 @@ def _get_submission_folder(bucket, bucket_items, force_process=False):
     match.
 
     :param bucket: string bucket name to look into
-    :param bucket_items: list of unicode string items in the bucket
+    :param bucket_items: list of unicode string items in the bucket or a
+        gcs_utils.BucketIndex of them
     :param force_process: if True return most recently updated directory, even
         if it has already been processed.
     :returns: a directory prefix string of the form "<directory_name>/" if
@@ -795,11 +1002,11 @@ def _get_submission_folder(bucket, bucket_items, force_process=False):
         directory exists
     """
     # files in root are ignored here
-    all_folder_list = set([
-        item['name'].split('/')[0] + '/'
-        for item in bucket_items
-        if len(item['name'].split('/')) > 1
-    ])
+    bucket_index = gcs_utils.BucketIndex.for_items(bucket_items)
+    all_folder_list = bucket_index.folders()
+    compiled_ignore_exps = [
+        re.compile(exp) for exp in common.IGNORE_DIRECTORIES
+    ]
 
     folder_datetime_list = []
     folders_with_submitted_files = []
@@ -807,8 +1014,7 @@ def _get_submission_folder(bucket, bucket_items, force_process=False):
         # DC-343  special temporary case where we have to deal with a possible
         # directory dumped into the bucket by 'ehr sync' process from RDR
         ignore_folder = False
-        for exp in common.IGNORE_DIRECTORIES:
-            compiled_exp = re.compile(exp)
+        for compiled_exp in compiled_ignore_exps:
             if compiled_exp.match(folder_name.lower()):
                 logging.info(
                     f"Skipping {folder_name} directory.  It is not a submission directory."
@@ -819,10 +1025,7 @@ def _get_submission_folder(bucket, bucket_items, force_process=False):
             continue
 
         # this is not in a try/except block because this follows a bucket read which is in a try/except
-        folder_bucket_items = [
-            item for item in bucket_items
-            if item['name'].startswith(folder_name)
-        ]
+        folder_bucket_items = bucket_index.folder_items(folder_name)
         submitted_bucket_items = list_submitted_bucket_items(
             folder_bucket_items)
 
@@ -1,4 +1,5 @@
 import re
+from collections import defaultdict
 
 import bq_utils
 from io import open
@@ -9,6 +10,11 @@ TEMP_PREFIX = 'temp.'
 TEMP_TABLE_PATTERN = re.compile('\s*INTO\s+([^\s]+)')
 TRUNCATE_TABLE_PATTERN = re.compile('\s*truncate\s+table\s+([^\s]+)')
 DROP_TABLE_PATTERN = re.compile('\s*drop\s+table\s+([^\s]+)')
+INSERT_TABLE_PATTERN = re.compile('insert\s+into\s+([^\s(]+)', re.IGNORECASE)
+TABLE_NAME_PATTERN = re.compile('[\w.]+')
+INSERT_PARTS_PATTERN = re.compile(
+    'insert\s+into\s+([^\s(]+)\s*\(([^)]*)\)\s*(.*)\Z',
+    re.IGNORECASE | re.DOTALL)
 COMMENTED_BLOCK_REGEX = re.compile(
     '(?P<before_comment>(^)(.)*)(?P<comment>(\/\*)(.)*(\*\/))(?P<after_comment>(.)*$)',
     re.DOTALL)
@@ -178,3 +184,116 @@ def get_drop_table_name(q):
     """
     match = DROP_TABLE_PATTERN.search(q)
     return match.group(1)
+
+
+def get_insert_table_name(q):
+    """
+    Given an insert DML statement, get the table rows are inserted into
+    :param q:
+    :return: the table name or None if `q` is not an insert statement
+    """
+    match = INSERT_TABLE_PATTERN.search(q)
+    return match.group(1) if match else None
+
+
+def get_insert_parts(q):
+    """
+    Split an insert DML statement with a column list into its parts
+    :param q:
+    :return: tuple (table_name, column names, query) or None if `q` is not
+        an insert statement with a column list
+    """
+    match = INSERT_PARTS_PATTERN.search(q)
+    if match is None:
+        return None
+    table_name, columns, query = match.groups()
+    columns = tuple(column.strip() for column in columns.split(','))
+    return table_name, columns, query.strip()
+
+
+def get_command_tables(command):
+    """
+    Classify the tables a command reads and writes
+
+    Uses the same classification as the achilles runners: truncate and drop
+    statements, then statements into a temp table, then inserts.
+
+    :param command: a qualified command
+    :return: tuple (table_id, exclusive, names) where table_id is the table
+        written (None if it cannot be determined), exclusive is False if the
+        command only appends rows, and names is the list of all table-like
+        names in the command other than the written table itself
+    """
+    if is_truncate(command):
+        table_id, exclusive = get_truncate_table_name(command), True
+    elif is_drop(command):
+        table_id, exclusive = get_drop_table_name(command), True
+    elif is_to_temp_table(command):
+        table_id, exclusive = get_temp_table_name(command), True
+    else:
+        table_id, exclusive = get_insert_table_name(command), False
+    names = TABLE_NAME_PATTERN.findall(command)
+    if table_id in names:
+        # the first mention is the written table, any other is a read
+        names.remove(table_id)
+    return table_id, exclusive, names
+
+
+def get_command_dependencies(commands):
+    """
+    Find the earlier commands each command must wait for
+
+    Only tables written by one of the commands create dependencies.  A command
+    reading a table waits for the commands that wrote it before, a command
+    appending to a table waits for the commands that read it before, and a
+    command replacing, truncating or dropping a table waits for every earlier
+    command using it.  Appends to the same table do not wait on each other.
+    A command whose written table cannot be determined waits for, and is
+    waited on by, every other command.
+
+    :param commands: list of qualified commands in the order they would run
+        serially
+    :return: dict mapping the index of a command to the set of indexes of the
+        commands it depends on
+    """
+    classified = [get_command_tables(command) for command in commands]
+    written_tables = set(
+        table_id for table_id, _, _ in classified if table_id is not None)
+
+    last_exclusive = dict()
+    appenders = defaultdict(list)
+    readers = defaultdict(list)
+    last_barrier = None
+    dependencies = dict()
+    for index, (table_id, exclusive, names) in enumerate(classified):
+        depends_on = set()
+        if last_barrier is not None:
+            depends_on.add(last_barrier)
+        if table_id is None:
+            depends_on.update(range(index))
+            last_barrier = index
+            dependencies[index] = depends_on
+            continue
+
+        reads = written_tables.intersection(names)
+        for read_table in reads:
+            if read_table in last_exclusive:
+                depends_on.add(last_exclusive[read_table])
+            depends_on.update(appenders[read_table])
+        if table_id in last_exclusive:
+            depends_on.add(last_exclusive[table_id])
+        depends_on.update(readers[table_id])
+        if exclusive:
+            depends_on.update(appenders[table_id])
+
+        for read_table in reads:
+            readers[read_table].append(index)
+        if exclusive:
+            last_exclusive[table_id] = index
+            appenders[table_id] = []
+            readers[table_id] = [index] if table_id in reads else []
+        else:
+            appenders[table_id].append(index)
+        depends_on.discard(index)
+        dependencies[index] = depends_on
+    return dependencies
@@ -2,6 +2,7 @@ import unittest
 from datetime import datetime
 
 import mock
+from googleapiclient.errors import HttpError
 
 import bq_utils
 from constants import bq_utils as bq_utils_consts
@@ -22,54 +23,142 @@ class BqUtilsTest(unittest.TestCase):
         self.assertRaises(ValueError, bq_utils.load_cdm_csv, self.hpo_id,
                           'not_a_cdm_table')
 
-    @mock.patch('bq_utils.job_status_done', lambda x: True)
-    def test_wait_on_jobs_already_done(self):
+    @mock.patch('bq_utils.bq_consts.MIN_POLL_INTERVAL', 0.01)
+    @mock.patch('bq_utils._job_watcher', None)
+    @mock.patch('bq_utils.get_jobs_states')
+    def test_wait_on_jobs_already_done(self, mock_get_jobs_states):
+        mock_get_jobs_states.side_effect = lambda job_ids: {
+            job_id: 'DONE' for job_id in job_ids
+        }
         job_ids = range(3)
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = []
         self.assertEqual(actual, expected)
+        # all jobs are looked up together
+        mock_get_jobs_states.assert_called_once_with([0, 1, 2])
 
-    @mock.patch('time.sleep', return_value=None)
-    @mock.patch('bq_utils.job_status_done', return_value=False)
-    def test_wait_on_jobs_all_fail(self, mock_job_status_done, mock_time_sleep):
+    @mock.patch('bq_utils.bq_consts.MIN_POLL_INTERVAL', 0.01)
+    @mock.patch('bq_utils._job_watcher', None)
+    @mock.patch('bq_utils.get_jobs_states')
+    def test_wait_on_jobs_all_fail(self, mock_get_jobs_states):
+        mock_get_jobs_states.side_effect = lambda job_ids: {
+            job_id: 'RUNNING' for job_id in job_ids
+        }
         job_ids = list(range(3))
-        actual = bq_utils.wait_on_jobs(job_ids)
+        actual = bq_utils.wait_on_jobs(job_ids, timeout=0.1)
         expected = job_ids
         self.assertEqual(actual, expected)
-        # TODO figure out how to count this
-        # self.assertEquals(mock_time_sleep.call_count, bq_utils.BQ_DEFAULT_RETRY_COUNT)
-
-    @mock.patch('time.sleep', return_value=None)
-    @mock.patch(
-        'bq_utils.job_status_done',
-        side_effect=[False, False, False, True, False, False, True, True, True])
-    def test_wait_on_jobs_get_done(self, mock_job_status_done, mock_time_sleep):
+
+    @mock.patch('bq_utils.bq_consts.MIN_POLL_INTERVAL', 0.01)
+    @mock.patch('bq_utils._job_watcher', None)
+    @mock.patch('bq_utils.get_jobs_states')
+    def test_wait_on_jobs_get_done(self, mock_get_jobs_states):
+        mock_get_jobs_states.side_effect = [{
+            0: 'RUNNING',
+            1: 'PENDING',
+            2: 'DONE'
+        }, {
+            0: 'DONE',
+            1: 'RUNNING'
+        }, {
+            1: 'DONE'
+        }]
         job_ids = list(range(3))
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = []
         self.assertEqual(actual, expected)
+        # only outstanding jobs are polled
+        mock_get_jobs_states.assert_called_with([1])
 
-    @mock.patch('time.sleep', return_value=None)
-    @mock.patch('bq_utils.job_status_done',
-                side_effect=[
-                    False, False, True, False, False, False, False, False,
-                    False, False, False, False
-                ])
-    def test_wait_on_jobs_some_fail(self, mock_job_status_done,
-                                    mock_time_sleep):
+    @mock.patch('bq_utils.bq_consts.MIN_POLL_INTERVAL', 0.01)
+    @mock.patch('bq_utils._job_watcher', None)
+    @mock.patch('bq_utils.get_jobs_states')
+    def test_wait_on_jobs_some_fail(self, mock_get_jobs_states):
+        mock_get_jobs_states.side_effect = lambda job_ids: {
+            job_id: 'DONE' if job_id == 0 else 'RUNNING' for job_id in job_ids
+        }
         job_ids = list(range(2))
-        actual = bq_utils.wait_on_jobs(job_ids)
+        actual = bq_utils.wait_on_jobs(job_ids, timeout=0.1)
         expected = [1]
         self.assertEqual(actual, expected)
 
-    @mock.patch('bq_utils.sleeper')
-    @mock.patch('bq_utils.job_status_done')
-    def test_wait_on_jobs_retry_count(self, mock_job_status, mock_sleep):
-        max_sleep_interval = 512
-        mock_job_status.return_value = False
+    @mock.patch('bq_utils._job_watcher', None)
+    @mock.patch('bq_utils.get_job_watcher')
+    def test_wait_on_jobs_retry_count(self, mock_get_job_watcher):
+        mock_get_job_watcher.return_value.wait.return_value = []
         job_ids = ["job_1", "job_2"]
         bq_utils.wait_on_jobs(job_ids)
-        mock_sleep.assert_called_with(max_sleep_interval)
+        # 1 + 2 + 4 + ... + 512 seconds
+        mock_get_job_watcher.return_value.wait.assert_called_with(job_ids, 1023)
+        bq_utils.wait_on_jobs(job_ids, retry_count=3)
+        mock_get_job_watcher.return_value.wait.assert_called_with(job_ids, 7)
+
+    @mock.patch('bq_utils.app_identity.get_application_id')
+    @mock.patch('bq_utils.create_service')
+    def test_get_jobs_states(self, mock_create_service, mock_app_id):
+        mock_app_id.return_value = 'fake-project'
+        bq_service = mock_create_service.return_value
+        batches = []
+
+        class FakeBatch(object):
+
+            def __init__(self, callback):
+                self.callback = callback
+                self.request_ids = []
+                batches.append(self)
+
+            def add(self, request, request_id):
+                self.request_ids.append(request_id)
+
+            def execute(self):
+                for request_id in self.request_ids:
+                    if request_id == 'missing':
+                        self.callback(request_id, None, ValueError('404'))
+                    else:
+                        self.callback(request_id, {'status': {
+                            'state': 'DONE'
+                        }}, None)
+
+        bq_service.new_batch_http_request.side_effect = FakeBatch
+        job_ids = [f'job_{i}' for i in range(60)] + ['missing']
+
+        actual = bq_utils.get_jobs_states(job_ids)
+
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(len(batches[0].request_ids),
+                         bq_utils_consts.JOB_STATUS_BATCH_SIZE)
+        self.assertEqual(actual['job_0'], 'DONE')
+        self.assertIsInstance(actual['missing'], ValueError)
+        self.assertEqual(len(actual), len(job_ids))
+
+    @mock.patch('bq_utils.time.sleep')
+    def test_execute_batch_retries_transient_errors(self, mock_sleep):
+        unavailable = HttpError(mock.Mock(status=503), b'unavailable')
+        batch = mock.Mock()
+        batch.execute.side_effect = [unavailable, ConnectionError(), None]
+
+        bq_utils._execute_batch(batch)
+
+        self.assertEqual(batch.execute.call_count, 3)
+        self.assertListEqual(mock_sleep.call_args_list,
+                             [mock.call(1), mock.call(2)])
+
+        not_found = HttpError(mock.Mock(status=404), b'not found')
+        batch.execute.side_effect = not_found
+        batch.execute.reset_mock()
+        with self.assertRaises(HttpError):
+            bq_utils._execute_batch(batch)
+        batch.execute.assert_called_once()
+
+    def test_is_transient_error(self):
+        for status in [429, 500, 503]:
+            self.assertTrue(
+                bq_utils.is_transient_error(
+                    HttpError(mock.Mock(status=status), b'')))
+        self.assertFalse(
+            bq_utils.is_transient_error(HttpError(mock.Mock(status=404), b'')))
+        self.assertTrue(bq_utils.is_transient_error(ConnectionError()))
+        self.assertFalse(bq_utils.is_transient_error(ValueError()))
 
     @mock.patch('bq_utils.os.environ.get')
     def test_get_validation_results_dataset_id_not_existing(self, mock_env_var):
@@ -95,3 +184,166 @@ class BqUtilsTest(unittest.TestCase):
         # post conditions
         expected = 'dataset_foo'
         self.assertEqual(result_id, expected)
+
+    def test_compile_row_decoder(self):
+        schema = [{
+            'name': 'person_id',
+            'type': 'INTEGER',
+            'mode': 'NULLABLE'
+        }, {
+            'name': 'value',
+            'type': 'FLOAT',
+            'mode': 'NULLABLE'
+        }, {
+            'name': 'flag',
+            'type': 'BOOLEAN',
+            'mode': 'NULLABLE'
+        }, {
+            'name': 'name',
+            'type': 'STRING',
+            'mode': 'NULLABLE'
+        }, {
+            'name': 'codes',
+            'type': 'INTEGER',
+            'mode': 'REPEATED'
+        }, {
+            'name':
+                'visits',
+            'type':
+                'RECORD',
+            'mode':
+                'REPEATED',
+            'fields': [{
+                'name': 'visit_id',
+                'type': 'INTEGER',
+                'mode': 'NULLABLE'
+            }]
+        }, {
+            'name': 'location',
+            'type': 'RECORD',
+            'mode': 'NULLABLE',
+            'fields': [{
+                'name': 'zip',
+                'type': 'STRING',
+                'mode': 'NULLABLE'
+            }]
+        }]
+        row = {
+            'f': [{
+                'v': '1'
+            }, {
+                'v': '2.5'
+            }, {
+                'v': 'true'
+            }, {
+                'v': None
+            }, {
+                'v': [{
+                    'v': '3'
+                }, {
+                    'v': '4'
+                }]
+            }, {
+                'v': [{
+                    'v': {
+                        'f': [{
+                            'v': '10'
+                        }]
+                    }
+                }]
+            }, {
+                'v': {
+                    'f': [{
+                        'v': '12345'
+                    }]
+                }
+            }]
+        }
+        decode = bq_utils.compile_row_decoder(schema)
+        expected = {
+            'person_id': 1,
+            'value': 2.5,
+            'flag': True,
+            'name': None,
+            'codes': [3, 4],
+            'visits': [{
+                'visit_id': 10
+            }],
+            'location': {
+                'zip': '12345'
+            }
+        }
+        self.assertEqual(decode(row), expected)
+
+    def _page(self, values, page_token=None):
+        page = {
+            'jobReference': {
+                'jobId': 'fake_job'
+            },
+            'schema': {
+                'fields': [{
+                    'name': 'person_id',
+                    'type': 'INTEGER',
+                    'mode': 'NULLABLE'
+                }, {
+                    'name': 'value',
+                    'type': 'FLOAT',
+                    'mode': 'NULLABLE'
+                }]
+            },
+            'rows': [{
+                'f': [{
+                    'v': person_id
+                }, {
+                    'v': value
+                }]
+            } for person_id, value in values]
+        }
+        if page_token:
+            page['pageToken'] = page_token
+        return page
+
+    @mock.patch('bq_utils.app_identity.get_application_id')
+    @mock.patch('bq_utils.create_service')
+    def test_iter_query_rows(self, mock_create_service, mock_app_id):
+        mock_app_id.return_value = 'fake-project'
+        get_results = mock_create_service.return_value.jobs.return_value.getQueryResults
+        get_results.return_value.execute.side_effect = [
+            self._page([('2', '0.5')], page_token='token_2'),
+            self._page([('3', None)])
+        ]
+        first_page = self._page([('1', '1.5')], page_token='token_1')
+
+        rows = bq_utils.iter_query_rows(first_page)
+        self.assertEqual(next(rows), {'person_id': 1, 'value': 1.5})
+        self.assertEqual(list(rows), [{
+            'person_id': 2,
+            'value': 0.5
+        }, {
+            'person_id': 3,
+            'value': None
+        }])
+        self.assertEqual(
+            [kwargs['pageToken'] for _, kwargs in get_results.call_args_list],
+            ['token_1', 'token_2'])
+
+        get_results.return_value.execute.side_effect = [
+            self._page([('2', '0.5')])
+        ]
+        self.assertEqual(len(bq_utils.large_response_to_rowlist(first_page)), 2)
+
+    def test_iter_query_batches(self):
+        page = self._page([('1', '1.5'), ('2', None)])
+
+        batches = list(bq_utils.iter_query_batches(page))
+        self.assertEqual(batches, [{'person_id': [1, 2], 'value': [1.5, None]}])
+
+        batch = next(
+            bq_utils.iter_query_batches(
+                page, column_format=bq_utils_consts.NUMPY_COLUMNS))
+        self.assertEqual(batch['person_id'].dtype, 'int64')
+        self.assertEqual(batch['person_id'].tolist(), [1, 2])
+        self.assertEqual(batch['value'].dtype, object)
+
+        with self.assertRaises(ValueError):
+            next(bq_utils.iter_query_batches(page, column_format='arrow'))
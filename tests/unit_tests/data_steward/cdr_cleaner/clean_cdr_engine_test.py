@@ -1,11 +1,19 @@
 # Python imports
 import inspect
-from unittest import TestCase
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase, mock
+
+# Third party imports
+from google.cloud.exceptions import BadRequest, GoogleCloudError
 
 # Project imports
 from cdr_cleaner import clean_cdr_engine as ce
 from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
+from constants import bq_utils as bq_consts
 from constants.cdr_cleaner import clean_cdr as cdr_consts
+from constants.cdr_cleaner import clean_cdr_engine as ce_consts
 
 fake_rule_class_query = 'SELECT "FakeRuleClass"'
 fake_rule_func_query = 'SELECT "fake_rule_func"'
@@ -40,6 +48,24 @@ class FakeRuleClass(BaseCleaningRule):
         pass
 
 
+class FakeTableRule(FakeRuleClass):
+    table = 'person'
+
+    def get_query_specs(self, *args, **keyword_args):
+        return [{
+            cdr_consts.QUERY:
+                f'SELECT * FROM `{self.project_id}.{self.dataset_id}.{self.table}`',
+            cdr_consts.DESTINATION_DATASET:
+                self.dataset_id,
+            cdr_consts.DESTINATION_TABLE:
+                self.table
+        }]
+
+
+class FakeOtherTableRule(FakeTableRule):
+    table = 'observation'
+
+
 def fake_rule_func(project_id, dataset_id, sandbox_dataset_id='hello'):
     return [{cdr_consts.QUERY: fake_rule_func_query}]
 
@@ -153,3 +179,499 @@ class CleanCDREngineTest(TestCase):
         actual_rule_args = ce.get_rule_args(fake_rule_func)
         actual_param_names = [arg['name'] for arg in actual_rule_args]
         self.assertListEqual(expected_param_names, actual_param_names)
+
+    def test_get_query_tables(self):
+        query_dict = {
+            cdr_consts.QUERY:
+                f"""
+                SELECT o.* FROM `{self.project}.{self.dataset_id}.observation` o
+                JOIN {self.sandbox_id}.lookup l USING (person_id)""",
+            cdr_consts.DESTINATION_DATASET:
+                self.sandbox_id,
+            cdr_consts.DESTINATION_TABLE:
+                'sb_observation'
+        }
+        reads, writes = ce.get_query_tables(query_dict)
+        self.assertIn(f'{self.dataset_id}.observation', reads)
+        self.assertIn(f'{self.sandbox_id}.lookup', reads)
+        self.assertSetEqual(writes, {f'{self.sandbox_id}.sb_observation'})
+
+        query_dict = {
+            cdr_consts.QUERY:
+                f'DELETE FROM `{self.project}.{self.dataset_id}.person` '
+                f'WHERE person_id IN (SELECT person_id FROM '
+                f'`{self.project}.{self.dataset_id}.death`)'
+        }
+        _, writes = ce.get_query_tables(query_dict)
+        self.assertSetEqual(writes, {f'{self.dataset_id}.person'})
+
+        # dynamic SQL writes unknown tables
+        query_dict = {cdr_consts.QUERY: "EXECUTE IMMEDIATE 'DROP TABLE x.y'"}
+        _, writes = ce.get_query_tables(query_dict)
+        self.assertIsNone(writes)
+
+    def test_get_conflict_dependencies(self):
+        person = f'{self.dataset_id}.person'
+        death = f'{self.dataset_id}.death'
+        observation = f'{self.dataset_id}.observation'
+        table_usages = [
+            ({person}, {person}),
+            ({observation}, {f'{self.sandbox_id}.observation'}),
+            # reads a table written earlier
+            ({person}, {death}),
+            # reads the same table as an earlier unit, writes another
+            ({observation}, {f'{self.sandbox_id}.death'}),
+            # unknown tables
+            None,
+            ({f'{self.dataset_id}.*'}, set()),
+        ]
+        actual = ce.get_conflict_dependencies(table_usages)
+        expected = {
+            0: set(),
+            1: set(),
+            2: {0},
+            3: set(),
+            4: {0, 1, 2, 3},
+            5: {0, 2, 4}
+        }
+        self.assertDictEqual(actual, expected)
+
+    def test_plan_rules(self):
+        rules = [(FakeTableRule,), (FakeOtherTableRule,), (FakeTableRule,),
+                 (FakeRuleClass,)]
+        planned_rules, dependencies = ce.plan_rules(self.project,
+                                                    self.dataset_id,
+                                                    self.sandbox_id, rules,
+                                                    self.table_namer)
+        self.assertEqual(len(planned_rules), 4)
+        expected = {0: set(), 1: set(), 2: {0}, 3: set()}
+        self.assertDictEqual(dependencies, expected)
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.bq.get_client')
+    def test_clean_dataset_in_parallel(self, mock_get_client):
+        client = mock_get_client.return_value
+        client.project = self.project
+        query_job = client.query.return_value
+        query_job.errors = None
+
+        rules = [(FakeRuleClass,), (fake_rule_func,)]
+        jobs = ce.clean_dataset(self.project,
+                                self.dataset_id,
+                                self.sandbox_id,
+                                rules,
+                                max_workers=2)
+        self.assertListEqual(jobs, [query_job, query_job])
+        queries = sorted(
+            call[1]['query'] for call in client.query.call_args_list)
+        self.assertListEqual(
+            queries, sorted([fake_rule_class_query, fake_rule_func_query]))
+
+    def test_get_skip_reason(self):
+        person = f'`{self.project}.{self.dataset_id}.person`'
+        delete = {cdr_consts.QUERY: f'DELETE FROM {person} WHERE TRUE'}
+        rewrite = self._rewrite(f'SELECT * FROM {person}')
+        declared = dict(rewrite, **{cdr_consts.SKIP_IF_EMPTY: ['observation']})
+        sandbox = {
+            cdr_consts.QUERY:
+                f'UPDATE `{self.project}.{self.sandbox_id}.person` SET x = 1 '
+                f'WHERE TRUE'
+        }
+        self.assertListEqual(ce.get_skip_tables(delete, self.dataset_id),
+                             ['person'])
+        self.assertListEqual(ce.get_skip_tables(rewrite, self.dataset_id), [])
+        self.assertListEqual(ce.get_skip_tables(declared, self.dataset_id),
+                             ['observation'])
+        self.assertListEqual(ce.get_skip_tables(sandbox, self.dataset_id), [])
+
+        table_stats = {
+            'person': {
+                ce_consts.ROW_COUNT: 0
+            },
+            'observation': {
+                ce_consts.ROW_COUNT: 10
+            }
+        }
+        self.assertEqual(
+            ce.get_skip_reason(delete, self.dataset_id, table_stats, set()),
+            'empty table(s) person')
+        self.assertIsNone(
+            ce.get_skip_reason(declared, self.dataset_id, table_stats, set()))
+        # the table may have rows once an earlier query writes it
+        self.assertIsNone(
+            ce.get_skip_reason(delete, self.dataset_id, table_stats,
+                               {f'{self.dataset_id}.*'}))
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.bq.get_client')
+    def test_clean_dataset_prune_empty(self, mock_get_client):
+        client = mock_get_client.return_value
+        client.project = self.project
+        query_job = mock.MagicMock(errors=None)
+
+        def query(query, **kwargs):
+            if '__TABLES__' in query:
+                stats_job = mock.MagicMock()
+                stats_job.result.return_value = [{
+                    'table_id': 'person',
+                    ce_consts.ROW_COUNT: 0,
+                    ce_consts.LAST_MODIFIED: datetime(2020, 1, 1)
+                }, {
+                    'table_id': 'observation',
+                    ce_consts.ROW_COUNT: 5,
+                    ce_consts.LAST_MODIFIED: datetime(2020, 1, 1)
+                }]
+                return stats_job
+            return query_job
+
+        client.query.side_effect = query
+
+        class FakePersonRule(FakeTableRule):
+
+            def get_query_specs(self, *args, **keyword_args):
+                return [
+                    dict(query_spec, **{cdr_consts.SKIP_IF_EMPTY: [self.table]})
+                    for query_spec in super().get_query_specs()
+                ]
+
+        class FakeObservationRule(FakePersonRule):
+            table = 'observation'
+
+        rules = [(FakePersonRule,), (FakeObservationRule,)]
+        skipped = []
+        jobs = ce.clean_dataset(self.project,
+                                self.dataset_id,
+                                self.sandbox_id,
+                                rules,
+                                prune_empty=True,
+                                skipped_queries=skipped)
+
+        self.assertListEqual(jobs, [query_job])
+        self.assertListEqual(skipped, [{
+            ce_consts.SKIPPED_RULE: 'clean_cdr_engine_test',
+            ce_consts.SKIPPED_QUERY_NO: 0,
+            ce_consts.SKIPPED_REASON: 'empty table(s) person'
+        }])
+        self.assertRaises(ValueError,
+                          ce.clean_dataset,
+                          self.project,
+                          self.dataset_id,
+                          self.sandbox_id,
+                          rules,
+                          max_workers=2,
+                          prune_empty=True)
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.bq.get_client')
+    def test_clean_dataset_resume(self, mock_get_client):
+        client = mock_get_client.return_value
+        client.project = self.project
+        query_job = mock.MagicMock(errors=None, job_id='job_1')
+        client.query.side_effect = [query_job, GoogleCloudError('quota')]
+        client.get_table.return_value.modified = datetime(2020, 1, 1)
+        rules = [(FakeTableRule,), (FakeOtherTableRule,)]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            ledger_path = os.path.join(temp_dir, 'ledger.db')
+            self.assertRaises(GoogleCloudError,
+                              ce.clean_dataset,
+                              self.project,
+                              self.dataset_id,
+                              self.sandbox_id,
+                              rules,
+                              ledger_path=ledger_path)
+            client.get_table.assert_called_with(
+                f'{self.project}.{self.dataset_id}.person')
+
+            # resuming skips the completed rule
+            client.query.reset_mock()
+            client.query.side_effect = None
+            client.query.return_value = query_job
+            jobs = ce.clean_dataset(self.project,
+                                    self.dataset_id,
+                                    self.sandbox_id,
+                                    rules,
+                                    ledger_path=ledger_path,
+                                    resume=True)
+            self.assertListEqual(jobs, [query_job])
+            self.assertIn('observation', client.query.call_args[1]['query'])
+
+            # the finished run cannot be resumed
+            self.assertRaises(RuntimeError,
+                              ce.clean_dataset,
+                              self.project,
+                              self.dataset_id,
+                              self.sandbox_id,
+                              rules,
+                              ledger_path=ledger_path,
+                              resume=True)
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.bq.get_client')
+    def test_clean_dataset_resume_changed_table(self, mock_get_client):
+        client = mock_get_client.return_value
+        client.project = self.project
+        query_job = mock.MagicMock(errors=None, job_id='job_1')
+        client.query.side_effect = [query_job, GoogleCloudError('quota')]
+        client.get_table.return_value.modified = datetime(2020, 1, 1)
+        rules = [(FakeTableRule,), (FakeOtherTableRule,)]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            ledger_path = os.path.join(temp_dir, 'ledger.db')
+            self.assertRaises(GoogleCloudError,
+                              ce.clean_dataset,
+                              self.project,
+                              self.dataset_id,
+                              self.sandbox_id,
+                              rules,
+                              ledger_path=ledger_path)
+
+            client.get_table.return_value.modified = datetime(2020, 1, 2)
+            client.query.reset_mock()
+            self.assertRaises(RuntimeError,
+                              ce.clean_dataset,
+                              self.project,
+                              self.dataset_id,
+                              self.sandbox_id,
+                              rules,
+                              ledger_path=ledger_path,
+                              resume=True)
+            client.query.assert_not_called()
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.bq.get_client')
+    def test_compile_rules(self, mock_get_client):
+
+        def failing_rule(project_id, dataset_id, sandbox_dataset_id):
+            raise RuntimeError('needs the dataset')
+
+        rules = [(FakeTableRule,), (failing_rule,), (fake_rule_func,)]
+        compiled, errors = ce.compile_rules(self.project, self.dataset_id,
+                                            self.sandbox_id, rules)
+
+        mock_get_client.assert_not_called()
+        self.assertListEqual(
+            compiled,
+            [('clean_cdr_engine_test_0',
+              f'-- destination: {self.dataset_id}.person WRITE_EMPTY\n'
+              f'SELECT * FROM `{self.project}.{self.dataset_id}.person`'),
+             ('clean_cdr_engine_test_0', fake_rule_func_query)])
+        self.assertListEqual(
+            errors, [('clean_cdr_engine_test',
+                      'Queries could not be generated: needs the dataset')])
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.bq.get_client')
+    def test_dry_run_rules(self, mock_get_client):
+        client = mock_get_client.return_value
+        client.project = self.project
+        person = mock.MagicMock(dataset_id=self.dataset_id, table_id='person')
+
+        def dry_run(query, job_config):
+            self.assertTrue(job_config.dry_run)
+            if 'observation' in query:
+                raise BadRequest(f'Not found: Table {self.project}:'
+                                 f'{self.dataset_id}.person was not found')
+            if 'fake_rule_func' in query:
+                raise BadRequest('Syntax error: Unexpected end of script')
+            return mock.MagicMock(total_bytes_processed=100,
+                                  referenced_tables=[person])
+
+        client.query.side_effect = dry_run
+        rules = [(FakeTableRule,), (FakeOtherTableRule,), (fake_rule_func,)]
+        reports = ce.dry_run_rules(self.project, self.dataset_id,
+                                   self.sandbox_id, rules)
+
+        self.assertEqual(reports[0][ce_consts.DRY_RUN_BYTES_PROCESSED], 100)
+        self.assertListEqual(reports[0][ce_consts.DRY_RUN_REFERENCED_TABLES],
+                             [f'{self.dataset_id}.person'])
+        self.assertListEqual(reports[0][ce_consts.DRY_RUN_ERRORS], [])
+        # the missing table is written by the first rule
+        self.assertListEqual(reports[1][ce_consts.DRY_RUN_CREATED_EARLIER],
+                             [f'{self.dataset_id}.person'])
+        self.assertListEqual(reports[1][ce_consts.DRY_RUN_ERRORS], [])
+        self.assertEqual(len(reports[2][ce_consts.DRY_RUN_ERRORS]), 1)
+        self.assertEqual(ce.log_dry_run_reports(reports), 1)
+
+    def _rewrite(self, query):
+        return {
+            cdr_consts.QUERY: query,
+            cdr_consts.DESTINATION_DATASET: self.dataset_id,
+            cdr_consts.DESTINATION_TABLE: 'observation',
+            cdr_consts.DISPOSITION: bq_consts.WRITE_TRUNCATE
+        }
+
+    def test_get_fusable_rewrite(self):
+        observation = f'`{self.project}.{self.dataset_id}.observation`'
+        sandbox = {
+            cdr_consts.QUERY: f'SELECT * FROM {observation} WHERE value = 0',
+            cdr_consts.DESTINATION_DATASET: self.sandbox_id,
+            cdr_consts.DESTINATION_TABLE: 'sb_observation'
+        }
+        rewrite = self._rewrite(f'SELECT * FROM {observation} WHERE value > 0')
+
+        create_sandbox = {
+            cdr_consts.QUERY:
+                f'CREATE TABLE `{self.project}.{self.sandbox_id}.sb` AS '
+                f'SELECT * FROM {observation}'
+        }
+        insert_sandbox = {
+            cdr_consts.QUERY:
+                f'INSERT INTO `{self.project}.{self.sandbox_id}.sb` '
+                f'SELECT * FROM {observation}'
+        }
+
+        self.assertEqual(
+            ce.get_fusable_rewrite([sandbox, rewrite], self.dataset_id,
+                                   self.sandbox_id), 1)
+        self.assertEqual(
+            ce.get_fusable_rewrite([sandbox, rewrite], self.dataset_id,
+                                   self.sandbox_id, 'observation'), 1)
+        self.assertEqual(
+            ce.get_fusable_rewrite([create_sandbox, rewrite], self.dataset_id,
+                                   self.sandbox_id, 'observation'), 1)
+        # other statements can only read the table before any rewrite
+        self.assertEqual(
+            ce.get_fusable_rewrite([insert_sandbox, rewrite], self.dataset_id,
+                                   self.sandbox_id), 1)
+        self.assertIsNone(
+            ce.get_fusable_rewrite([insert_sandbox, rewrite], self.dataset_id,
+                                   self.sandbox_id, 'observation'))
+        self.assertIsNone(
+            ce.get_fusable_rewrite([rewrite, insert_sandbox], self.dataset_id,
+                                   self.sandbox_id))
+        self.assertEqual(
+            ce.get_fusable_rewrite([rewrite], self.dataset_id, self.sandbox_id,
+                                   'observation'), 0)
+        # rewrites another table
+        self.assertIsNone(
+            ce.get_fusable_rewrite([rewrite], self.dataset_id, self.sandbox_id,
+                                   'person'))
+        # DML is not a rewrite
+        delete = {cdr_consts.QUERY: f'DELETE FROM {observation} WHERE TRUE'}
+        self.assertIsNone(
+            ce.get_fusable_rewrite([delete], self.dataset_id, self.sandbox_id))
+
+    def test_fuse_rewrite_queries(self):
+        observation = f'`{self.project}.{self.dataset_id}.observation`'
+        queries = [
+            f'SELECT * FROM {observation} WHERE value > 0',
+            f'SELECT * FROM {observation} WHERE value < 10;'
+        ]
+        actual = ce.fuse_rewrite_queries(self.dataset_id, 'observation',
+                                         queries)
+        self.assertIn(queries[0], actual)
+        self.assertIn('SELECT * FROM fused_step_1 WHERE value < 10', actual)
+        self.assertNotIn(';', actual)
+        self.assertTrue(actual.strip().endswith('SELECT * FROM fused_step_2'))
+
+    def test_get_fused_queries(self):
+        observation = f'`{self.project}.{self.dataset_id}.observation`'
+        sandbox = {
+            cdr_consts.QUERY: f'SELECT * FROM {observation} WHERE b',
+            cdr_consts.DESTINATION_DATASET: self.sandbox_id,
+            cdr_consts.DESTINATION_TABLE: 'sb_observation'
+        }
+        group = [
+            ({},
+             [sandbox,
+              self._rewrite(f'SELECT * FROM {observation} WHERE a')], 1),
+            ({},
+             [sandbox,
+              self._rewrite(f'SELECT * FROM {observation} WHERE b')], 1),
+        ]
+        other_queries, fused_rewrite = ce.get_fused_queries(
+            self.dataset_id, group)
+
+        # the first rule sandboxes the table as it was
+        self.assertListEqual(other_queries[0][1], [sandbox])
+        # the second rule sandboxes the table as rewritten by the first
+        second_sandbox = other_queries[1][1][0]
+        self.assertEqual(second_sandbox[cdr_consts.DESTINATION_TABLE],
+                         'sb_observation')
+        self.assertIn(f'SELECT * FROM {observation} WHERE a',
+                      second_sandbox[cdr_consts.QUERY])
+        self.assertIn('SELECT * FROM fused_step_1 WHERE b',
+                      second_sandbox[cdr_consts.QUERY])
+        self.assertEqual(fused_rewrite[cdr_consts.DESTINATION_TABLE],
+                         'observation')
+        self.assertIn('fused_step_2', fused_rewrite[cdr_consts.QUERY])
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.run_query')
+    def test_run_rules_fused(self, mock_run_query):
+        events = []
+
+        class FusableRule(FakeTableRule):
+            fusable_rewrite = True
+
+            def setup_rule(self, client, *args, **keyword_args):
+                events.append(f'setup {type(self).__name__}')
+
+            def get_query_specs(self, *args, **keyword_args):
+                query_list = super().get_query_specs()
+                query_list[0][cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+                return query_list
+
+        class OtherFusableRule(FusableRule):
+            pass
+
+        class UnfusableRule(FusableRule):
+            fusable_rewrite = False
+
+        mock_run_query.side_effect = lambda *args: events.append('run')
+        rules = [(FusableRule,), (OtherFusableRule,), (UnfusableRule,),
+                 (FusableRule,)]
+
+        ce.run_rules_fused(mock.MagicMock(), self.project, self.dataset_id,
+                           self.sandbox_id, rules, self.table_namer)
+
+        # the group runs before a rule which did not opt in is set up, and
+        # that rule is not fused with the rules after it
+        self.assertListEqual(events, [
+            'setup FusableRule', 'setup OtherFusableRule', 'run',
+            'setup UnfusableRule', 'run', 'setup FusableRule', 'run'
+        ])
+        self.assertFalse(ce.is_fusable_rule(fake_rule_func))
+        self.assertFalse(ce.is_fusable_rule(FakeTableRule))
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.run_query')
+    def test_run_fused_group(self, mock_run_query):
+        observation = f'`{self.project}.{self.dataset_id}.observation`'
+        client = mock.MagicMock()
+        client.project = self.project
+        group = [({
+            cdr_consts.MODULE_NAME: 'rule_1'
+        }, [self._rewrite(f'SELECT * FROM {observation} WHERE a')], 0),
+                 ({
+                     cdr_consts.MODULE_NAME: 'rule_2'
+                 }, [self._rewrite(f'SELECT * FROM {observation} WHERE b')], 0)]
+
+        ce.run_fused_group(client, self.dataset_id, self.sandbox_id, group)
+        self.assertEqual(mock_run_query.call_count, 1)
+        fused_rewrite = mock_run_query.call_args[0][1]
+        self.assertEqual(fused_rewrite[cdr_consts.DESTINATION_TABLE],
+                         'observation')
+        self.assertIn('fused_step_2', fused_rewrite[cdr_consts.QUERY])
+
+        # verify runs the fused query into the sandbox, then each rewrite
+        mock_run_query.reset_mock()
+        client.query.return_value.result.return_value = [
+            mock.MagicMock(diff_count=0)
+        ]
+        ce.run_fused_group(client,
+                           self.dataset_id,
+                           self.sandbox_id,
+                           group,
+                           verify=True)
+        destinations = [(call[0][1][cdr_consts.DESTINATION_DATASET],
+                         call[0][1][cdr_consts.DESTINATION_TABLE])
+                        for call in mock_run_query.call_args_list]
+        self.assertListEqual(destinations,
+                             [(self.sandbox_id, 'observation_fused_check'),
+                              (self.dataset_id, 'observation'),
+                              (self.dataset_id, 'observation')])
+
+        client.query.return_value.result.return_value = [
+            mock.MagicMock(diff_count=3)
+        ]
+        self.assertRaises(RuntimeError,
+                          ce.run_fused_group,
+                          client,
+                          self.dataset_id,
+                          self.sandbox_id,
+                          group,
+                          verify=True)
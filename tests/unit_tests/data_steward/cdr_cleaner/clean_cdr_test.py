@@ -95,7 +95,17 @@ class CleanCDRTest(unittest.TestCase):
             'sandbox_dataset_id': self.sandbox_dataset_id,
             'data_stage': DataStage.EHR,
             'console_log': False,
-            'list_queries': False
+            'list_queries': False,
+            'max_workers': 1,
+            'fuse_rewrites': False,
+            'verify_fused': False,
+            'ledger_path': None,
+            'resume': False,
+            'prune_empty': False,
+            'dry_run': False,
+            'profile_csv': None,
+            'profile_table': None,
+            'compile_dir': None
         }
         actual_args, actual_kwargs = cc.fetch_args_kwargs(test_args +
                                                           expected_kwargs_list)
@@ -273,7 +283,17 @@ class CleanCDRTest(unittest.TestCase):
                 'sandbox_dataset_id': self.sandbox_dataset_id,
                 'data_stage': DataStage.EHR,
                 'console_log': False,
-                'list_queries': False
+                'list_queries': False,
+                'max_workers': 1,
+                'fuse_rewrites': False,
+                'verify_fused': False,
+                'ledger_path': None,
+                'resume': False,
+                'prune_empty': False,
+                'dry_run': False,
+                'profile_csv': None,
+                'profile_table': None,
+                'compile_dir': None
             })
 
         expected_kargs = {}
@@ -290,7 +310,14 @@ class CleanCDRTest(unittest.TestCase):
             dataset_id=self.dataset_id,
             sandbox_dataset_id=self.sandbox_dataset_id,
             rules=rules,
-            table_namer=DataStage.EHR.value)
+            table_namer=DataStage.EHR.value,
+            max_workers=1,
+            fuse_rewrites=False,
+            verify_fused=False,
+            ledger_path=None,
+            resume=False,
+            prune_empty=False,
+            skipped_queries=[])
 
         # Test get_queries() function call
         args = [
@@ -306,7 +333,17 @@ class CleanCDRTest(unittest.TestCase):
                 'sandbox_dataset_id': self.sandbox_dataset_id,
                 'data_stage': DataStage.EHR,
                 'console_log': False,
-                'list_queries': True
+                'list_queries': True,
+                'max_workers': 1,
+                'fuse_rewrites': False,
+                'verify_fused': False,
+                'ledger_path': None,
+                'resume': False,
+                'prune_empty': False,
+                'dry_run': False,
+                'profile_csv': None,
+                'profile_table': None,
+                'compile_dir': None
             })
 
         expected_kargs = {}
@@ -320,3 +357,49 @@ class CleanCDRTest(unittest.TestCase):
             sandbox_dataset_id=self.sandbox_dataset_id,
             rules=rules,
             table_namer=DataStage.EHR.value)
+
+    @patch('cdr_cleaner.clean_cdr.bq.get_client')
+    @patch('cdr_cleaner.clean_cdr.run_profiler')
+    def test_write_run_profile(self, mock_run_profiler, mock_get_client):
+        from argparse import Namespace
+
+        args = Namespace(project_id=self.project_id,
+                         dataset_id=self.dataset_id,
+                         sandbox_dataset_id=self.sandbox_dataset_id,
+                         profile_csv='profile.csv',
+                         profile_table='run_profile')
+        jobs = ['job_1', 'job_2']
+        skipped = [{'rule': 'rule_a', 'query_no': 0, 'reason': 'empty'}]
+        profile = mock_run_profiler.get_run_profile.return_value
+
+        cc.write_run_profile(args, jobs, skipped)
+
+        mock_run_profiler.get_run_profile.assert_called_once_with(
+            jobs, self.dataset_id, self.sandbox_dataset_id, skipped=skipped)
+        mock_run_profiler.write_profile_csv.assert_called_once_with(
+            'profile.csv', profile)
+        mock_run_profiler.load_profile_table.assert_called_once_with(
+            mock_get_client.return_value, self.sandbox_dataset_id,
+            'run_profile', profile)
+
+    @patch('cdr_cleaner.clean_cdr.clean_engine.add_console_logging')
+    @patch('cdr_cleaner.clean_cdr.clean_engine.compile_rules')
+    @patch('cdr_cleaner.clean_cdr.validate_custom_params')
+    def test_compile_only(self, mock_validate_args, mock_compile_rules,
+                          mock_add_console_logging):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as compile_dir:
+            args = [
+                '-p', self.project_id, '-d', self.dataset_id, '-b',
+                self.sandbox_dataset_id, '--data_stage', 'ehr',
+                '--compile_only', compile_dir
+            ]
+            # rules which need BigQuery to generate their SQL do not fail
+            mock_compile_rules.return_value = ([('rule_a_0', 'SELECT 1')],
+                                               [('rule_b', 'needs a client')])
+            cc.main(args)
+
+            mock_compile_rules.return_value = ([('rule_a_0', 'SELECT (1')], [])
+            with self.assertRaises(RuntimeError):
+                cc.main(args)
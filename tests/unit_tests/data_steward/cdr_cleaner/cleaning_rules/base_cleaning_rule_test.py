@@ -508,3 +508,21 @@ class BaseCleaningRuleTest(unittest.TestCase):
             self.project_id, self.sandbox_dataset_id, [])
 
         self.assertEqual(actual_query, [])
+
+    @patch('cdr_cleaner.cleaning_rules.base_cleaning_rule.table_counts')
+    def test_get_table_count_deltas(self, mock_table_counts):
+        rule = Inheritance(self.project_id, self.dataset_id,
+                           self.sandbox_dataset_id)
+        client = 'client'
+        initial_counts = {'person': 10}
+
+        rule.get_table_counts(client, self.dataset_id, ['person'])
+        mock_table_counts.get_table_counts.assert_called_once_with(
+            client, self.dataset_id, ['person'])
+
+        deltas = rule.get_table_count_deltas(client, self.dataset_id,
+                                             initial_counts)
+        self.assertEqual(deltas,
+                         mock_table_counts.get_count_deltas.return_value)
+        mock_table_counts.get_count_deltas.assert_called_once_with(
+            client, self.dataset_id, initial_counts)
@@ -0,0 +1,89 @@
+"""
+Unit test for unified_concept_suppression.py
+"""
+
+# Python imports
+import unittest
+from unittest import mock
+
+# Project imports
+from common import CONDITION_OCCURRENCE, OBSERVATION
+from constants.bq_utils import WRITE_TRUNCATE
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+from cdr_cleaner.cleaning_rules.deid.unified_concept_suppression import (
+    UnifiedConceptSuppression, SUPPRESSION_RULE_CONCEPT_TABLE)
+
+
+class UnifiedConceptSuppressionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.project_id = 'foo_project'
+        self.dataset_id = 'foo_dataset'
+        self.sandbox_dataset_id = 'foo_sandbox'
+
+        self.rule_instance = UnifiedConceptSuppression(self.project_id,
+                                                       self.dataset_id,
+                                                       self.sandbox_dataset_id)
+
+        self.assertEqual(self.rule_instance.project_id, self.project_id)
+        self.assertEqual(self.rule_instance.dataset_id, self.dataset_id)
+        self.assertEqual(self.rule_instance.sandbox_dataset_id,
+                         self.sandbox_dataset_id)
+
+    def test_init(self):
+        self.assertListEqual(self.rule_instance.issue_numbers,
+                             ['DC1387', 'DC1367', 'DC1385', 'DC1358', 'DC1381'])
+        self.assertEqual(self.rule_instance.affected_tables[0], OBSERVATION)
+        self.assertIn(CONDITION_OCCURRENCE, self.rule_instance.affected_tables)
+
+    @mock.patch('cdr_cleaner.cleaning_rules.deid.concept_suppression.'
+                'get_tables_in_dataset')
+    def test_setup_rule(self, mock_get_tables):
+        mock_get_tables.return_value = [OBSERVATION, CONDITION_OCCURRENCE]
+        client = mock.MagicMock()
+        query_job = client.query.return_value
+        query_job.errors = query_job.error_result = None
+        query_job.result.return_value.errors = None
+
+        self.rule_instance.setup_rule(client)
+
+        # the tables are looked up once for all rules
+        mock_get_tables.assert_called_once()
+        # a lookup table per BigQuery lookup rule, then the merged one
+        self.assertEqual(client.query.call_count, 5)
+        lookup_query = client.query.call_args[0][0]
+        self.assertIn(
+            f'`{self.project_id}.{self.sandbox_dataset_id}.'
+            f'{SUPPRESSION_RULE_CONCEPT_TABLE}`', lookup_query)
+        self.assertIn("'BirthInformationSuppression' AS suppression_rule",
+                      lookup_query)
+        self.assertIn('FROM UNNEST ([1585259, 4083587]) AS concept_id',
+                      lookup_query)
+        # only motor vehicle accident suppression applies to other tables
+        self.assertEqual(lookup_query.count(f"'{CONDITION_OCCURRENCE}'"), 1)
+
+    def test_get_query_specs(self):
+        self.rule_instance.affected_tables = [OBSERVATION]
+
+        result_list = self.rule_instance.get_query_specs()
+
+        sandbox_table = self.rule_instance.sandbox_table_for(OBSERVATION)
+        self.assertEqual(len(result_list), 3)
+        sandbox_query, suppression_query, _ = result_list
+        self.assertEqual(sandbox_query[cdr_consts.DESTINATION_TABLE],
+                         sandbox_table)
+        self.assertEqual(sandbox_query[cdr_consts.DISPOSITION], WRITE_TRUNCATE)
+        self.assertIn(f"WHERE table_id = '{OBSERVATION}'",
+                      sandbox_query[cdr_consts.QUERY])
+        self.assertIn('AS suppression_rules', sandbox_query[cdr_consts.QUERY])
+        # the table is rewritten once for all rules
+        self.assertEqual(suppression_query[cdr_consts.DESTINATION_TABLE],
+                         OBSERVATION)
+        self.assertIn(f'{self.sandbox_dataset_id}.{sandbox_table}',
+                      suppression_query[cdr_consts.QUERY])
@@ -79,7 +79,8 @@ class FillSourceValueTextFieldsTest(unittest.TestCase):
                 'm.visit_source_concept_id = vis_2.concept_id ',
             'destination_table_id': 'visit_occurrence',
             'write_disposition': 'WRITE_TRUNCATE',
-            'destination_dataset_id': 'dataset_id'
+            'destination_dataset_id': 'dataset_id',
+            'skip_if_empty': ['visit_occurrence']
         }]
 
         self.chars_to_replace = '[\t\n\\s]+'
@@ -198,7 +198,8 @@ class NullInvalidForeignKeys(unittest.TestCase):
             cdr_consts.DESTINATION_DATASET:
                 self.dataset_id,
             cdr_consts.DISPOSITION:
-                bq_consts.WRITE_TRUNCATE
+                bq_consts.WRITE_TRUNCATE,
+            cdr_consts.SKIP_IF_EMPTY: [table]
         }
 
         expected_list = [sandbox_query] + [invalid_foreign_key_query]
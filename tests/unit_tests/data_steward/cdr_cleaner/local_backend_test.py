@@ -0,0 +1,161 @@
+# Python imports
+from unittest import TestCase
+
+# Third party imports
+from google.cloud import bigquery
+from google.cloud.exceptions import BadRequest
+
+# Project imports
+from cdr_cleaner import local_backend
+from cdr_cleaner.cleaning_rules.rdr_observation_source_concept_id_suppression import \
+    ObservationSourceConceptIDRowSuppression
+from common import OBSERVATION
+from constants.bq_utils import WRITE_APPEND, WRITE_TRUNCATE
+
+
+class LocalBackendTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.dataset_id = 'dataset'
+        self.sandbox_dataset_id = 'sandbox'
+        self.client = local_backend.LocalClient()
+        self.client.load_rows(self.dataset_id, OBSERVATION, [{
+            'observation_id': 1,
+            'person_id': 1,
+            'observation_source_concept_id': 903079
+        }, {
+            'observation_id': 2,
+            'person_id': 1,
+            'observation_source_concept_id': 1585250
+        }, {
+            'observation_id': 3,
+            'person_id': 2,
+            'observation_source_concept_id': None
+        }])
+
+    def test_translate_query(self):
+        query = """
+        CREATE OR REPLACE TABLE `local-project.sandbox.obs` AS (
+        # sandbox the answers
+        SELECT CAST(value_as_string AS INT64) AS value,
+            EXTRACT(YEAR FROM observation_date) AS year,
+        FROM `local-project.dataset.observation`
+        WHERE REGEXP_CONTAINS(value_as_string, r'\\d+')
+        AND DATE_DIFF(observation_date, DATE_SUB(CURRENT_DATE, INTERVAL 1 YEAR), DAY) > 0
+        )"""
+
+        actual = local_backend.translate_query(query)
+
+        self.assertIn('DROP TABLE IF EXISTS "sandbox"."obs";', actual)
+        self.assertIn('CREATE TABLE "sandbox"."obs" AS', actual)
+        self.assertNotIn('AS (', actual)
+        self.assertIn('-- sandbox the answers', actual)
+        self.assertIn('CAST(value_as_string AS INTEGER)', actual)
+        self.assertIn("EXTRACT_PART('YEAR', observation_date) AS year\n",
+                      actual)
+        self.assertIn('FROM "dataset"."observation"', actual)
+        self.assertIn("REGEXP_CONTAINS(value_as_string, '\\d+')", actual)
+        self.assertIn(
+            "DATE_DIFF(observation_date, DATE_SUB(CURRENT_DATE, 1, 'YEAR'), "
+            "'DAY')", actual)
+
+    def test_translate_date_parts_only_in_date_functions(self):
+        query = ("SELECT MAX(year) AS year FROM (SELECT DATE_DIFF("
+                 "DATE_ADD(DATE '2020-01-01', INTERVAL -1 DAY), "
+                 "DATE '2019-01-01', year) AS year)")
+
+        actual = local_backend.translate_query(query)
+
+        self.assertEqual(
+            actual, "SELECT MAX(year) AS year FROM (SELECT DATE_DIFF("
+            "DATE_ADD('2020-01-01', -1, 'DAY'), '2019-01-01', 'YEAR') AS year)")
+        self.assertListEqual(list(self.client.query(query).result()), [{
+            'year': 0
+        }])
+
+        with self.assertRaises(BadRequest):
+            local_backend.translate_query(
+                "SELECT DATE_DIFF(CURRENT_DATE, '2020-01-01', ISOWEEK)")
+
+    def test_query(self):
+        job = self.client.query(
+            "SELECT DATE_ADD('2020-01-31', INTERVAL 1 MONTH) AS month_end, "
+            "DATE_DIFF('2021-03-01', '2020-03-01', DAY) AS days, "
+            "IF(STARTS_WITH('abc', 'a'), 'yes', 'no') AS starts")
+        self.assertListEqual(list(job.result()), [{
+            'month_end': '2020-02-29',
+            'days': 365,
+            'starts': 'yes'
+        }])
+
+        with self.assertRaises(BadRequest):
+            self.client.query('SELECT * FROM `dataset.missing_table`')
+
+    def test_date_diff_counts_boundaries(self):
+        job = self.client.query(
+            "SELECT DATE_DIFF('2018-01-01', '2017-12-31', YEAR) AS new_year, "
+            "DATE_DIFF('2018-11-01', '2018-12-01', YEAR) AS same_year, "
+            "DATE_DIFF('2018-04-01', '2018-03-31', QUARTER) AS new_quarter, "
+            "DATE_DIFF('2018-06-30', '2018-04-01', QUARTER) AS same_quarter, "
+            "DATE_DIFF('2018-03-01', '2018-02-28', MONTH) AS new_month, "
+            "DATE_DIFF('2017-10-15', '2017-10-14', WEEK) AS new_week, "
+            "DATE_DIFF('2017-10-14', '2017-10-08', WEEK) AS same_week")
+        self.assertListEqual(list(job.result()), [{
+            'new_year': 1,
+            'same_year': 0,
+            'new_quarter': 1,
+            'same_quarter': 0,
+            'new_month': 1,
+            'new_week': 1,
+            'same_week': 0
+        }])
+
+    def test_query_destination(self):
+        job_config = bigquery.QueryJobConfig(
+            destination=f'{self.client.project}.{self.dataset_id}.person_ids',
+            write_disposition=WRITE_TRUNCATE)
+        query = f'SELECT DISTINCT person_id FROM `{self.dataset_id}.observation`'
+        self.client.query(query, job_config=job_config)
+        job_config.write_disposition = WRITE_APPEND
+        self.client.query(query, job_config=job_config)
+
+        self.assertEqual(
+            len(self.client.get_rows(self.dataset_id, 'person_ids')), 4)
+
+        metadata = self.client.query(
+            f'SELECT table_id, row_count '
+            f'FROM `{self.dataset_id}.__TABLES__` ORDER BY table_id').result()
+        self.assertListEqual(list(metadata), [{
+            'table_id': OBSERVATION,
+            'row_count': 3
+        }, {
+            'table_id': 'person_ids',
+            'row_count': 4
+        }])
+
+    def test_run_rules(self):
+        jobs = local_backend.run_rules(
+            self.client, self.dataset_id, self.sandbox_dataset_id,
+            [(ObservationSourceConceptIDRowSuppression,)])
+
+        self.assertEqual(len(jobs), 2)
+        self.assertTrue(all(job.started <= job.ended for job in jobs))
+        self.assertListEqual([
+            row['observation_id']
+            for row in self.client.get_rows(self.dataset_id, OBSERVATION)
+        ], [2, 3])
+
+        rule = ObservationSourceConceptIDRowSuppression(self.client.project,
+                                                        self.dataset_id,
+                                                        self.sandbox_dataset_id)
+        sandbox_table = rule.get_sandbox_tablenames()[0]
+        self.assertListEqual([
+            row['observation_id'] for row in self.client.get_rows(
+                self.sandbox_dataset_id, sandbox_table)
+        ], [1])
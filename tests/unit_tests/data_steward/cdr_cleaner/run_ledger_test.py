@@ -0,0 +1,65 @@
+# Python imports
+import os
+import tempfile
+from unittest import TestCase
+
+# Project imports
+from cdr_cleaner import run_ledger
+
+
+class RunLedgerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'ledger.db')
+        self.ledger = run_ledger.RunLedger(self.path)
+        self.run_args = ('test-project', 'test_dataset', 'test_sandbox',
+                         'combined', ['rule_a', 'rule_b'])
+
+    def tearDown(self):
+        self.ledger.close()
+        self.temp_dir.cleanup()
+
+    def test_get_unfinished_run(self):
+        self.assertIsNone(self.ledger.get_unfinished_run(*self.run_args))
+
+        run_id = self.ledger.start_run(*self.run_args)
+        self.assertEqual(self.ledger.get_unfinished_run(*self.run_args), run_id)
+        # other rules
+        self.assertIsNone(
+            self.ledger.get_unfinished_run(*self.run_args[:-1], ['rule_a']))
+
+        self.ledger.finish_run(run_id)
+        self.assertIsNone(self.ledger.get_unfinished_run(*self.run_args))
+
+    def test_record_query(self):
+        run_id = self.ledger.start_run(*self.run_args)
+        self.ledger.record_query(
+            run_id, 0, 0, 'SELECT 1', 'job_1', {
+                'test-project.test_dataset.person': '2020-01-01T00:00:00',
+                'test-project.test_sandbox.sb_person': None
+            })
+        self.ledger.record_query(
+            run_id, 0, 1, 'SELECT 2', 'job_2',
+            {'test-project.test_dataset.person': '2020-01-02T00:00:00'})
+        self.ledger.record_rule(run_id, 0, 'rule_a')
+        self.ledger.record_query(run_id, 1, 0, 'SELECT 3', 'job_3', {})
+
+        # the ledger persists across connections
+        self.ledger.close()
+        self.ledger = run_ledger.RunLedger(self.path)
+
+        self.assertSetEqual(self.ledger.get_completed_rules(run_id), {0})
+        self.assertDictEqual(self.ledger.get_completed_queries(run_id, 1),
+                             {0: run_ledger.get_query_hash('SELECT 3')})
+        self.assertDictEqual(
+            self.ledger.get_tables_modified(run_id), {
+                'test-project.test_dataset.person': '2020-01-02T00:00:00',
+                'test-project.test_sandbox.sb_person': None
+            })
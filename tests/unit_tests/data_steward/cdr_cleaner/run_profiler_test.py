@@ -0,0 +1,101 @@
+# Python imports
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import TestCase, mock
+
+# Project imports
+from cdr_cleaner import run_profiler
+from constants.cdr_cleaner import clean_cdr_engine as ce_consts
+from constants.cdr_cleaner import run_profiler as profile_consts
+
+
+class RunProfilerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.dataset_id = 'test_dataset'
+        self.sandbox_id = 'test_sandbox'
+        self.run_id = '2021-01-01T00:00:00'
+
+    def _job(self, rule, query_no, destination_dataset=None, dml_rows=None):
+        started = datetime(2021, 1, 1)
+        job = mock.MagicMock(job_id=f'{rule}_{query_no}',
+                             labels={
+                                 ce_consts.CLEANING_RULE_LABEL: rule,
+                                 ce_consts.QUERY_NO_LABEL: str(query_no)
+                             },
+                             started=started,
+                             ended=started + timedelta(seconds=90),
+                             slot_millis=1000,
+                             total_bytes_processed=2000,
+                             total_bytes_billed=3000,
+                             num_dml_affected_rows=dml_rows,
+                             query_plan=[mock.MagicMock(records_written=5)],
+                             ddl_target_table=None)
+        job.destination = None
+        if destination_dataset:
+            job.destination = mock.MagicMock(dataset_id=destination_dataset)
+        return job
+
+    def test_get_run_profile(self):
+        jobs = [
+            self._job('rule_a', 0, self.sandbox_id),
+            self._job('rule_a', 1, self.dataset_id),
+            self._job('rule_b', 0, dml_rows=7)
+        ]
+        skipped = [{
+            ce_consts.SKIPPED_RULE: 'rule_c',
+            ce_consts.SKIPPED_QUERY_NO: 0,
+            ce_consts.SKIPPED_REASON: 'empty table(s) person'
+        }]
+        profile = run_profiler.get_run_profile(jobs, self.dataset_id,
+                                               self.sandbox_id, self.run_id,
+                                               skipped)
+
+        self.assertEqual(len(profile), 4)
+        self.assertEqual(profile[0][profile_consts.RULE], 'rule_a')
+        self.assertEqual(profile[0][profile_consts.WALL_TIME_SECONDS], 90)
+        self.assertEqual(profile[0][profile_consts.ROWS_SANDBOXED], 5)
+        self.assertEqual(profile[0][profile_consts.ROWS_WRITTEN], 0)
+        self.assertEqual(profile[1][profile_consts.ROWS_SANDBOXED], 0)
+        self.assertEqual(profile[1][profile_consts.ROWS_WRITTEN], 5)
+        self.assertEqual(profile[2][profile_consts.ROWS_WRITTEN], 7)
+        self.assertEqual(profile[2][profile_consts.BYTES_BILLED], 3000)
+        self.assertIsNone(profile[2][profile_consts.SKIPPED_REASON])
+        self.assertEqual(profile[3][profile_consts.SKIPPED_REASON],
+                         'empty table(s) person')
+        self.assertEqual(profile[3][profile_consts.SLOT_MS], 0)
+
+    def test_compare_profiles(self):
+        jobs = [self._job('rule_a', 0), self._job('rule_b', 0)]
+        baseline = run_profiler.get_run_profile(jobs, self.dataset_id,
+                                                self.sandbox_id, self.run_id)
+        current = run_profiler.get_run_profile(jobs + [self._job('rule_c', 0)],
+                                               self.dataset_id, self.sandbox_id)
+        current[0][profile_consts.SLOT_MS] = 10000
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            baseline_path = os.path.join(temp_dir, 'baseline.csv')
+            current_path = os.path.join(temp_dir, 'current.csv')
+            run_profiler.write_profile_csv(baseline_path, baseline)
+            run_profiler.write_profile_csv(current_path, current)
+
+            regressions = run_profiler.main(
+                ['-b', baseline_path, '-c', current_path, '-t', '5'])
+
+        # rule_c has no baseline
+        self.assertListEqual(regressions, [{
+            profile_consts.RULE: 'rule_a',
+            profile_consts.BASELINE: 1000,
+            profile_consts.CURRENT: 10000,
+            profile_consts.RATIO: 10
+        }])
+        self.assertListEqual(
+            run_profiler.compare_profiles(baseline, current,
+                                          profile_consts.BYTES_PROCESSED), [])
@@ -0,0 +1,70 @@
+# Python imports
+from unittest import TestCase, mock
+
+# Project imports
+from cdr_cleaner import table_counts
+from constants.cdr_cleaner import clean_cdr_engine as ce_consts
+
+
+class TableCountsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.dataset_id = 'test_dataset'
+        self.client = mock.MagicMock(project='test_project')
+        self.row_counts = {'person': 10, 'observation': 20}
+        self.client.query.side_effect = self._query
+        table_counts.clear()
+
+    def _query(self, query):
+        self.assertIn(f'`test_project.{self.dataset_id}.__TABLES__`', query)
+        job = mock.MagicMock()
+        job.result.return_value = [{
+            'table_id': table,
+            ce_consts.ROW_COUNT: row_count,
+            ce_consts.LAST_MODIFIED: None
+        } for table, row_count in self.row_counts.items()]
+        return job
+
+    def test_get_table_counts(self):
+        counts = table_counts.get_table_counts(self.client, self.dataset_id,
+                                               ['person', 'death'])
+        self.assertDictEqual(counts, {'person': 10, 'death': 0})
+
+        # the counts of all tables come from one read of the metadata
+        table_counts.get_table_counts(self.client, self.dataset_id,
+                                      ['observation'])
+        self.assertEqual(self.client.query.call_count, 1)
+
+    def test_get_count_deltas(self):
+        initial_counts = table_counts.get_table_counts(
+            self.client, self.dataset_id, ['person', 'observation'])
+        self.row_counts = {'person': 4, 'observation': 20}
+
+        # writes to other datasets keep the cached counts
+        table_counts.invalidate({'test_sandbox.person'})
+        self.assertDictEqual(
+            table_counts.get_count_deltas(self.client, self.dataset_id,
+                                          initial_counts), {
+                                              'person': 0,
+                                              'observation': 0
+                                          })
+
+        table_counts.invalidate({f'{self.dataset_id}.person'})
+        self.assertDictEqual(
+            table_counts.get_count_deltas(self.client, self.dataset_id,
+                                          initial_counts), {
+                                              'person': -6,
+                                              'observation': 0
+                                          })
+        self.assertEqual(self.client.query.call_count, 2)
+
+        # writes to unknown tables invalidate all counts
+        table_counts.invalidate(None)
+        table_counts.get_table_counts(self.client, self.dataset_id, ['person'])
+        self.assertEqual(self.client.query.call_count, 3)
@@ -0,0 +1,64 @@
+# Python imports
+import unittest
+
+# Third party imports
+from google.cloud.exceptions import NotFound
+from mock import MagicMock, call, patch
+
+# Project imports
+from deid import execution
+
+
+class ExecutionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        execution.clear()
+        self.addCleanup(execution.clear)
+        self.client = MagicMock(project='foo_project')
+
+    @patch('deid.execution.bq.Client.from_service_account_json')
+    def test_get_client(self, mock_client):
+        client = execution.get_client('fake/SA/file/path.json')
+
+        self.assertIs(client, execution.get_client('fake/SA/file/path.json'))
+        mock_client.assert_called_once_with('fake/SA/file/path.json')
+
+    def test_ensure_dataset(self):
+        self.client.get_dataset.side_effect = NotFound('foo_deid')
+
+        execution.ensure_dataset(self.client, 'foo_deid')
+        execution.ensure_dataset(self.client, 'foo_deid')
+
+        self.client.get_dataset.assert_called_once_with('foo_deid')
+        self.client.create_dataset.assert_called_once()
+        dataset = self.client.create_dataset.call_args[0][0]
+        self.assertEqual(dataset.dataset_id, 'foo_deid')
+        self.client.list_datasets.assert_not_called()
+
+    def test_ensure_dataset_exists(self):
+        execution.ensure_dataset(self.client, 'foo_deid')
+        execution.ensure_dataset(self.client, 'foo_deid')
+
+        self.client.get_dataset.assert_called_once_with('foo_deid')
+        self.client.create_dataset.assert_not_called()
+
+    @patch('deid.execution.time.sleep')
+    def test_wait_for_job(self, mock_sleep):
+        states = ['PENDING', 'RUNNING', 'RUNNING', 'DONE']
+        self.client.get_job.side_effect = [
+            MagicMock(state=state) for state in states
+        ]
+
+        job = execution.wait_for_job(self.client, 'job_1')
+
+        self.assertEqual(job.state, 'DONE')
+        self.client.get_job.assert_called_with('job_1')
+        self.assertListEqual(
+            mock_sleep.call_args_list,
+            [call(0.5), call(0.75), call(1.125)])
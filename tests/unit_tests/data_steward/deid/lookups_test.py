@@ -0,0 +1,80 @@
+# Python imports
+import unittest
+
+# Third party imports
+from google.api_core.exceptions import NotFound
+from mock import MagicMock, patch
+
+# Project imports
+from constants.deid.deid import FINGERPRINT_LABEL
+from deid import lookups
+
+
+class LookupManagerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.table_id = 'foo_input._lookup'
+        self.client = MagicMock()
+        self.client.get_table.side_effect = NotFound('missing')
+        self.build = MagicMock()
+        self.lookups = lookups.LookupManager()
+
+    def test_get_fingerprint(self):
+        fingerprint = lookups.get_fingerprint(['a,b', b'1'])
+
+        self.assertEqual(len(fingerprint), lookups.FINGERPRINT_LENGTH)
+        self.assertEqual(fingerprint, lookups.get_fingerprint(['a,b', b'1']))
+        # the boundaries between inputs are part of the fingerprint
+        self.assertNotEqual(fingerprint, lookups.get_fingerprint(['a', ',b1']))
+
+    @patch('deid.lookups.table_counts.get_table_stats')
+    def test_get_table_inputs(self, mock_stats):
+        mock_stats.return_value = {'concept': {'last_modified': 't1'}}
+
+        self.assertListEqual(
+            lookups.get_table_inputs(self.client, 'foo_input',
+                                     ['concept_ancestor', 'concept']),
+            ['concept:t1', 'concept_ancestor:None'])
+
+    def test_ensure(self):
+        table = MagicMock(labels={})
+        self.client.get_table.side_effect = [NotFound('missing'), table]
+
+        self.assertTrue(
+            self.lookups.ensure(self.client, self.table_id, ['csv'],
+                                self.build))
+        self.build.assert_called_once_with()
+        fingerprint = lookups.get_fingerprint(['csv'])
+        self.assertDictEqual(table.labels, {FINGERPRINT_LABEL: fingerprint})
+        self.client.update_table.assert_called_once_with(table, ['labels'])
+
+        # the other tables of the run reuse the lookup table
+        self.assertFalse(
+            self.lookups.ensure(self.client, self.table_id, ['csv'],
+                                self.build))
+        self.assertEqual(self.build.call_count, 1)
+        self.assertEqual(self.client.get_table.call_count, 2)
+
+    def test_ensure_stored_fingerprint(self):
+        fingerprint = lookups.get_fingerprint(['csv'])
+        self.client.get_table.side_effect = None
+        self.client.get_table.return_value = MagicMock(
+            labels={FINGERPRINT_LABEL: fingerprint})
+
+        # a table built from the same inputs by an earlier run is reused
+        self.assertFalse(
+            self.lookups.ensure(self.client, self.table_id, ['csv'],
+                                self.build))
+        self.build.assert_not_called()
+
+        # a table built from other inputs is rebuilt
+        self.assertTrue(
+            self.lookups.ensure(self.client, self.table_id, ['new csv'],
+                                self.build))
+        self.build.assert_called_once_with()
@@ -64,6 +64,8 @@ class ParserTest(unittest.TestCase):
 
         # setting correct_parameter_dict values not set in setUp function
         correct_parameter_dict['cluster'] = False
+        correct_parameter_dict['segment_jobs'] = False
+        correct_parameter_dict['verify_union'] = False
         correct_parameter_dict['age_limit'] = MAX_AGE
 
         # Test if correct parameters are given
@@ -2,7 +2,8 @@
 import unittest
 
 # Third party imports
-from mock import patch
+import pandas as pd
+from mock import MagicMock, patch
 
 # Project imports
 from deid.press import Press
@@ -90,3 +91,45 @@ class PressTest(unittest.TestCase):
         # post conditions
         expected = ['delete * from ' + table_path]
         self.assertEqual(result, expected)
+
+    def test_to_union_sql(self):
+        segments = [
+            'SELECT a FROM t WHERE b = 1', 'SELECT a FROM t WHERE b = 2'
+        ]
+
+        result = self.press_obj.to_union_sql(segments)
+
+        expected = ('(SELECT a FROM t WHERE b = 1)\nUNION ALL\n'
+                    '(SELECT a FROM t WHERE b = 2)')
+        self.assertEqual(result, expected)
+
+    def test_verify_segments(self):
+        # pre-conditions
+        self.press_obj.odataset = 'foo_deid'
+        segments = [
+            'SELECT a FROM t WHERE b = 1', 'SELECT a FROM t WHERE b = 2'
+        ]
+        self.press_obj.get_dataframe = MagicMock(return_value=pd.DataFrame([{
+            'table_rows': 5,
+            'segment_rows': 5,
+            'missing_rows': 0
+        }]))
+
+        # test
+        self.press_obj.verify_segments(segments)
+
+        # post conditions
+        sql = self.press_obj.get_dataframe.call_args[1]['sql']
+        self.assertIn('FROM foo_deid.bar_table', sql)
+        self.assertIn(
+            '((SELECT a FROM t WHERE b = 2) EXCEPT DISTINCT '
+            'SELECT * FROM foo_deid.bar_table)', sql)
+
+        # rows missing from the output table fail the verification
+        self.press_obj.get_dataframe.return_value = pd.DataFrame([{
+            'table_rows': 5,
+            'segment_rows': 5,
+            'missing_rows': 1
+        }])
+        self.assertRaises(RuntimeError, self.press_obj.verify_segments,
+                          segments)
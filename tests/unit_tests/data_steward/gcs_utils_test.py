@@ -0,0 +1,66 @@
+import unittest
+
+import mock
+from googleapiclient.errors import HttpError
+
+import gcs_utils
+
+
+class GcsUtilsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.bucket = 'fake_bucket'
+        self.bucket_items = [{
+            'name': 'person.csv'
+        }, {
+            'name': '2020-01-01-v1/person.csv'
+        }, {
+            'name': '2020-01-01-v1/nested/visit_occurrence.csv'
+        }, {
+            'name': '2020-01-02-v1/person.csv'
+        }]
+
+    @mock.patch('gcs_utils.create_service')
+    def test_get_metadata(self, mock_create_service):
+        mock_get = mock_create_service.return_value.objects.return_value.get
+        mock_get.return_value.execute.return_value = {'name': 'person.csv'}
+
+        actual = gcs_utils.get_metadata(self.bucket, 'person.csv')
+
+        self.assertEqual(actual, {'name': 'person.csv'})
+        mock_get.assert_called_once_with(bucket=self.bucket,
+                                         object='person.csv')
+
+        not_found = HttpError(mock.Mock(status=404), b'Not Found')
+        mock_get.return_value.execute.side_effect = not_found
+        self.assertIsNone(gcs_utils.get_metadata(self.bucket, 'missing.csv'))
+        self.assertFalse(
+            gcs_utils.get_metadata(self.bucket, 'missing.csv', False))
+
+        forbidden = HttpError(mock.Mock(status=403), b'Forbidden')
+        mock_get.return_value.execute.side_effect = forbidden
+        with self.assertRaises(HttpError):
+            gcs_utils.get_metadata(self.bucket, 'person.csv')
+
+    def test_bucket_index(self):
+        bucket_index = gcs_utils.BucketIndex(self.bucket_items)
+
+        self.assertEqual(bucket_index, self.bucket_items)
+        self.assertCountEqual(bucket_index.folders(),
+                              ['2020-01-01-v1/', '2020-01-02-v1/'])
+        self.assertEqual(bucket_index.folder_items('2020-01-01-v1/'),
+                         self.bucket_items[1:3])
+        self.assertEqual(bucket_index.folder_items('2020-01-01-v1/nested/'),
+                         [self.bucket_items[2]])
+        self.assertEqual(bucket_index.folder_items('missing/'), [])
+        self.assertEqual(bucket_index.get('2020-01-02-v1/person.csv'),
+                         self.bucket_items[3])
+        self.assertIsNone(bucket_index.get('2020-01-02-v1/missing.csv'))
+        self.assertIs(gcs_utils.BucketIndex.for_items(bucket_index),
+                      bucket_index)
@@ -14,7 +14,7 @@ import os
 import unittest
 
 # Third party imports
-from mock import patch
+from mock import ANY, MagicMock, patch
 
 from resources import DEID_PATH
 # Project imports
@@ -81,6 +81,9 @@ class RunDeidTest(unittest.TestCase):
         correct_parameter_dict['console_log'] = False
         correct_parameter_dict['interactive_mode'] = False
         correct_parameter_dict['input_dataset'] = self.input_dataset
+        correct_parameter_dict['compile_dir'] = None
+        correct_parameter_dict['max_workers'] = 1
+        correct_parameter_dict['verify_union'] = False
 
         # need to delete idataset argument from correct_parameter_dict because input_dataset argument is returned
         # when self.correct_parameter_list is supplied to parse_args
@@ -95,32 +98,108 @@ class RunDeidTest(unittest.TestCase):
 
     @patch('tools.run_deid.fields_for')
     @patch('tools.run_deid.copy_suppressed_table_schemas')
-    @patch('deid.aou.main')
+    @patch('deid.aou.initialize_table')
+    @patch('tools.run_deid.get_table_rows')
     @patch('tools.run_deid.copy_deid_map_table')
     @patch('tools.run_deid.load_deid_map_table')
     @patch('tools.run_deid.get_output_tables')
-    def test_main(self, mock_tables, mock_load, mock_copy, mock_main,
-                  mock_suppressed, mock_fields):
+    def test_main(self, mock_tables, mock_load, mock_copy, mock_rows,
+                  mock_initialize, mock_suppressed, mock_fields):
         # Tests if incorrect parameters are given
         self.assertRaises(SystemExit, run_deid.main,
                           self.incorrect_parameter_list)
 
         # Preconditions
         mock_tables.return_value = ['fake1']
+        mock_rows.return_value = {'fake1': 10}
         mock_fields.return_value = {}
 
         # Tests if correct parameters are given
         run_deid.main(self.correct_parameter_list)
 
         # Post conditions
-        mock_main.assert_called_once_with([
+        mock_initialize.return_value.do.assert_called_once_with()
+        mock_initialize.assert_called_once_with([
             '--rules',
             os.path.join(DEID_PATH, 'config', 'ids', 'config.json'),
             '--private_key', self.private_key, '--table', 'fake1', '--action',
             self.action, '--idataset', self.input_dataset, '--log', 'LOGS',
             '--odataset', self.output_dataset, '--age-limit', self.max_age
+        ],
+                                                lookups=ANY)
+        self.assertEqual(mock_initialize.call_count, 1)
+
+    @patch('tools.run_deid.fields_for')
+    @patch('deid.aou.initialize_table')
+    def test_deid_tables(self, mock_initialize, mock_fields):
+        # Preconditions
+        args = run_deid.parse_args(self.correct_parameter_list +
+                                   ['--max_workers', '2'])
+        tables = ['death', 'person', 'observation', 'measurement']
+        table_rows = {'observation': 300, 'measurement': 400, 'person': 10}
+        mock_fields.return_value = [{'name': 'person_id'}]
+        handles = {}
+
+        def initialize(parameter_list, lookups):
+            table = parameter_list[parameter_list.index('--table') + 1]
+            if table == 'death':
+                return None
+            handles[table] = MagicMock()
+            if table == 'person':
+                handles[table].do.side_effect = RuntimeError('failed')
+            return handles[table]
+
+        mock_initialize.side_effect = initialize
+
+        # Test
+        summary = run_deid.deid_tables(args, tables, [], DEID_PATH, table_rows)
+
+        # Post conditions
+        initialized = [
+            call[0][0][call[0][0].index('--table') + 1]
+            for call in mock_initialize.call_args_list
+        ]
+        # all tables are initialized before any runs, largest first
+        self.assertListEqual(initialized,
+                             ['measurement', 'observation', 'person', 'death'])
+        for handle in handles.values():
+            handle.do.assert_called_once_with()
+        # a failed table does not stop the others
+        self.assertDictEqual(
+            {
+                table: (succeeded, rows) for table, succeeded, _, rows in summary
+            }, {
+                'measurement': (True, 400),
+                'observation': (True, 300),
+                'person': (False, 10),
+                'death': (False, 0)
+            })
+
+    @patch('tools.run_deid.fields_for')
+    @patch('tools.run_deid.sql_compiler')
+    @patch('deid.aou.compile_table')
+    @patch('tools.run_deid.load_deid_map_table')
+    @patch('tools.run_deid.get_known_tables')
+    def test_main_compile_only(self, mock_known, mock_load, mock_compile,
+                               mock_sql_compiler, mock_fields):
+        # Preconditions
+        mock_known.return_value = ['person', 'note', 'observation', 'fake']
+        mock_compile.side_effect = [['SELECT 1'], ['SELECT 2', 'UPDATE 3']]
+        mock_sql_compiler.log_manifest.return_value = 0
+        mock_fields.return_value = {}
+
+        run_deid.main(self.correct_parameter_list[:-8] + [
+            '--action', self.action, '--age_limit', self.max_age,
+            '--compile_only', 'compiled'
         ])
-        self.assertEqual(mock_main.call_count, 1)
+
+        # Post conditions
+        mock_load.assert_not_called()
+        self.assertEqual(mock_compile.call_count, 2)
+        mock_sql_compiler.write_compiled_sql.assert_called_once_with(
+            'compiled',
+            [('observation_0', 'SELECT 1'), ('person_0', 'SELECT 2'),
+             ('person_1', 'UPDATE 3')], [])
 
     @patch('tools.run_deid.os.walk')
     def test_known_tables(self, mock_walk):
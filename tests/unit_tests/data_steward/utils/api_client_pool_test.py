@@ -0,0 +1,147 @@
+import threading
+import unittest
+from unittest import mock
+
+from utils import api_client_pool
+
+
+class ApiClientPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.credentials = mock.MagicMock()
+        self.mock_build_patcher = mock.patch('utils.api_client_pool.build')
+        self.mock_build = self.mock_build_patcher.start()
+        self.mock_build.side_effect = lambda *args, **kwargs: mock.MagicMock()
+        self.addCleanup(self.mock_build_patcher.stop)
+
+        self.mock_authorized_http_patcher = mock.patch(
+            'utils.api_client_pool.AuthorizedHttp')
+        self.mock_authorized_http = self.mock_authorized_http_patcher.start()
+        self.mock_authorized_http.side_effect = lambda *args, **kwargs: mock.MagicMock(
+        )
+        self.addCleanup(self.mock_authorized_http_patcher.stop)
+
+        self.mock_build_http_patcher = mock.patch(
+            'utils.api_client_pool.build_http')
+        self.mock_build_http_patcher.start()
+        self.addCleanup(self.mock_build_http_patcher.stop)
+
+    def test_get_service_reuses_service(self):
+        pool = api_client_pool.ClientPool(credentials=self.credentials)
+
+        bq_service = pool.get_service('bigquery', 'v2')
+        self.assertIs(bq_service, pool.get_service('bigquery', 'v2'))
+        gcs_service = pool.get_service('storage', 'v1')
+        self.assertIsNot(bq_service, gcs_service)
+
+        self.assertEqual(self.mock_build.call_count, 2)
+        stats = pool.stats.snapshot()
+        self.assertEqual(stats['service_builds'], 2)
+        self.assertEqual(stats['service_hits'], 1)
+        # services share one pooled http object
+        http_args = [
+            kwargs['http'] for _, kwargs in self.mock_build.call_args_list
+        ]
+        self.assertIs(http_args[0], http_args[1])
+
+    def test_pooled_http_reuses_transport(self):
+        stats = api_client_pool.PoolStats()
+        http = api_client_pool.PooledHttp(self.credentials, stats, 2)
+
+        http.request('https://example.com', 'GET')
+        http.request('https://example.com', method='POST', body='{}')
+
+        self.assertEqual(self.mock_authorized_http.call_count, 1)
+        transport = http._idle[0]
+        transport.request.assert_called_with('https://example.com',
+                                             method='POST',
+                                             body='{}')
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['transport_builds'], 1)
+        self.assertEqual(snapshot['transport_hits'], 1)
+
+    def test_pooled_http_discards_failed_transport(self):
+        stats = api_client_pool.PoolStats()
+        http = api_client_pool.PooledHttp(self.credentials, stats, 1)
+        failing = mock.MagicMock()
+        failing.request.side_effect = OSError('connection reset')
+        self.mock_authorized_http.side_effect = [failing, mock.MagicMock()]
+
+        with self.assertRaises(OSError):
+            http.request('https://example.com')
+        self.assertEqual(http._idle, [])
+
+        # the slot was released so the next request does not block
+        http.request('https://example.com')
+        self.assertEqual(self.mock_authorized_http.call_count, 2)
+
+    def test_pooled_http_bounds_connections(self):
+        stats = api_client_pool.PoolStats()
+        http = api_client_pool.PooledHttp(self.credentials, stats, 2)
+        release = threading.Event()
+        started = threading.Semaphore(0)
+        in_flight = []
+        lock = threading.Lock()
+
+        def slow_request(*args, **kwargs):
+            with lock:
+                in_flight.append(1)
+            started.release()
+            # hold the connection open until the test releases it
+            release.wait(5)
+            with lock:
+                in_flight.pop()
+            return mock.MagicMock(), b''
+
+        def make_transport(*args, **kwargs):
+            transport = mock.MagicMock()
+            transport.request.side_effect = slow_request
+            return transport
+
+        self.mock_authorized_http.side_effect = make_transport
+        threads = [
+            threading.Thread(target=http.request, args=('https://example.com',))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # two requests hold both connections
+        self.assertTrue(started.acquire(timeout=5))
+        self.assertTrue(started.acquire(timeout=5))
+        # the third request waits for a connection to be returned
+        self.assertFalse(started.acquire(timeout=0.2))
+        self.assertEqual(len(in_flight), 2)
+        self.assertEqual(self.mock_authorized_http.call_count, 2)
+
+        release.set()
+        self.assertTrue(started.acquire(timeout=5))
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(in_flight), 0)
+        # the third request reused a returned connection
+        self.assertEqual(self.mock_authorized_http.call_count, 2)
+
+    @mock.patch('utils.api_client_pool.google.auth.default')
+    def test_get_pool_is_shared(self, mock_default):
+        mock_default.return_value = (self.credentials, 'fake-project')
+        api_client_pool.reset_pool()
+        self.addCleanup(api_client_pool.reset_pool)
+
+        with mock.patch.dict('os.environ',
+                             {api_client_pool.MAX_CONNECTIONS_ENV: '4'}):
+            pool = api_client_pool.get_pool()
+        self.assertIs(pool, api_client_pool.get_pool())
+        self.assertEqual(pool.max_connections, 4)
+
+        api_client_pool.get_service('bigquery', 'v2')
+        api_client_pool.get_service('bigquery', 'v2')
+        mock_default.assert_called_once_with(scopes=api_client_pool.SCOPES)
+        self.assertEqual(api_client_pool.get_stats()['service_hits'], 1)
@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+
+from utils import dag_executor
+
+
+class DagExecutorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.started = []
+        self.finished = []
+        self.running = 0
+        self.max_running = 0
+
+    def run_task(self, task):
+        with self.lock:
+            self.started.append(task)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+            self.finished.append(task)
+        return task.upper()
+
+    def test_run_dag(self):
+        tasks = ['a', 'b', 'c', 'd']
+        dependencies = {'c': {'a', 'b'}, 'd': {'c'}}
+
+        results = dag_executor.run_dag(tasks, dependencies, self.run_task, 4)
+
+        self.assertEqual(results, {'a': 'A', 'b': 'B', 'c': 'C', 'd': 'D'})
+        self.assertEqual(self.max_running, 2)
+        self.assertCountEqual(self.finished[:2], ['a', 'b'])
+        self.assertEqual(self.finished[2:], ['c', 'd'])
+
+    def test_run_dag_bounds_workers(self):
+        tasks = list('abcdef')
+
+        dag_executor.run_dag(tasks, {}, self.run_task, 2)
+
+        self.assertEqual(self.max_running, 2)
+        # ready tasks start in the given order
+        self.assertEqual(self.started, tasks)
+
+    def test_run_dag_initializer(self):
+        store = threading.local()
+
+        def initialize(value):
+            store.value = value
+
+        results = dag_executor.run_dag(['a', 'b'], {},
+                                       lambda task: store.value,
+                                       2,
+                                       initializer=initialize,
+                                       initargs=('logger',))
+
+        self.assertEqual(results, {'a': 'logger', 'b': 'logger'})
+
+    def test_run_dag_failure(self):
+
+        def run_task(task):
+            if task == 'a':
+                raise ValueError('fake error')
+            return self.run_task(task)
+
+        with self.assertRaises(ValueError):
+            dag_executor.run_dag(['a', 'b', 'c'], {'c': {'a'}}, run_task, 1)
+        # dependents of the failed task and tasks not started yet are skipped
+        self.assertNotIn('c', self.started)
+
+    def test_run_dag_invalid_dependencies(self):
+        with self.assertRaises(ValueError):
+            dag_executor.run_dag(['a'], {'a': {'b'}}, self.run_task, 1)
+        with self.assertRaises(RuntimeError):
+            dag_executor.run_dag(['a', 'b'], {
+                'a': {'b'},
+                'b': {'a'}
+            }, self.run_task, 1)
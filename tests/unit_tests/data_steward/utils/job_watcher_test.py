@@ -0,0 +1,118 @@
+import threading
+import time
+import unittest
+
+from utils.job_watcher import JobWatcher
+
+
+class JobWatcherTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.done_jobs = set()
+        self.polls = []
+        self.lock = threading.Lock()
+
+    def fetch_states(self, job_ids):
+        with self.lock:
+            self.polls.append(sorted(job_ids))
+            return {
+                job_id: 'DONE' if job_id in self.done_jobs else 'RUNNING'
+                for job_id in job_ids
+            }
+
+    def test_wait_returns_when_done(self):
+        watcher = JobWatcher(self.fetch_states, min_poll_interval=0.01)
+        self.done_jobs.update(['a', 'b'])
+
+        start = time.time()
+        self.assertEqual(watcher.wait(['a', 'b'], timeout=5), [])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(self.polls[0], ['a', 'b'])
+
+    def test_wait_timeout(self):
+        watcher = JobWatcher(self.fetch_states, min_poll_interval=0.01)
+        self.done_jobs.add('a')
+
+        self.assertEqual(watcher.wait(['a', 'b'], timeout=0.1), ['b'])
+        # jobs nobody waits on are no longer polled
+        self.assertEqual(watcher._jobs, {})
+
+    def test_concurrent_callers_share_polls(self):
+        watcher = JobWatcher(self.fetch_states, min_poll_interval=0.05)
+        results = {}
+
+        def wait_on(name, job_ids):
+            results[name] = watcher.wait(job_ids, timeout=5)
+
+        threads = [
+            threading.Thread(target=wait_on, args=('first', ['a'])),
+            threading.Thread(target=wait_on, args=('second', ['b', 'c']))
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.02)
+        with self.lock:
+            self.done_jobs.update(['a', 'b', 'c'])
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {'first': [], 'second': []})
+        self.assertIn(['a', 'b', 'c'], self.polls)
+
+    def test_lookup_error_is_raised(self):
+
+        def fetch_states(job_ids):
+            return {job_id: RuntimeError('not found') for job_id in job_ids}
+
+        watcher = JobWatcher(fetch_states, min_poll_interval=0.01)
+        with self.assertRaises(RuntimeError):
+            watcher.wait(['a'], timeout=5)
+
+    def test_transient_lookup_error_is_retried(self):
+        lookups = []
+
+        def fetch_states(job_ids):
+            lookups.append(job_ids)
+            if len(lookups) < 3:
+                raise ConnectionError('connection reset')
+            return {job_id: 'DONE' for job_id in job_ids}
+
+        watcher = JobWatcher(fetch_states,
+                             min_poll_interval=0.01,
+                             is_transient=lambda exc: True,
+                             max_failures=3)
+        self.assertEqual(watcher.wait(['a'], timeout=5), [])
+        self.assertEqual(len(lookups), 3)
+
+    def test_transient_lookup_error_is_raised_after_max_failures(self):
+        lookups = []
+
+        def fetch_states(job_ids):
+            lookups.append(job_ids)
+            return {job_id: ConnectionError('reset') for job_id in job_ids}
+
+        watcher = JobWatcher(fetch_states,
+                             min_poll_interval=0.01,
+                             is_transient=lambda exc: True,
+                             max_failures=3)
+        with self.assertRaises(ConnectionError):
+            watcher.wait(['a'], timeout=5)
+        self.assertEqual(len(lookups), 3)
+
+    def test_poll_interval_backs_off(self):
+        watcher = JobWatcher(self.fetch_states,
+                             min_poll_interval=0.5,
+                             max_poll_interval=10,
+                             backoff_fraction=0.25)
+        now = time.time()
+        handles = watcher.watch(['a'])
+        self.assertEqual(watcher._next_interval(now), 0.5)
+        self.assertAlmostEqual(watcher._next_interval(now + 20), 5, places=2)
+        self.assertEqual(watcher._next_interval(now + 100), 10)
+        watcher._release(handles)
@@ -0,0 +1,86 @@
+# Python imports
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+# Project imports
+from utils import sql_compiler
+
+
+class SqlCompilerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def test_check_sql(self):
+        sql = """
+        -- a comment (with an unbalanced parenthesis
+        SELECT person_id, ')' AS closing,
+        FROM `project.dataset.person`
+        JOIN (SELECT person_id FROM `project.dataset.observation`)
+        USING (person_id)
+        """
+        result = sql_compiler.check_sql(sql)
+        self.assertListEqual(result[sql_compiler.PROBLEMS], [])
+        self.assertEqual(result[sql_compiler.SELECTS], 2)
+        self.assertEqual(result[sql_compiler.JOINS], 1)
+        self.assertEqual(result[sql_compiler.MAX_DEPTH], 1)
+
+        self.assertListEqual(
+            sql_compiler.check_sql(
+                "SELECT COALESCE(a, ) FROM {{dataset}}.t WHERE (b = 'x")
+            [sql_compiler.PROBLEMS], [
+                'Unterminated \' on line 1', '1 unclosed parenthesis(es)',
+                'Unrendered placeholder {{',
+                'Comma before a closing parenthesis'
+            ])
+        self.assertListEqual(
+            sql_compiler.check_sql('SELECT * FROM :idataset.person')[
+                sql_compiler.PROBLEMS], ['Unrendered placeholder :idataset'])
+
+    def test_write_compiled_sql(self):
+        compiled = [('rule_a_0', 'SELECT 1\n'), ('rule/b_0', 'SELECT (2')]
+        errors = [('rule_c', 'needs the dataset')]
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            sql_compiler.write_compiled_sql(
+                output_dir, compiled + [('rule_stale_0', 'SELECT 3')])
+            # files the manifest does not list are kept
+            kept_file = os.path.join(output_dir, 'hand_written.sql')
+            open(kept_file, 'w').close()
+
+            manifest = sql_compiler.write_compiled_sql(output_dir, compiled,
+                                                       errors)
+
+            self.assertListEqual(sorted(os.listdir(output_dir)), [
+                '000_rule_a_0.sql', '001_rule_b_0.sql', 'hand_written.sql',
+                sql_compiler.MANIFEST_FILE
+            ])
+            with open(os.path.join(output_dir, '000_rule_a_0.sql')) as f:
+                self.assertEqual(f.read(), 'SELECT 1\n')
+            with open(os.path.join(output_dir,
+                                   sql_compiler.MANIFEST_FILE)) as f:
+                self.assertDictEqual(json.load(f), manifest)
+
+            # the output does not change between runs
+            self.assertDictEqual(
+                sql_compiler.write_compiled_sql(output_dir, compiled, errors),
+                manifest)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            open(os.path.join(output_dir, 'hand_written.sql'), 'w').close()
+            with self.assertRaises(FileExistsError):
+                sql_compiler.write_compiled_sql(output_dir, compiled, errors)
+            self.assertListEqual(os.listdir(output_dir), ['hand_written.sql'])
+
+        statements = manifest[sql_compiler.STATEMENTS]
+        self.assertEqual(statements[0][sql_compiler.SHA256],
+                         sql_compiler.get_sql_hash('SELECT 1\n'))
+        self.assertListEqual(statements[1][sql_compiler.PROBLEMS],
+                             ['1 unclosed parenthesis(es)'])
+        # statements which could not be generated are not counted
+        self.assertEqual(sql_compiler.log_manifest(output_dir, manifest), 1)
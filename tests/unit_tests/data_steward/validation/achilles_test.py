@@ -36,3 +36,38 @@ class AchillesTest(unittest.TestCase):
         for command in commands:
             is_temp = sql_wrangle.is_to_temp_table(command)
             self.assertFalse(is_temp, command)
+
+    def test_get_fused_commands(self):
+        commands = achilles._get_run_analysis_commands(self.hpo_id)
+        dependencies = sql_wrangle.get_command_dependencies(commands)
+
+        fused_commands, fused_dependencies = achilles.get_fused_commands(
+            commands, dependencies, self.hpo_id, max_fused_analyses=10)
+
+        self.assertLess(len(fused_commands), len(commands))
+        self.assertEqual(fused_dependencies, {})
+        # every analysis query is part of exactly one fused command
+        for command in commands:
+            _, _, query = sql_wrangle.get_insert_parts(command)
+            containing = [
+                fused_command for fused_command in fused_commands
+                if query in fused_command
+            ]
+            self.assertEqual(len(containing), 1, command)
+        for fused_command in fused_commands:
+            self.assertFalse(sql_wrangle.is_to_temp_table(fused_command))
+            self.assertLessEqual(fused_command.count('SELECT * FROM ('), 10)
+
+    def test_fuse_inserts(self):
+        commands = [
+            'insert into results (analysis_id, count_value) select 1, 2',
+            'insert into results_dist (analysis_id) select 3',
+            'insert into results (analysis_id, count_value) select 4, 5'
+        ]
+        expected = ('insert into results (analysis_id, count_value)\n'
+                    'SELECT * FROM (\nselect 1, 2\n)\n'
+                    'UNION ALL\n'
+                    'SELECT * FROM (\nselect 4, 5\n);\n'
+                    'insert into results_dist (analysis_id)\n'
+                    'SELECT * FROM (\nselect 3\n)')
+        self.assertEqual(achilles.fuse_inserts(commands), expected)
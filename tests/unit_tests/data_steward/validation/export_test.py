@@ -0,0 +1,118 @@
+"""
+Unit test components of data_steward.validation.export
+"""
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+import mock
+
+from validation import export
+
+
+class ExportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.query_result = {
+            'totalRows':
+                '2',
+            'schema': {
+                'fields': [{
+                    'name': 'concept_id',
+                    'type': 'INTEGER'
+                }, {
+                    'name': 'concept_name',
+                    'type': 'STRING'
+                }, {
+                    'name': 'percentage',
+                    'type': 'FLOAT'
+                }]
+            },
+            'rows': [{
+                'f': [{
+                    'v': '8507'
+                }, {
+                    'v': 'MALE'
+                }, {
+                    'v': '0.5'
+                }]
+            }, {
+                'f': [{
+                    'v': None
+                }, {
+                    'v': 'FEMALE'
+                }, {
+                    'v': None
+                }]
+            }]
+        }
+
+    def test_query_result_to_payload(self):
+        payload = export.query_result_to_payload(self.query_result)
+        self.assertEqual(
+            payload, {
+                'CONCEPT_ID': [8507, None],
+                'CONCEPT_NAME': ['MALE', 'FEMALE'],
+                'PERCENTAGE': [0.5, None]
+            })
+
+        # single rows are serialized as single element properties
+        self.query_result['totalRows'] = '1'
+        self.query_result['rows'] = self.query_result['rows'][:1]
+        payload = export.query_result_to_payload(self.query_result)
+        self.assertEqual(payload, {
+            'CONCEPT_ID': 8507,
+            'CONCEPT_NAME': 'MALE',
+            'PERCENTAGE': 0.5
+        })
+
+        self.query_result['totalRows'] = '0'
+        payload = export.query_result_to_payload(self.query_result)
+        self.assertEqual(payload, {
+            'CONCEPT_ID': [],
+            'CONCEPT_NAME': [],
+            'PERCENTAGE': []
+        })
+
+    @mock.patch('validation.export.is_hpo_id')
+    @mock.patch('validation.export.bq_utils.get_dataset_id')
+    @mock.patch('validation.export.bq_utils.query')
+    def test_export_from_paths(self, mock_query, mock_dataset_id,
+                               mock_is_hpo_id):
+        mock_is_hpo_id.return_value = True
+        mock_dataset_id.return_value = 'fake_dataset'
+        mock_query.return_value = self.query_result
+        with tempfile.TemporaryDirectory() as base_path:
+            report_path = os.path.join(base_path, 'person')
+            os.makedirs(os.path.join(report_path, 'gender'))
+            for sql_path in [
+                    os.path.join(report_path, 'summary.sql'),
+                    os.path.join(report_path, 'gender.sql'),
+                    os.path.join(report_path, 'gender', 'counts.sql')
+            ]:
+                with open(sql_path, 'w') as fp:
+                    fp.write('SELECT * FROM @results_database_schema.person')
+
+            results = export.export_from_paths([report_path], 'fake_hpo')
+
+        payload = export.query_result_to_payload(self.query_result)
+        expected = dict(payload)
+        expected['COUNTS'] = payload
+        self.assertEqual(results, [{'SUMMARY': payload, 'GENDER': expected}])
+        self.assertEqual(mock_query.call_count, 3)
+        mock_query.assert_called_with(
+            'SELECT * FROM fake_dataset.fake_hpo_person')
+        mock_is_hpo_id.assert_called_once_with('fake_hpo')
+
+    def test_gzip_json(self):
+        payload = export.query_result_to_payload(self.query_result)
+        fp = export.gzip_json(payload)
+        self.assertEqual(json.loads(gzip.decompress(fp.read())), payload)
@@ -153,57 +153,84 @@ class ValidationMainTest(TestCase):
         self.assertCountEqual(expected_pii_files, pii_files)
         self.assertCountEqual(expected_unknown_files, unknown_files)
 
+    @mock.patch('bq_utils.get_job_details')
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.load_from_csv')
     @mock.patch('bq_utils.create_standard_table')
-    @mock.patch('validation.main.perform_validation_on_file')
     @mock.patch('api_util.check_cron')
     def test_validate_submission(self, mock_check_cron,
-                                 mock_perform_validation_on_file,
-                                 mock_create_standard_table):
+                                 mock_create_standard_table, mock_load_from_csv,
+                                 mock_wait_on_jobs, mock_get_job_details):
         """
         Checks the return value of validate_submission
 
         :param mock_check_cron:
-        :param mock_perform_validation_on_file:
         :param mock_create_standard_table:
+        :param mock_load_from_csv:
+        :param mock_wait_on_jobs:
+        :param mock_get_job_details:
         :return:
         """
         folder_prefix = '2019-01-01/'
-        folder_items = ['person.csv', 'invalid_file.csv']
+        folder_items = [
+            'person.csv', 'visit_occurrence.csv', 'invalid_file.csv'
+        ]
 
-        perform_validation_on_file_returns = dict()
+        job_statuses = dict()
         expected_results = []
         expected_errors = []
         expected_warnings = [('invalid_file.csv', 'Unknown file')]
         for file_name in sorted(resources.CDM_FILES) + sorted(common.PII_FILES):
-            result = []
-            errors = []
             found = 0
             parsed = 0
             loaded = 0
+            table_name = file_name.split('.')[0]
             if file_name == 'person.csv':
                 found = 1
                 parsed = 1
                 loaded = 1
+                job_statuses[f'{table_name}_job'] = {'state': 'DONE'}
             elif file_name == 'visit_occurrence.csv':
                 found = 1
-                error = (file_name, 'Fake parsing error')
-                errors.append(error)
-            result.append((file_name, found, parsed, loaded))
-            perform_validation_on_file_returns[file_name] = result, errors
-            expected_results += result
-            expected_errors += errors
-
-        def perform_validation_on_file(cdm_file_name, found_cdm_files, hpo_id,
-                                       folder_prefix, bucket):
-            return perform_validation_on_file_returns.get(cdm_file_name)
-
-        mock_perform_validation_on_file.side_effect = perform_validation_on_file
+                job_statuses[f'{table_name}_job'] = {
+                    'state': 'DONE',
+                    'errorResult': {
+                        'message': 'Fake parsing error'
+                    },
+                    'errors': [{
+                        'message': 'Fake parsing error'
+                    }]
+                }
+                expected_errors.append((file_name, 'Fake parsing error'))
+            if file_name in common.SUBMISSION_FILES:
+                expected_results.append((file_name, found, parsed, loaded))
+
+        mock_load_from_csv.side_effect = lambda hpo_id, table_name, folder_prefix: {
+            'jobReference': {
+                'jobId': f'{table_name}_job'
+            }
+        }
+        mock_wait_on_jobs.return_value = []
+        mock_get_job_details.side_effect = lambda job_id: {
+            'status': job_statuses[job_id]
+        }
 
         actual_result = main.validate_submission(self.hpo_id, self.hpo_bucket,
                                                  folder_items, folder_prefix)
         self.assertCountEqual(expected_results, actual_result.get('results'))
         self.assertCountEqual(expected_errors, actual_result.get('errors'))
         self.assertCountEqual(expected_warnings, actual_result.get('warnings'))
+        self.assertEqual(mock_create_standard_table.call_count,
+                         len(resources.CDM_FILES + common.PII_FILES))
+        # all load jobs are awaited together
+        mock_wait_on_jobs.assert_called_once_with(
+            ['person_job', 'visit_occurrence_job'])
+
+        # a load job which does not complete aborts the validation
+        mock_wait_on_jobs.return_value = ['visit_occurrence_job']
+        with self.assertRaises(main.InternalValidationError):
+            main.validate_submission(self.hpo_id, self.hpo_bucket, folder_items,
+                                     folder_prefix)
 
     @mock.patch('validation.main.gcs_utils.get_hpo_bucket')
     @mock.patch('bq_utils.get_hpo_info')
@@ -224,6 +251,53 @@ class ValidationMainTest(TestCase):
                 f"HTTP error: {http_error_string}")
             self.assertIn(expected_call, mock_logging_error.mock_calls)
 
+    @mock.patch('validation.main.gcs_utils.get_hpo_bucket')
+    @mock.patch('validation.main.list_bucket')
+    @mock.patch('validation.main.process_hpo')
+    def test_validate_hpos(self, mock_process_hpo, mock_list_bucket,
+                           mock_hpo_bucket):
+        bucket_sizes = {'small_bucket': 10, 'big_bucket': 1000}
+        mock_hpo_bucket.side_effect = lambda hpo_id: f'{hpo_id}_bucket'
+
+        def list_bucket(bucket):
+            if bucket not in bucket_sizes:
+                raise googleapiclient.errors.HttpError(mock.Mock(status=403),
+                                                       b'Forbidden')
+            return [{
+                'name': '2019-01-01-v1/person.csv',
+                'updated': '2019-01-01T00:00:00.000Z',
+                'size': '5'
+            }, {
+                'name': '2019-02-01-v1/person.csv',
+                'updated': '2019-02-01T00:00:00.000Z',
+                'size': str(bucket_sizes[bucket])
+            }]
+
+        def process_hpo(hpo_id, bucket_items=None):
+            if hpo_id == 'small':
+                raise main.InternalValidationError('fake error')
+
+        mock_list_bucket.side_effect = list_bucket
+        mock_process_hpo.side_effect = process_hpo
+
+        # a single worker processes the sites in order of submission size
+        summary = main.validate_hpos(['small', 'missing', 'big'], max_workers=1)
+
+        processed = [
+            call_args[0][0] for call_args in mock_process_hpo.call_args_list
+        ]
+        self.assertEqual(processed, ['big', 'small', 'missing'])
+        # listings are reused and a site which cannot be listed lists again
+        self.assertEqual(mock_process_hpo.call_args_list[0][1]['bucket_items'],
+                         list_bucket('big_bucket'))
+        self.assertIsNone(mock_process_hpo.call_args_list[2][1]['bucket_items'])
+        results = {hpo_id: (ok, size) for hpo_id, ok, _, size in summary}
+        self.assertEqual(results, {
+            'big': (True, 1000),
+            'small': (False, 10),
+            'missing': (True, 0)
+        })
+
     def test_extract_date_from_rdr(self):
         rdr_dataset_id = 'rdr20200201'
         bad_rdr_dataset_id = 'ehr2019-02-01'
@@ -512,6 +586,35 @@ class ValidationMainTest(TestCase):
             error_occurred = result.get(report_consts.ERROR_OCCURRED_REPORT_KEY)
             self.assertEqual(error_occurred, True)
 
+        # results of the other metrics are kept if one of them fails
+        def query_rows_partial_error(q):
+            if q == '':
+                raise googleapiclient.errors.HttpError(500, b'bar', 'baz')
+            return []
+
+        with mock.patch.multiple(
+                'validation.main',
+                all_required_files_loaded=all_required_files_loaded,
+                query_rows=query_rows_partial_error,
+                get_duplicate_counts_query=get_duplicate_counts_query,
+                upload_string_to_gcs=upload_string_to_gcs,
+                is_valid_rdr=is_valid_rdr):
+            result = main.generate_metrics(self.hpo_id, self.hpo_bucket,
+                                           self.folder_prefix, summary)
+            self.assertTrue(result[report_consts.ERROR_OCCURRED_REPORT_KEY])
+            self.assertNotIn(report_consts.NONUNIQUE_KEY_METRICS_REPORT_KEY,
+                             result)
+            self.assertIn(report_consts.COMPLETENESS_REPORT_KEY, result)
+            self.assertIn(report_consts.DRUG_CLASS_METRICS_REPORT_KEY, result)
+            latency = result[report_consts.METRIC_LATENCY_REPORT_KEY]
+            self.assertCountEqual(latency, [
+                report_consts.NONUNIQUE_KEY_METRICS_REPORT_KEY,
+                report_consts.DRUG_CLASS_METRICS_REPORT_KEY,
+                report_consts.MISSING_PII_KEY,
+                report_consts.COMPLETENESS_REPORT_KEY,
+                report_consts.LAB_CONCEPT_METRICS_REPORT_KEY
+            ])
+
     @mock.patch('bq_utils.get_hpo_info')
     @mock.patch('validation.main.upload_string_to_gcs')
     def test_html_incorrect_folder_name(self, mock_string_to_file,
@@ -196,5 +196,36 @@ class SQLWrangleTest(unittest.TestCase):
                                        hpo_id='pitt_temple')
         self.assertEqual(r, 'pitt_temple_achilles_results')
 
+    def test_get_command_dependencies(self):
+        commands = [
+            'insert into results (id) select id from person',
+            'insert into results (id) select id from visit',
+            'insert into derived (id) select id from results',
+            'INTO temp_t select id from derived',
+            'insert into heel (id) select id from temp_t',
+            'truncate table temp_t', 'drop table temp_t',
+            'insert into results (id) select id from visit'
+        ]
+        dependencies = sql_wrangle.get_command_dependencies(commands)
+        self.assertEqual(
+            dependencies, {
+                0: set(),
+                1: set(),
+                2: {0, 1},
+                3: {2},
+                4: {3},
+                5: {3, 4},
+                6: {5},
+                7: {2}
+            })
+
+        # a command without a known target table is a barrier
+        commands = [
+            'insert into results (id) select id from person', 'select 1',
+            'insert into results (id) select id from visit'
+        ]
+        dependencies = sql_wrangle.get_command_dependencies(commands)
+        self.assertEqual(dependencies, {0: set(), 1: {0}, 2: {1}})
+
     def tearDown(self):
         pass